@@ -0,0 +1,344 @@
+# batch_eval.py ─────────────────────────────────────────────────────────
+# Offline batch runs of the router and the referee over large corpora, for
+# tuning the catalog without chatting through the UI.
+#
+#   router  – items {id?, text, expected?}; expected is an intervention
+#             name or "none".  Runs pick_intervention (the production path:
+#             lexical gate → semantic router → LLM), or with --llm only
+#             llm_pick_intervention over the whole catalog.
+#   referee – items {id?, intervention, scorecard, expected?}; scorecard is
+#             an object (or its JSON text), expected "close" / "continue".
+#             Runs decide_close (close rules, LLM on fuzzy rules), or with
+#             --llm should_close_intervention on the full referee prompt.
+#
+# Input is CSV or JSON lines (by extension), read lazily; at most
+# --concurrency items are in flight.  Each result is appended to --out as
+# one JSON line as soon as it is ready, and the out file doubles as the
+# checkpoint: a rerun skips ids already answered in it (items that failed
+# are tried again; --fresh starts over).  The file opens with the run's
+# fingerprint (kind, mode, catalog digest, embedder, deployment) and a
+# rerun whose fingerprint differs is refused rather than mixed in.  The
+# summary is computed from the whole out file, latest result per id: a
+# confusion matrix per intervention, the router's "none" rate and items/s
+# for this run.
+#
+#   python batch_eval.py router router-eval.csv --stub
+#   python batch_eval.py referee referee-eval.jsonl --stub --llm
+#   python batch_eval.py router big.jsonl --catalog new.csv --out runs/new.jsonl
+import os, sys, csv, json, time, asyncio, argparse, logging
+from collections import Counter, defaultdict
+from typing import Dict, Iterator, Optional, Set, Callable, Awaitable
+
+from loadtest import pct
+
+# ─────────────── corpus + checkpoint ──────────────────────────────────
+def read_items(path: str) -> Iterator[Dict]:
+    """Items in file order; `id` defaults to the 1-based row number."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = ((json.loads(l) for l in f if l.strip())
+                if path.endswith((".jsonl", ".ndjson")) else csv.DictReader(f))
+        for i, row in enumerate(rows, 1):
+            row["id"] = str(row.get("id") or i)
+            yield row
+
+def _lines(path: str) -> Iterator[Dict]:
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:              # torn last line of a killed run
+                continue
+
+def read_results(path: str) -> Iterator[Dict]:
+    """Result rows, the latest per id (a retried error is superseded)."""
+    latest: Dict[str, Dict] = {}
+    for r in _lines(path):
+        if "id" in r:
+            latest.pop(r["id"], None)
+            latest[r["id"]] = r
+    yield from latest.values()
+
+def fingerprint(path: str) -> Optional[Dict]:
+    """The header a run wrote at the top of `path`, if any."""
+    return next((r["fingerprint"] for r in _lines(path) if "fingerprint" in r), None)
+
+def resume(path: str, fp: Dict) -> Set[str]:
+    """Ids already answered in `path`; a torn last line is cut off first.
+    Writes `fp` as the header of a new file; raises ValueError when the
+    file belongs to a run with another fingerprint."""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"fingerprint": fp}, ensure_ascii=False) + "\n")
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+    was = fingerprint(path)
+    if was != fp:
+        diff = sorted(k for k in set(fp) | set(was or {}) if (was or {}).get(k) != fp.get(k))
+        raise ValueError(f"{path} holds a different run ({', '.join(diff)} differ: "
+                         f"{was} vs {fp}); use --fresh or another --out")
+    return {r["id"] for r in read_results(path) if "error" not in r}
+
+# ─────────────── evaluators ───────────────────────────────────────────
+def _name(row: Optional[Dict]) -> str:
+    return row["name"] if row else "none"
+
+def _via(tr, span: str) -> Optional[str]:
+    return next((s.get("via") for s in tr.spans if s["name"] == span), None)
+
+def router_eval(li, llm_only: bool) -> Callable[[Dict], Awaitable[Dict]]:
+    import telemetry                    # after main() has set TRACE_LOG
+
+    async def run(item: Dict) -> Dict:
+        text = item["text"]
+        if llm_only:
+            row, via = await li.llm_pick_intervention(text), "llm"
+        else:
+            with telemetry.turn("batch", session=f"batch-{item['id']}") as tr:
+                row = await li.pick_intervention(text, li.tag_text(text))
+            via = _via(tr, "router")
+        return {"text": text, "expected": item.get("expected") or None,
+                "pred": _name(row), "via": via}
+    return run
+
+def _label(v) -> Optional[str]:
+    if v in (None, ""):
+        return None
+    if isinstance(v, bool):
+        return "close" if v else "continue"
+    return "close" if str(v).strip().lower() in ("close", "true", "1", "yes") else "continue"
+
+def referee_eval(li, llm_only: bool) -> Callable[[Dict], Awaitable[Dict]]:
+    async def run(item: Dict) -> Dict:
+        scorecard = item["scorecard"]
+        if isinstance(scorecard, str):
+            scorecard = json.loads(scorecard)
+        name = item.get("intervention") or scorecard.get("iv")
+        if llm_only:
+            close, via = await li.should_close_intervention(
+                json.dumps(scorecard, ensure_ascii=False)), "llm"
+        else:
+            row = li.get_intervention(name)
+            if row is None:
+                raise KeyError(f"unknown intervention {name!r}")
+            decision = await li.decide_close(row, scorecard)
+            close, via = decision.close, decision.via
+        return {"intervention": name, "expected": _label(item.get("expected")),
+                "pred": "close" if close else "continue", "via": via}
+    return run
+
+# ─────────────── runner ───────────────────────────────────────────────
+async def run_batch(items: Iterator[Dict], evaluate: Callable[[Dict], Awaitable[Dict]],
+                    out_path: str, done: Set[str], concurrency: int,
+                    progress: int = 0) -> Dict:
+    """Evaluate items not in `done`, `concurrency` at a time, appending to out_path."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)     # bounded read-ahead
+    stats = {"run": 0, "skipped": 0, "errors": 0}
+    lat = []
+    t0 = time.perf_counter()
+
+    async def worker(out) -> None:
+        while (item := await queue.get()) is not None:
+            t = time.perf_counter()
+            try:
+                res = await evaluate(item)
+            except Exception as e:
+                res = {"error": repr(e)}
+                stats["errors"] += 1
+            dt = time.perf_counter() - t
+            lat.append(dt)
+            out.write(json.dumps({"id": item["id"], **res, "ms": round(dt * 1000, 1)},
+                                 ensure_ascii=False) + "\n")
+            stats["run"] += 1
+            if progress and stats["run"] % progress == 0:
+                logging.warning(f"[BATCH] {stats['run']} done, "
+                                f"{stats['run'] / (time.perf_counter() - t0):.1f} items/s")
+
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "a", encoding="utf-8", buffering=1) as out:    # line-buffered
+        workers = [asyncio.create_task(worker(out)) for _ in range(concurrency)]
+        try:
+            for item in items:
+                if item["id"] in done:
+                    stats["skipped"] += 1
+                    continue
+                await queue.put(item)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+    wall = time.perf_counter() - t0
+    return {**stats, "wall_s": round(wall, 2),
+            "items_per_s": round(stats["run"] / wall, 1) if wall else 0.0,
+            "p50_ms": round(pct(lat, 50) * 1000, 1) if lat else None,
+            "p95_ms": round(pct(lat, 95) * 1000, 1) if lat else None}
+
+# ─────────────── summary ──────────────────────────────────────────────
+def _prf(tp: int, fp: int, fn: int) -> Dict:
+    p = tp / (tp + fp) if tp + fp else 0.0
+    r = tp / (tp + fn) if tp + fn else 0.0
+    return {"precision": round(p, 3), "recall": round(r, 3),
+            "f1": round(2 * p * r / (p + r), 3) if p + r else 0.0}
+
+def summarise_router(results: Iterator[Dict]) -> Dict:
+    n = errors = none = labelled = correct = missed = positives = 0
+    pairs: Counter = Counter()                          # (expected, pred)
+    via: Counter = Counter()
+    for r in results:
+        n += 1
+        if "error" in r:
+            errors += 1
+            continue
+        none += r["pred"] == "none"
+        via[r.get("via") or "?"] += 1
+        if r.get("expected"):
+            labelled += 1
+            correct += r["pred"] == r["expected"]
+            pairs[r["expected"], r["pred"]] += 1
+            if r["expected"] != "none":
+                positives += 1
+                missed += r["pred"] == "none"
+    per: Dict[str, Dict] = {}
+    for name in sorted({x for pair in pairs for x in pair} - {"none"}):
+        tp = pairs[name, name]
+        fp = sum(c for (g, p), c in pairs.items() if p == name and g != name)
+        fn = sum(c for (g, p), c in pairs.items() if g == name and p != name)
+        per[name] = {"support": tp + fn, "tp": tp, "fp": fp, "fn": fn, **_prf(tp, fp, fn)}
+    return {"items": n, "errors": errors, "labelled": labelled,
+            "accuracy": round(correct / labelled, 3) if labelled else None,
+            "none_rate": round(none / (n - errors), 3) if n > errors else None,
+            "none_rate_on_labelled": round(missed / positives, 3) if positives else None,
+            "via": dict(via), "per_intervention": per,
+            "confusions": [{"expected": g, "pred": p, "n": c}
+                           for (g, p), c in pairs.most_common() if g != p]}
+
+def summarise_referee(results: Iterator[Dict]) -> Dict:
+    n = errors = closes = labelled = correct = 0
+    cells: Dict[str, Counter] = defaultdict(Counter)    # intervention → tp/fp/fn/tn
+    via: Counter = Counter()
+    for r in results:
+        n += 1
+        if "error" in r:
+            errors += 1
+            continue
+        closes += r["pred"] == "close"
+        via[r.get("via") or "?"] += 1
+        if r.get("expected"):
+            labelled += 1
+            correct += r["pred"] == r["expected"]
+            pos, gold = r["pred"] == "close", r["expected"] == "close"
+            cells[r["intervention"]]["tp" if pos and gold else "fp" if pos else
+                                     "fn" if gold else "tn"] += 1
+    per = {name: {k: c[k] for k in ("tp", "fp", "fn", "tn")}
+           | _prf(c["tp"], c["fp"], c["fn"]) for name, c in sorted(cells.items())}
+    return {"items": n, "errors": errors, "labelled": labelled,
+            "accuracy": round(correct / labelled, 3) if labelled else None,
+            "close_rate": round(closes / (n - errors), 3) if n > errors else None,
+            "via": dict(via), "per_intervention": per}
+
+def show(kind: str, s: Dict, run: Dict) -> None:
+    print(f"\n{kind}: {s['items']} items ({s['labelled']} labelled, {s['errors']} errors) "
+          f"accuracy {s['accuracy']}")
+    if kind == "router":
+        print(f"none rate {s['none_rate']}   missed (none on a labelled intervention) "
+              f"{s['none_rate_on_labelled']}")
+    else:
+        print(f"close rate {s['close_rate']}")
+    print(f"via {s['via']}")
+    cols = ("tp", "fp", "fn") + (("tn",) if kind == "referee" else ())
+    print(f"\n{'intervention':<44}" + "".join(f"{c:>5}" for c in cols)
+          + f"{'prec':>7}{'recall':>7}{'f1':>7}")
+    for name, m in s["per_intervention"].items():
+        print(f"{name[:43]:<44}" + "".join(f"{m[c]:>5}" for c in cols)
+              + f"{m['precision']:>7.2f}{m['recall']:>7.2f}{m['f1']:>7.2f}")
+    for c in s.get("confusions", [])[:10]:
+        print(f"  {c['n']:>3} × {c['expected']} → {c['pred']}")
+    print(f"\nthis run: {run['run']} items ({run['skipped']} resumed) in {run['wall_s']}s "
+          f"→ {run['items_per_s']} items/s, p50 {run['p50_ms']} ms, p95 {run['p95_ms']} ms")
+
+# ─────────────── main ─────────────────────────────────────────────────
+async def main(a) -> int:
+    server = None
+    if a.stub:
+        from stub_openai import StubOpenAI
+        server = await StubOpenAI(a.latency, scripted=True).serve(port=a.port)
+        os.environ.update({
+            "OPENAI_API_BASE": f"http://127.0.0.1:{a.port}", "OPENAI_API_KEY": "stub",
+            "OPENAI_API_VERSION": "2024-06-01", "AZURE_DEPLOYMENT_NAME": "stub",
+        })
+        os.environ.setdefault("ROUTER_EMBEDDER", "hash")     # the stub has no embeddings
+    if a.embedder:
+        os.environ["ROUTER_EMBEDDER"] = a.embedder
+    if a.catalog:
+        os.environ["INTERVENTIONS_CSV"] = os.path.abspath(a.catalog)
+    if a.no_cache:
+        os.environ["LLM_CACHE"] = "0"
+    os.environ.setdefault("TRACE_LOG", "0")                  # one trace per item is noise
+    import llm
+    import load_interventions as li
+
+    import tiers
+
+    stem = os.path.splitext(os.path.basename(a.input))[0]
+    out = a.out or os.path.join("runs", f"{a.kind}-{stem}.jsonl")
+    if a.fresh and os.path.exists(out):
+        os.remove(out)
+    fp = {"kind": a.kind, "mode": "llm" if a.llm else "pipeline",
+          "catalog": li.CATALOG.digest, "embedder": li.ROUTER.embedder.name,
+          "deployment": tiers.tier_for(a.kind).primary}
+    try:
+        try:
+            done = resume(out, fp)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            return 2
+        if a.kind == "router":
+            await li.ROUTER.build()
+        evaluate = (router_eval if a.kind == "router" else referee_eval)(li, a.llm)
+        run = await run_batch(read_items(a.input), evaluate, out, done,
+                              a.concurrency, a.progress)
+    finally:
+        await llm.aclose()
+        if server:
+            server.close()
+
+    summary = (summarise_router if a.kind == "router" else summarise_referee)(read_results(out))
+    summary["run"] = run
+    show(a.kind, summary, run)
+    print(f"results → {out}")
+    if a.summary:
+        with open(a.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    return 0
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("kind", choices=["router", "referee"])
+    ap.add_argument("input", help="CSV or .jsonl corpus")
+    ap.add_argument("--out", help="results JSONL, also the checkpoint "
+                                  "(default runs/<kind>-<input>.jsonl)")
+    ap.add_argument("--fresh", action="store_true", help="discard earlier results in --out")
+    ap.add_argument("--summary", help="write the summary as JSON")
+    ap.add_argument("--concurrency", type=int, default=16, help="items in flight")
+    ap.add_argument("--llm", action="store_true",
+                    help="LLM only: whole-catalog router / full referee prompt")
+    ap.add_argument("--catalog", help="intervention CSV to evaluate (INTERVENTIONS_CSV)")
+    ap.add_argument("--embedder", choices=["hash", "azure"], default=None)
+    ap.add_argument("--no-cache", action="store_true", help="send every call to the model")
+    ap.add_argument("--stub", action="store_true", help="route LLM calls to stub_openai")
+    ap.add_argument("--latency", type=float, default=0.5, help="stub mean latency (s)")
+    ap.add_argument("--port", type=int, default=8903)
+    ap.add_argument("--progress", type=int, default=1000, help="log every N items (0 = off)")
+    ap.add_argument("-v", action="store_true", help="app logs at INFO")
+    a = ap.parse_args()
+    logging.basicConfig(level=logging.INFO if a.v else logging.WARNING)
+    sys.exit(asyncio.run(main(a)))
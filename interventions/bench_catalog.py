@@ -0,0 +1,52 @@
+# bench_catalog.py ──────────────────────────────────────────────────────
+# Import time and RSS of loading the intervention catalog, old vs new.
+# Each variant runs in a fresh interpreter so module caches do not leak.
+#
+#   python bench_catalog.py            # pandas read_csv vs InterventionCatalog
+#   python bench_catalog.py -n 20      # more runs per variant
+import os, sys, json, argparse, subprocess, statistics
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CSV  = os.path.join(HERE, "interventions-test.csv")
+
+_PROBE = """
+import json, time, resource, sys
+sys.path.insert(0, {here!r})
+def rss(): return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+r0, t0 = rss(), time.perf_counter()
+{body}
+t1 = time.perf_counter()
+name = rows[0]["name"]                       # an index / field lookup
+print(json.dumps({{"ms": (t1 - t0) * 1000, "rss_kb": rss() - r0, "peak_kb": rss(), "rows": len(rows)}}))
+"""
+
+VARIANTS = {
+    "pandas (before)": "import pandas as pd\n"
+                       "rows = pd.read_csv({csv!r}).fillna('').to_dict('records')",
+    "catalog (after)": "from catalog import InterventionCatalog\n"
+                       "rows = InterventionCatalog({csv!r}).rows()",
+}
+
+def probe(body: str) -> dict:
+    code = _PROBE.format(here=HERE, body=body.format(csv=CSV))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if out.returncode:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1])
+    return json.loads(out.stdout)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=7)
+    a = ap.parse_args()
+
+    for label, body in VARIANTS.items():
+        try:
+            runs = [probe(body) for _ in range(a.n)]
+        except RuntimeError as e:
+            print(f"{label:16} skipped: {e}")
+            continue
+        ms  = statistics.median(r["ms"] for r in runs)
+        rss = statistics.median(r["rss_kb"] for r in runs)
+        peak = statistics.median(r["peak_kb"] for r in runs)
+        print(f"{label:16} {runs[0]['rows']:>3} rows   load {ms:7.1f} ms   "
+              f"RSS +{rss / 1024:6.1f} MB (peak {peak / 1024:.1f} MB)")
@@ -0,0 +1,89 @@
+# bench_router.py ───────────────────────────────────────────────────────
+# Routing latency and agreement: local semantic router vs the LLM router.
+# Reads a labelled set (text,expected; expected is an intervention name or
+# "none") and reports, per router, accuracy vs labels, p50/p99 latency and
+# how often the hybrid router still needed the LLM, plus how many messages
+# the lexical gate kept away from the router altogether.
+#
+#   python bench_router.py                         # live Azure, hash embedder
+#   python bench_router.py --stub --embedder hash  # fully offline
+import os, sys, csv, time, asyncio, argparse, statistics
+from typing import List, Dict
+
+from loadtest import pct
+
+def _name(row) -> str:
+    return row["name"] if row else "none"
+
+async def _timed(fn, text: str):
+    t0 = time.perf_counter()
+    out = await fn(text)
+    return out, time.perf_counter() - t0
+
+def _summary(label: str, lat: List[float], picks: List[str], gold: List[str]) -> str:
+    acc = sum(p == g for p, g in zip(picks, gold)) / len(gold)
+    return (f"{label:<10} acc {acc:6.1%}   p50 {statistics.median(lat) * 1000:8.2f} ms"
+            f"   p99 {pct(lat, 99) * 1000:8.2f} ms")
+
+async def main(a):
+    server = None
+    if a.stub:
+        from stub_openai import StubOpenAI
+        server = await StubOpenAI(a.latency).serve(port=a.port)
+        os.environ.update({
+            "OPENAI_API_BASE": f"http://127.0.0.1:{a.port}", "OPENAI_API_KEY": "stub",
+            "OPENAI_API_VERSION": "2024-06-01", "AZURE_DEPLOYMENT_NAME": "stub",
+        })
+    if a.embedder:
+        os.environ["ROUTER_EMBEDDER"] = a.embedder
+    import llm
+    import load_interventions as li
+
+    with open(a.labels, newline="", encoding="utf-8") as f:
+        items: List[Dict] = list(csv.DictReader(f))
+    gold = [it["expected"] for it in items]
+
+    await li.ROUTER.build()
+    local, hybrid, remote = ([], []), ([], []), ([], [])
+    ambiguous, gated, wrongly_gated = 0, 0, 0
+    for it in items:
+        skip = not li.LEXICON.tag(it["text"]).signal
+        gated += skip
+        wrongly_gated += skip and it["expected"] != "none"
+        route, dt = await _timed(li.ROUTER.route, it["text"])
+        local[0].append(dt); local[1].append(_name(route.row))
+        ambiguous += route.ambiguous
+        row, dt = await _timed(li.pick_intervention, it["text"])
+        hybrid[0].append(dt); hybrid[1].append(_name(row))
+        row, dt = await _timed(li.llm_pick_intervention, it["text"])
+        remote[0].append(dt); remote[1].append(_name(row))
+
+    agree = sum(h == r for h, r in zip(hybrid[1], remote[1])) / len(items)
+    print(f"{len(items)} utterances, embedder={li.ROUTER.embedder.name}, "
+          f"high={li.ROUTER.high:.2f} low={li.ROUTER.low:.2f}")
+    print(_summary("semantic", *local, gold))
+    print(_summary("hybrid", *hybrid, gold))
+    print(_summary("llm", *remote, gold))
+    print(f"hybrid↔llm agreement {agree:.1%}   LLM fallback rate {ambiguous / len(items):.1%}")
+    print(f"lexical gate skipped {gated / len(items):.1%} of router calls "
+          f"({wrongly_gated} labelled with an intervention)")
+    if a.verbose:
+        for it, s, h, r in zip(items, local[1], hybrid[1], remote[1]):
+            flag = " " if h == it["expected"] else "✗"
+            print(f"{flag} {it['text'][:48]:<48} gold={it['expected']:<32} sem={s:<32} llm={r}")
+
+    await llm.aclose()
+    if server:
+        server.close()
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here); os.chdir(here)                  # --labels is relative
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--labels", default="router-eval.csv")
+    ap.add_argument("--embedder", choices=["hash", "azure"], default=None)
+    ap.add_argument("--stub", action="store_true", help="route LLM calls to stub_openai")
+    ap.add_argument("--latency", type=float, default=0.5, help="stub mean latency (s)")
+    ap.add_argument("--port", type=int, default=8902)
+    ap.add_argument("-v", "--verbose", action="store_true")
+    asyncio.run(main(ap.parse_args()))
@@ -0,0 +1,211 @@
+# catalog.py ────────────────────────────────────────────────────────────
+# Intervention catalog without pandas.
+#
+# • the CSV is parsed once with the stdlib csv module; only the small
+#   fields are kept, each 2 KB `prompt` is remembered as a byte span and
+#   read from disk the first time someone asks for row["prompt"].  A
+#   snapshot keeps its file open, so a file replaced on disk still serves
+#   the old bodies; one rewritten in place is re-read (and reloaded) if the
+#   span no longer holds the same row
+# • name → row index for O(1) lookups
+# • hot reload: the file is stat'ed at most every CATALOG_CHECK_SECS; a
+#   changed mtime/size builds a new snapshot off to the side and swaps it in
+#   with one assignment, so rows already held by a session stay valid.
+#   Inside the event loop the stat and parse run in a worker thread
+#   (arefresh); rows()/get() only schedule that check, they never block.
+import os, io, csv, time, asyncio, hashlib, logging, weakref
+from collections.abc import Mapping
+from typing import List, Dict, Optional, Callable, Iterator, Tuple
+
+CATALOG_CHECK_SECS = float(os.getenv("CATALOG_CHECK_SECS", "2"))
+
+Prepare = Callable[[List["Intervention"], str], Callable[[], None]]
+LAZY_FIELDS = ("prompt",)
+
+class Intervention(Mapping):
+    """Read-only row; behaves like the dict pandas used to hand out."""
+    __slots__ = ("_fields", "_snap", "_idx")
+
+    def __init__(self, fields: Dict[str, str], snap: "_Snapshot", idx: int):
+        self._fields, self._snap, self._idx = fields, snap, idx
+
+    def __getitem__(self, key: str) -> str:
+        if key in LAZY_FIELDS:
+            return self._snap.lazy(self._idx, key)
+        return self._fields[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._fields
+        yield from LAZY_FIELDS
+
+    def __len__(self) -> int:
+        return len(self._fields) + len(LAZY_FIELDS)
+
+    __eq__   = object.__eq__        # identity; never force-load prompts
+    __hash__ = object.__hash__
+
+    def __repr__(self) -> str:
+        return f"<Intervention {self._fields.get('name')!r}>"
+
+
+def _lines(f, digest) -> Iterator[Tuple[int, int, str]]:
+    """(byte offset, end offset, decoded line) for a binary file, BOM stripped."""
+    pos = 0
+    for raw in f:
+        digest.update(raw)
+        line = raw.decode("utf-8-sig" if pos == 0 else "utf-8")
+        yield pos, pos + len(raw), line
+        pos += len(raw)
+
+
+class _Snapshot:
+    def __init__(self, path: str, catalog: "InterventionCatalog"):
+        self.path, self.catalog = path, catalog
+        self.rows: List[Intervention] = []
+        self.spans: List[Tuple[int, int]] = []     # record's byte range in the file
+        self._loaded: Dict[Tuple[int, str], str] = {}
+        digest = hashlib.sha1()
+
+        f = open(path, "rb")            # kept open: lazy fields are read from it
+        try:
+            st = os.fstat(f.fileno())
+            self.stamp = (st.st_mtime_ns, st.st_size)
+            src = _lines(f, digest)
+            state = {"start": 0, "end": 0}
+
+            def feed():                 # remember where each record begins and ends
+                for pos, end, line in src:
+                    if state.get("boundary", True):
+                        state["start"], state["boundary"] = pos, False
+                    state["end"] = end
+                    yield line
+
+            reader = csv.reader(feed())
+            self.header = next(reader)
+            state["boundary"] = True
+            for rec in reader:
+                span = (state["start"], state["end"])
+                state["boundary"] = True
+                if not any(rec):
+                    continue
+                rec += [""] * (len(self.header) - len(rec))
+                fields = {k: v for k, v in zip(self.header, rec) if k not in LAZY_FIELDS}
+                self.spans.append(span)
+                self.rows.append(Intervention(fields, self, len(self.rows)))
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+        weakref.finalize(self, f.close)
+        self.by_name = {r["name"]: r for r in self.rows}
+        self.digest  = digest.hexdigest()[:16]     # content hash, for cache keys
+
+    def lazy(self, idx: int, key: str) -> str:
+        hit = self._loaded.get((idx, key))
+        if hit is not None:
+            return hit
+        start, end = self.spans[idx]
+        raw = os.pread(self._file.fileno(), end - start, start)
+        rec = next(csv.reader(io.StringIO(raw.decode("utf-8", "replace"), newline="")), [])
+        name, at = self.rows[idx]["name"], self.header.index("name")
+        if at >= len(rec) or rec[at] != name:       # rewritten in place since parsing
+            return self._moved(name, key)
+        col = self.header.index(key) if key in self.header else len(rec)
+        value = rec[col] if col < len(rec) else ""
+        self._loaded[(idx, key)] = value
+        return value
+
+    def _moved(self, name: str, key: str) -> str:
+        """The file was rewritten in place and this row's bytes moved: load
+        the current file now and read the field from there."""
+        self.catalog.refresh(force=True)
+        cur = self.catalog._snap.by_name.get(name)
+        if cur is None or cur._snap is self:
+            raise LookupError(f"[CATALOG] {key} of {name!r} is no longer in {self.path}")
+        return cur[key]
+
+
+class InterventionCatalog:
+    def __init__(self, path: str, check_every: float = CATALOG_CHECK_SECS):
+        self.path = path
+        self.check_every = check_every
+        self.version = 1
+        self._listeners: List[Prepare] = []
+        self._snap = _Snapshot(path, self)
+        self._checked = time.monotonic()
+        self._pending: Optional[asyncio.Task] = None     # background arefresh
+
+    def refresh(self, force: bool = False) -> bool:
+        """Swap in a new snapshot if the file changed.  Returns True on reload."""
+        if not self._due(force):
+            return False
+        return self._swap(self._load())
+
+    async def arefresh(self, force: bool = False) -> bool:
+        """refresh() for the event loop: stat and parse in a worker thread,
+        swap and notify listeners back on the loop."""
+        if not self._due(force):
+            return False
+        return self._swap(await asyncio.to_thread(self._load))
+
+    def _due(self, force: bool) -> bool:
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_every:
+            return False
+        self._checked = now
+        return True
+
+    def _load(self) -> Optional[_Snapshot]:
+        try:
+            st = os.stat(self.path)
+            if (st.st_mtime_ns, st.st_size) == self._snap.stamp:
+                return None
+            return _Snapshot(self.path, self)
+        except Exception as e:          # half-written file etc.: keep serving
+            logging.error(f"[CATALOG] reload failed, keeping v{self.version}: {e!r}")
+            return None
+
+    def _swap(self, snap: Optional[_Snapshot]) -> bool:
+        if snap is None or snap.stamp == self._snap.stamp:
+            return False
+        try:                            # everything derived is built before the swap
+            installs = [prepare(snap.rows, snap.digest) for prepare in self._listeners]
+        except Exception as e:
+            logging.error(f"[CATALOG] reload rejected, keeping v{self.version}: {e!r}")
+            return False
+        self._snap = snap
+        self.version += 1
+        logging.info(f"[CATALOG] reloaded {self.path}: v{self.version}, {len(snap.rows)} rows")
+        for install in installs:
+            install()
+        return True
+
+    def _poll(self) -> None:
+        """Check for changes without blocking: in a thread when a loop runs."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:            # scripts: a plain synchronous check
+            self.refresh()
+            return
+        if time.monotonic() - self._checked < self.check_every:
+            return
+        if self._pending is None or self._pending.done():
+            self._pending = loop.create_task(self.arefresh())
+
+    @property
+    def digest(self) -> str:
+        return self._snap.digest
+
+    def on_reload(self, prepare: Prepare) -> None:
+        """`prepare(rows, digest)` builds what depends on a new snapshot and
+        returns the function that installs it.  It runs before the swap: if
+        it raises, the reload is rejected and the old snapshot stays."""
+        self._listeners.append(prepare)
+
+    def rows(self) -> List[Intervention]:
+        self._poll()
+        return self._snap.rows
+
+    def get(self, name: Optional[str]) -> Optional[Intervention]:
+        self._poll()
+        return self._snap.by_name.get(name) if name else None
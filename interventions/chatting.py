@@ -1,45 +1,62 @@
 # coach_chat_memory.py  –  “intervention” session with live retrieval
-import os, asyncio
+import os, time, asyncio
 from typing import Optional, List
 
 import chainlit as cl
-from openai import AzureOpenAI
-from mem0 import MemoryClient
 from dotenv import load_dotenv
 
+from turn_scheduler import run_turn
+from streaming import ReplyStream          # streams via the shared client in llm.py
+from memory_queue import WriteBehindQueue
+from memory_cache import MemoryCache
+from memory_store import make_store
+from prompting import PromptBuilder, Section, load_encoder
+import telemetry
+
 load_dotenv()
 
-# ── Azure OpenAI ────────────────────────────────────────────────
-client = AzureOpenAI(
-    api_key        = os.getenv("OPENAI_API_KEY"),
-    api_version    = os.getenv("OPENAI_API_VERSION"),
-    azure_endpoint = os.getenv("OPENAI_API_BASE"),
+# ── Memory store (MEMORY_BACKEND=mem0|local) ───────────────────
+MEMORY  = make_store()
+USER_ID = os.getenv("COACH_USER_ID", "new1")
+
+def user_id() -> str:
+    """The signed-in Chainlit user, else the demo user."""
+    user = getattr(cl.context.session, "user", None)
+    return getattr(user, "identifier", None) or USER_ID
+
+MEM_CACHE = MemoryCache()                # per-user results, dropped on write
+
+async def mem0_search(query:str, k:int=3, topic:Optional[str]=None,
+                      fresh:bool=False) -> List[str]:
+    uid = user_id()
+
+    async def fetch() -> List[str]:
+        with telemetry.span("mem0.search", k=k, topic=topic, backend=MEMORY.name):
+            return await MEMORY.asearch(query, user_id=uid, top_k=k, topic=topic)
+    return await MEM_CACHE.get(uid, query, k, topic, fetch, fresh=fresh)
+
+MEM0_QUEUE = WriteBehindQueue(
+    lambda uid, messages, meta: MEMORY.add(messages, user_id=uid, metadata=meta),
+    on_flush=MEM_CACHE.invalidate,
 )
-DEPLOYMENT = os.getenv("AZURE_DEPLOYMENT_NAME")
-
-# ── Mem0 client ────────────────────────────────────────────────
-mem0   = MemoryClient(api_key=os.getenv("MEM0_API_KEY"))
-USER_ID = "new1"                       # use a per-user id in production
-
-def mem0_search(query:str, k:int=3, topic:Optional[str]=None) -> List[str]:
-    params = {"top_k":k, "user_id":USER_ID}
-    if topic:
-        params["metadata_filters"] = {"topic":topic}
-    hits = mem0.search(query, **params)             # list[dict]
-    return [hit["memory"] for hit in hits]          # just the strings
-
-async def mem0_add_turn(user:str, assistant:str):
-    """Persist each chat turn so it becomes searchable next turn."""
-    def _add():
-        mem0.add(
-            messages=[
-                {"role":"user",      "content":user},
-                {"role":"assistant", "content":assistant},
-            ],
-            user_id = USER_ID,
-            metadata= {"phase":"coach_session"}
-        )
-    await asyncio.to_thread(_add)
+
+def mem0_add_turn(user:str, assistant:str) -> None:
+    """Queue each chat turn; the write-behind worker batches it into mem0."""
+    MEM0_QUEUE.put(
+        user_id(),
+        [
+            {"role":"user",      "content":user},
+            {"role":"assistant", "content":assistant},
+        ],
+        {"phase":"coach_session"},
+    )
+
+# ── /metrics (next to /healthz) ────────────────────────────────
+telemetry.serve_metrics()
+telemetry.REGISTRY.gauge("coach_mem0_queue_depth", "Turns waiting for mem0.add",
+                         lambda: MEM0_QUEUE.depth)
+telemetry.REGISTRY.gauge("coach_mem_cache_hit_ratio", "mem0 search cache hit ratio",
+                         lambda: MEM_CACHE.stats()["hit_ratio"])
 
 # ── Persona prompt (unchanged, trimmed) ────────────────────────
 from textwrap import dedent
@@ -127,11 +144,20 @@ Users should walk away from interactions feeling:
 You are here to provide what they need (insight, gentle challenges, new perspectives), not just what they want to hear, always delivered with heart, intelligence, and a touch of wit. Every interaction should feel meaningful.
 """)
 
+# ───────────────────────────────────────────────────────────────
+@cl.on_app_startup
+async def warm_up():
+    await asyncio.to_thread(load_encoder)     # may fetch the BPE file; off the loop
+
+@cl.on_app_shutdown
+async def shut_down():
+    await MEM0_QUEUE.drain()                  # turns still queued for mem0
+
 # ───────────────────────────────────────────────────────────────
 @cl.on_chat_start
 async def on_start():
     # grab the single intake-summary memory
-    summaries = mem0_search("summary", k=1, topic="intake_summary")
+    summaries = await mem0_search("summary", k=1, topic="intake_summary", fresh=True)
     user_profile = summaries[0] if summaries else "{}"
 
     cl.user_session.set("static_profile", user_profile)
@@ -140,43 +166,65 @@ async def on_start():
         "How can I support you with your money feelings today?"
     ).send()
 
-# helper to build live system prompt each turn
-def build_system_prompt(static_profile:str, live_memories:List[str]) -> str:
-    live_block = "\n".join(f"- {m}" for m in live_memories) if live_memories else ""
-    return (
-        COACH_PERSONA +
-        "\n\n### USER_PROFILE (do not reveal raw JSON to user)\n" +
-        static_profile +
-        "\n\n### RELEVANT_MEMORIES (paraphrase or lightly quote when helpful)\n" +
-        live_block +
-        "\n\n### GUIDELINES\n"
-        "* Weave prior memories naturally when it is appropriate based on the conversation (e.g., “I remember you once said …”).\n"
-        "* Reference at most one memories per reply; be concise & empathetic.\n"
-        "* Never dump full memory text or JSON; paraphrase.\n"
-        "* Reference youself as a friend, not a therapist or financial advisor.\n"
-    )
+# static guidelines ride in the cached prefix, after the persona
+GUIDELINES = (
+    "### GUIDELINES\n"
+    "* Weave prior memories naturally when it is appropriate based on the conversation (e.g., “I remember you once said …”).\n"
+    "* Reference at most one memories per reply; be concise & empathetic.\n"
+    "* Never dump full memory text or JSON; paraphrase.\n"
+    "* Reference youself as a friend, not a therapist or financial advisor.\n"
+)
+PROMPT = PromptBuilder(COACH_PERSONA + "\n\n" + GUIDELINES)
+
+# helper to build the live prompt each turn: byte-stable prefix first,
+# then the per-user blocks, trimmed to PROMPT_TOKEN_BUDGET
+def build_messages(static_profile:str, live_memories:List[str], user_text:str) -> List[dict]:
+    with telemetry.span("prompt") as sp:
+        messages, report = PROMPT.build(
+            [
+                Section("profile", 70, [static_profile],
+                        header="### USER_PROFILE (do not reveal raw JSON to user)"),
+                Section("memories", 40, live_memories, bullet="- ",
+                        header="### RELEVANT_MEMORIES (paraphrase or lightly quote when helpful)"),
+            ],
+            history=[], user=user_text,
+        )
+        sp["tokens"] = report.tokens["total"]
+    return messages
 
 @cl.on_message
 async def on_message(msg: cl.Message):
-    user_text = msg.content.strip()
+    with telemetry.turn("chatting", session=cl.context.session.id):
+        await _turn(msg)
 
-    # pull top-3 memories that semantically match the user’s new message
-    live_memories = mem0_search(user_text, k=3)
+async def _turn(msg: cl.Message):
+    t0 = time.perf_counter()
+    user_text = msg.content.strip()
 
     # always include the static intake summary
     static_profile = cl.user_session.get("static_profile", "{}")
-    system_prompt  = build_system_prompt(static_profile, live_memories)
 
-    resp = client.chat.completions.create(
-        model=DEPLOYMENT,
-        messages=[
-            {"role":"system","content": system_prompt},
-            {"role":"user",  "content": user_text},
-        ],
-        temperature=0.7,
-    ).choices[0].message.content
+    reply_msg = cl.Message(content="")
+    stream    = ReplyStream(t0=t0)
+
+    async def draft(live_memories: List[str]) -> str:
+        return await stream.run(
+            build_messages(static_profile, live_memories, user_text),
+            temperature=0.7,
+        )
+
+    # pull top-3 memories that semantically match the user’s new message;
+    # only a cached result for this query is a safe enough guess to start
+    # the reply on (last turn's memories almost never match a new query)
+    turn = await run_turn(
+        draft,
+        memories = lambda: mem0_search(user_text, k=3),
+        guess    = MEM_CACHE.peek(user_id(), user_text, 3, None),
+        on_hit   = lambda: stream.attach(reply_msg),
+    )
+    resp = turn.reply
 
-    await cl.Message(resp).send()
+    await reply_msg.send()
 
     # store turn so future queries can reference it
-    await mem0_add_turn(user_text, resp)
+    mem0_add_turn(user_text, resp)
@@ -0,0 +1,275 @@
+# dispatch.py ───────────────────────────────────────────────────────────
+# Admission control for Azure OpenAI calls, shared by every session in the
+# worker.  llm.py asks for a slot before each request:
+#
+#   • budgets   – requests- and tokens-per-minute buckets per deployment
+#                 (LLM_RPM / LLM_TPM each, 0 = no local limit; LLM_LIMITS
+#                 overrides single deployments, e.g. "gpt-4o-mini:2000/400000")
+#                 refilled continuously; a request waits until its estimated
+#                 tokens fit, then is settled with the real usage
+#   • priority  – reply < router < referee; a lower class only runs when no
+#                 higher one is waiting for the same deployment
+#   • fairness  – inside a class, sessions take turns (round robin), so one
+#                 chatty session cannot starve the rest
+#   • back-off  – a 429 pauses the deployment that sent it for its
+#                 retry-after; calls to other deployments (a tier's fallback
+#                 or hedge) keep going
+#
+# Time spent waiting here is reported as coach_llm_queue_seconds, separately
+# from coach_llm_call_seconds (the model itself).
+import os, time, asyncio, logging, statistics
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Deque, Optional, AsyncIterator, Tuple
+
+import telemetry
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "32"))   # in-flight calls
+LLM_RPM         = int(os.getenv("LLM_RPM", "0"))            # requests / minute
+LLM_TPM         = int(os.getenv("LLM_TPM", "0"))            # tokens / minute
+
+PRIORITY = {"reply": 0, "router": 1, "embed": 1, "referee": 2}
+
+QUEUE_SECONDS = telemetry.REGISTRY.histogram(
+    "coach_llm_queue_seconds", "Wait for an LLM slot (admission)", ("priority",))
+CALL_SECONDS  = telemetry.REGISTRY.histogram(
+    "coach_llm_call_seconds", "LLM request time once admitted", ("priority",))
+THROTTLED     = telemetry.REGISTRY.counter(
+    "coach_llm_throttled_total", "Rate-limit responses from Azure", ("priority",))
+
+
+class Bucket:
+    """Per-minute budget, refilled continuously; may go negative on settle."""
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level    = float(per_minute)
+        self.rate     = per_minute / 60.0
+        self._t       = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._t) * self.rate)
+        self._t = now
+
+    def wait(self, n: float) -> float:
+        """Seconds until `n` fits (0 = now).  Oversized asks wait for a full bucket."""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        need = min(n, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def take(self, n: float) -> None:
+        if self.capacity:
+            self._refill()
+            self.level -= n
+
+
+def _limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    out = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, lim = item.partition(":")
+        rpm, _, tpm = lim.partition("/")
+        out[name.strip()] = (int(rpm or 0), int(tpm or 0))
+    return out
+
+LLM_LIMITS = _limits(os.getenv("LLM_LIMITS", ""))   # deployment → (rpm, tpm)
+
+
+class Budget:
+    """One deployment's RPM / TPM buckets and its 429 pause."""
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm, self.tpm = Bucket(rpm), Bucket(tpm)
+        self.paused_until = 0.0
+
+    def wait(self, tokens: int) -> float:
+        return max(self.paused_until - time.monotonic(),
+                   self.rpm.wait(1), self.tpm.wait(tokens))
+
+    def take(self, tokens: int) -> None:
+        self.rpm.take(1)
+        self.tpm.take(tokens)
+
+    def stats(self) -> Dict:
+        return {"rpm_left": round(self.rpm.level) if self.rpm.capacity else None,
+                "tpm_left": round(self.tpm.level) if self.tpm.capacity else None,
+                "paused_s": round(max(self.paused_until - time.monotonic(), 0.0), 1)}
+
+
+class Lease:
+    __slots__ = ("priority", "session", "tokens", "deployment", "queued", "admitted", "fut")
+
+    def __init__(self, priority: str, session: str, tokens: int, deployment: str = ""):
+        self.priority, self.session, self.tokens = priority, session, tokens
+        self.deployment = deployment
+        self.queued   = time.monotonic()
+        self.admitted = 0.0
+        self.fut: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    @property
+    def queue_ms(self) -> float:
+        return ((self.admitted or time.monotonic()) - self.queued) * 1000
+
+
+class Dispatcher:
+    def __init__(self, concurrency: int = LLM_CONCURRENCY,
+                 rpm: int = LLM_RPM, tpm: int = LLM_TPM,
+                 limits: Optional[Dict[str, Tuple[int, int]]] = None):
+        self.concurrency = concurrency
+        self.rpm, self.tpm = rpm, tpm           # per deployment, unless in `limits`
+        self.limits = LLM_LIMITS if limits is None else limits
+        self._budgets: Dict[str, Budget] = {}
+        # priority → session → waiting leases; sessions rotate to the back
+        self._queues: Dict[int, "OrderedDict[str, Deque[Lease]]"] = {}
+        self._running = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.counters = {"admitted": 0, "throttled": 0, "shed": 0}
+        self._waits: Deque[float] = deque(maxlen=1024)      # recent queue ms
+
+    # ─── caller side ──────────────────────────────────────────────────
+    @asynccontextmanager
+    async def slot(self, priority: str = "reply", tokens: int = 0,
+                   timeout: Optional[float] = None,
+                   deployment: Optional[str] = None) -> AsyncIterator[Lease]:
+        """Hold one admitted request to `deployment`.  `timeout` bounds the
+        queue wait only."""
+        lease = await self.acquire(priority, tokens, timeout, deployment)
+        t = time.perf_counter()
+        try:
+            yield lease
+        finally:
+            CALL_SECONDS.observe(time.perf_counter() - t, priority=priority)
+            self.release()
+
+    async def acquire(self, priority: str, tokens: int = 0,
+                      timeout: Optional[float] = None,
+                      deployment: Optional[str] = None) -> Lease:
+        lease = Lease(priority, telemetry.session_id() or "", tokens, deployment or "")
+        sessions = self._queues.setdefault(PRIORITY.get(priority, 0), OrderedDict())
+        sessions.setdefault(lease.session, deque()).append(lease)
+        self._pump()
+        try:
+            await asyncio.wait_for(asyncio.shield(lease.fut), timeout)
+        except BaseException as e:
+            if lease.fut.done() and not lease.fut.cancelled():
+                self.release()          # admitted while we were giving up
+            else:
+                lease.fut.cancel()
+                self._drop(lease)
+            if isinstance(e, asyncio.TimeoutError):
+                self.counters["shed"] += 1
+            raise
+        QUEUE_SECONDS.observe(lease.queue_ms / 1000, priority=priority)
+        telemetry.annotate(queue_ms=round(lease.queue_ms, 1))
+        return lease
+
+    def release(self) -> None:
+        self._running -= 1
+        self._pump()
+
+    def settle(self, lease: Lease, actual_tokens: int) -> None:
+        """Correct the token budget once the real usage is known."""
+        self.budget(lease.deployment).tpm.take(actual_tokens - lease.tokens)
+
+    def throttled(self, priority: str, retry_after: float,
+                  deployment: Optional[str] = None) -> None:
+        """Azure said 429: nothing starts on `deployment` for `retry_after` seconds."""
+        self.counters["throttled"] += 1
+        THROTTLED.inc(priority=priority)
+        b = self.budget(deployment)
+        b.paused_until = max(b.paused_until, time.monotonic() + retry_after)
+        logging.warning(f"[DISPATCH] 429 on {priority} ({deployment or 'default'}), "
+                        f"pausing it {retry_after:.1f}s")
+
+    def budget(self, deployment: Optional[str]) -> Budget:
+        b = self._budgets.get(deployment or "")
+        if b is None:
+            rpm, tpm = self.limits.get(deployment or "", (self.rpm, self.tpm))
+            b = self._budgets[deployment or ""] = Budget(rpm, tpm)
+        return b
+
+    @property
+    def depth(self) -> int:
+        return sum(len(q) for s in self._queues.values() for q in s.values())
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    # ─── scheduler ────────────────────────────────────────────────────
+    def _drop(self, lease: Lease) -> None:
+        sessions = self._queues.get(PRIORITY.get(lease.priority, 0), {})
+        q = sessions.get(lease.session)
+        if q and lease in q:
+            q.remove(lease)
+            if not q:
+                del sessions[lease.session]
+
+    def _next(self) -> Tuple[Optional[Lease], float]:
+        """The first waiting lease whose deployment can take it now, in
+        priority / round-robin order, else (None, seconds until one can).
+        A lease that must wait holds back later ones for its deployment
+        only, so a paused deployment does not stall the others."""
+        blocked: Dict[str, float] = {}
+        for prio in sorted(self._queues):
+            sessions = self._queues[prio]
+            for sid in [sid for sid, q in sessions.items() if not q]:
+                del sessions[sid]
+            for q in sessions.values():
+                for lease in q:
+                    if lease.deployment in blocked:
+                        continue
+                    wait = self.budget(lease.deployment).wait(lease.tokens)
+                    if wait <= 0:
+                        return lease, 0.0
+                    blocked[lease.deployment] = wait
+        return None, min(blocked.values(), default=0.0)
+
+    def _pop(self, lease: Lease) -> None:
+        sessions = self._queues[PRIORITY.get(lease.priority, 0)]
+        q = sessions.pop(lease.session)
+        q.remove(lease)
+        if q:
+            sessions[lease.session] = q         # back of the line for this session
+
+    def _pump(self) -> None:
+        while self._running < self.concurrency:
+            lease, wait = self._next()
+            if lease is None:
+                if wait > 0:                    # everyone waits for budget
+                    self._wake_in(wait)
+                return
+            self._pop(lease)
+            self.budget(lease.deployment).take(lease.tokens)
+            self._running += 1
+            self.counters["admitted"] += 1
+            lease.admitted = time.monotonic()
+            self._waits.append(lease.queue_ms)
+            lease.fut.set_result(lease)
+
+    def _wake_in(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer and not self._timer.cancelled() and self._timer.when() <= when:
+            return
+        if self._timer:
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._pump()
+
+    def stats(self) -> Dict:
+        waits = sorted(self._waits) or [0.0]
+        return {**self.counters, "queued": self.depth, "running": self._running,
+                "queue_ms_p50": round(statistics.median(waits), 1),
+                "queue_ms_p95": round(waits[int(0.95 * (len(waits) - 1))], 1),
+                "budgets": {dep or "default": b.stats() for dep, b in self._budgets.items()}}
+
+
+DISPATCH = Dispatcher()
+telemetry.REGISTRY.gauge("coach_llm_queue_depth", "LLM requests waiting for a slot",
+                         lambda: DISPATCH.depth)
+telemetry.REGISTRY.gauge("coach_llm_in_flight", "LLM requests running",
+                         lambda: DISPATCH.running)
@@ -1,13 +1,21 @@
 # interv.py ─────────────────────────────────────────────────────────────
-import os, asyncio, json, logging, hashlib
+import os, time, asyncio, logging, hashlib
 from typing import List, Dict, Optional
 
 import chainlit as cl
-from openai import AzureOpenAI
-from mem0 import MemoryClient
 from dotenv import load_dotenv
 
-from load_interventions import pick_intervention, should_close_intervention
+from load_interventions import (pick_intervention, decide_close, get_intervention,
+                                tag_text, warm_router)
+from turn_scheduler import run_turn
+from streaming import ReplyStream
+from lexicon import WRAP_UP
+from memory_queue import WriteBehindQueue
+from memory_cache import MemoryCache
+from memory_store import make_store
+from prompting import PromptBuilder, Section, load_encoder
+from session_state import SessionStore, SessionState, Turn
+import telemetry
 
 # ─────────────────────────── env / log ────────────────────────────────
 load_dotenv()
@@ -15,7 +23,7 @@ logging.basicConfig(level=logging.INFO)
 
 # ─────────────── constants ────────────────────────────────────────────
 HISTORY_WINDOW = 5          # how many user/assistant pairs to re-send
-NOTES_SENT     = "notes_sent"
+WRAP_UP_KEYS   = WRAP_UP     # matched while the reply streams
 
 # ---------- STYLE BLOCK promoted to top-level system message ----------
 STYLE_RULES = """
@@ -38,62 +46,89 @@ PERSONA = (
     "Never reveal any <COACH_NOTES>."
 )
 
+PROMPT = PromptBuilder(STYLE_RULES + PERSONA)
+
 # ─────────────── helpers ──────────────────────────────────────────────
 def hash_q(txt: str) -> str:
     return hashlib.sha1(txt.lower().strip().encode()).hexdigest()[:10]
 
-def is_repeat_question(resp: str, hist: List[Dict]) -> bool:
+def is_repeat_question(resp: str, hist: List[Turn]) -> bool:
     if not resp.strip().endswith("?"):
         return False
     h = hash_q(resp)
     for turn in reversed(hist):
-        if turn["role"] == "assistant" and turn["tags"].get("question"):
-            return h == hash_q(turn["text"])
+        if turn.role == "assistant" and turn.tag("question"):
+            return h == hash_q(turn.text)
     return False
 
-def log_mode() -> None:
-    mode = cl.user_session.get("mode")
-    iv   = cl.user_session.get("current_iv")
-    logging.info(f"[MODE] {mode.upper()} {( '('+iv['name']+')' ) if iv else ''}")
+def log_mode(state: SessionState) -> None:
+    iv = state.iv_name
+    logging.info(f"[MODE] {state.mode.upper()} {( '('+iv+')' ) if iv else ''}")
+    telemetry.MODE_CHANGES.inc(mode=state.mode)
+    telemetry.event("mode", mode=state.mode, intervention=iv)
+
+# ─────────────── session state (survives restarts with SESSION_BACKEND=sqlite)
+SESSIONS = SessionStore()
+
+def session_key() -> str:
+    return cl.context.session.thread_id or cl.context.session.id
+
+# ─────────────── memory store (MEMORY_BACKEND=mem0|local; OpenAI lives in llm.py)
+MEMORY  = make_store()
+USER_ID = os.getenv("COACH_USER_ID", "rich-kid-demo")
+
+def user_id() -> str:
+    """The signed-in Chainlit user, else the demo user."""
+    user = getattr(cl.context.session, "user", None)
+    return getattr(user, "identifier", None) or USER_ID
+
+MEM_CACHE = MemoryCache()
+
+async def mem0_search(q: str, k: int = 3, topic: Optional[str] = None, fresh: bool = False):
+    uid = user_id()
+
+    async def fetch():
+        with telemetry.span("mem0.search", k=k, topic=topic, backend=MEMORY.name):
+            return await MEMORY.asearch(q, user_id=uid, top_k=k, topic=topic)
+    return await MEM_CACHE.get(uid, q, k, topic, fetch, fresh=fresh)
 
-# ─────────────── OpenAI & Mem0 clients ────────────────────────────────
-client = AzureOpenAI(
-    api_key        = os.getenv("OPENAI_API_KEY"),
-    api_version    = os.getenv("OPENAI_API_VERSION"),
-    azure_endpoint = os.getenv("OPENAI_API_BASE"),
+# turns are written behind the reply, batched per user
+MEM0_QUEUE = WriteBehindQueue(
+    lambda uid, messages, meta: MEMORY.add(messages, user_id=uid, metadata=meta),
+    on_flush=MEM_CACHE.invalidate,
 )
-DEPLOYMENT = os.getenv("AZURE_DEPLOYMENT_NAME")
-
-mem0   = MemoryClient(api_key=os.getenv("MEM0_API_KEY"))
-USER_ID = "rich-kid-demo"
-
-def mem0_search(q: str, k: int = 3, topic: Optional[str] = None):
-    p = {"top_k": k, "user_id": USER_ID}
-    if topic:
-        p["metadata_filters"] = {"topic": topic}
-    return [h["memory"] for h in mem0.search(q, **p)]
-
-async def mem0_add_turn(u: str, a: str):
-    await asyncio.to_thread(
-        lambda: mem0.add(
-            messages=[{"role": "user", "content": u},
-                      {"role": "assistant", "content": a}],
-            user_id=USER_ID,
-            metadata={"phase": "coach_session"}
-        )
-    )
+
+def mem0_add_turn(u: str, a: str) -> None:
+    MEM0_QUEUE.put(user_id(),
+                   [{"role": "user", "content": u},
+                    {"role": "assistant", "content": a}],
+                   {"phase": "coach_session"})
+
+# ─────────────── /metrics (next to /healthz) ──────────────────────────
+telemetry.serve_metrics()
+telemetry.REGISTRY.gauge("coach_mem0_queue_depth", "Turns waiting for mem0.add",
+                         lambda: MEM0_QUEUE.depth)
+telemetry.REGISTRY.gauge("coach_mem_cache_hit_ratio", "mem0 search cache hit ratio",
+                         lambda: MEM_CACHE.stats()["hit_ratio"])
+
+# ─────────────── app start: router index + tokenizer before the first message
+@cl.on_app_startup
+async def warm_up():
+    await asyncio.gather(warm_router(), asyncio.to_thread(load_encoder))
+
+# ─────────────── app stop: write out the turns still queued for mem0
+@cl.on_app_shutdown
+async def shut_down():
+    await MEM0_QUEUE.drain()
 
 # ─────────────── chat start ───────────────────────────────────────────
 @cl.on_chat_start
 async def chat_start():
-    profile = mem0_search("summary", 1, "intake_summary")
-    cl.user_session.set("static_profile", profile[0] if profile else "{}")
-    cl.user_session.set("mode", "normal")
-    cl.user_session.set("current_iv", None)
-    cl.user_session.set("iv_turns", 0)
-    cl.user_session.set("hist", [])          # annotated history
-    cl.user_session.set(NOTES_SENT, False)   # did we inject notes?
-    log_mode()
+    profile = await mem0_search("summary", 1, "intake_summary", fresh=True)
+    state = await SESSIONS.load(session_key())
+    state.static_profile = profile[0] if profile else "{}"
+    await SESSIONS.save(state)
+    log_mode(state)
     await cl.Message(
         "👋 Welcome back! How can I support you with your money feelings today?"
     ).send()
@@ -101,108 +136,155 @@ async def chat_start():
 # ─────────────── main turn ────────────────────────────────────────────
 @cl.on_message
 async def on_msg(msg: cl.Message):
+    with telemetry.turn("interv", session=session_key()):
+        await _turn(msg)
+
+async def _turn(msg: cl.Message):
+    t0        = time.perf_counter()
     user_text = msg.content.strip()
-    mode      = cl.user_session.get("mode")
-    iv_row    = cl.user_session.get("current_iv")
-    hist: List[Dict] = cl.user_session.get("hist") or []
+    with telemetry.span("session.load"):
+        state = await SESSIONS.load(session_key())
+    mode      = state.mode
+    iv_row    = get_intervention(state.iv_name)
+    hist      = state.turns                     # annotated recent turns
+    keep      = HISTORY_WINDOW*2
+
+    # a catalog reload dropped or renamed the running intervention
+    if mode == "intervention" and iv_row is None:
+        logging.warning(f"[CATALOG] intervention {state.iv_name!r} is gone; ending it")
+        state.end_iv()
+        log_mode(state)
+        mode = state.mode
+        await cl.Message("That exercise is no longer available, so let’s carry on.").send()
 
     # user aborts an intervention
     if user_text.lower() in {"stop", "skip", "quit"} and mode == "intervention":
-        cl.user_session.set("mode", "normal")
-        cl.user_session.set("current_iv", None)
-        cl.user_session.set("iv_turns", 0)
-        cl.user_session.set(NOTES_SENT, False)
-        log_mode()
+        state.end_iv()
+        await SESSIONS.save(state)
+        log_mode(state)
         await cl.Message("Exercise paused. Anything else on your mind?").send()
         return
 
-    # log USER turn
-    hist.append({
-        "role": "user",
-        "text": user_text,
-        "tags": {
-            "accept": int(any(w in user_text.lower() for w in ("thanks", "got it", "makes sense"))),
-            "bail":   int(any(w in user_text.lower() for w in ("stop", "skip", "quit"))),
-            "emotion": "anxious" if "anxious" in user_text.lower() else None
-        }
-    })
+    # log USER turn; one lexical pass gives the tags and the router gate
+    with telemetry.span("tag"):
+        tags = tag_text(user_text)
+    state.add(Turn.tagged(
+        "user", user_text,
+        emotion = tags.emotion,
+        accept  = tags.accept,
+        bail    = tags.bail,
+    ), keep)
+    hist = state.turns
+
+    # ─── build messages for GPT ───────────────────────────
+    def build_messages(iv: Optional[Dict]) -> List[Dict]:
+        sections = []
+
+        # inject COACH_NOTES once per intervention (retried while unreadable)
+        if iv and not state.notes_sent:
+            try:
+                notes = iv["prompt"]
+            except LookupError as e:    # dropped from the catalog mid-turn
+                logging.warning(f"{e}; replying without coach notes")
+                notes = ""
+            if notes.strip():
+                sections.append(Section(
+                    "coach_notes", 90, [f"<COACH_NOTES>\n{notes}\n</COACH_NOTES>"]
+                ))
+                state.notes_sent = True
+
+        # older turns survive only as the rolling summary
+        if state.summary:
+            sections.append(Section("summary", 45, [state.summary],
+                                    header="### EARLIER IN THIS CONVERSATION"))
+
+        # rolling window of dialogue context, then the current user message;
+        # PROMPT keeps STYLE_RULES + PERSONA as the byte-stable first message
+        window = [{"role": turn.role, "content": turn.text}
+                  for turn in hist[-keep:]]
+        with telemetry.span("prompt") as sp:
+            messages, report = PROMPT.build(sections, window, user_text)
+            sp["tokens"] = report.tokens["total"]
+        return messages
+
+    # replies stream into one message; tags are matched while streaming
+    reply_msg = cl.Message(content="")
+
+    def stream_for(iv: Optional[Dict], live=None, stage="reply") -> ReplyStream:
+        keys = WRAP_UP_KEYS + (((iv or {}).get("completion_indicator") or ""),)
+        return ReplyStream(keys, msg=live, t0=t0, stage=stage)
+
+    draft_stream = stream_for(iv_row, stage="reply.draft")
+    streams = {"draft": draft_stream}
+
+    async def draft(_mems: List[str]) -> str:
+        return await draft_stream.run(build_messages(iv_row), temperature=0.7)
 
     # maybe start an intervention
-    if mode == "normal":
-        iv_try = pick_intervention(user_text)
-        if iv_try:
-            cl.user_session.set("mode", "intervention")
-            cl.user_session.set("current_iv", iv_try)
-            cl.user_session.set("iv_turns", 0)
-            cl.user_session.set(NOTES_SENT, False)
-            iv_row = iv_try
-            log_mode()
-            await cl.Message(f"💡 Let’s try **{iv_try['name']}**.").send()
+    async def start_iv(iv_try: Dict, _mems: List[str]) -> str:
+        state.start_iv(iv_try["name"])
+        log_mode(state)
+        await cl.Message(f"💡 Let’s try **{iv_try['name']}**.").send()
+        streams["iv"] = stream_for(iv_try, live=reply_msg, stage="reply.iv")
+        return await streams["iv"].run(build_messages(iv_try), temperature=0.7)
 
-    # ─── build messages for GPT ───────────────────────────
-    messages = [{"role": "system", "content": STYLE_RULES + PERSONA}]
-
-    # inject COACH_NOTES once per intervention
-    if iv_row and not cl.user_session.get(NOTES_SENT):
-        messages.append({
-            "role": "system",
-            "content": f"<COACH_NOTES>\n{iv_row['prompt']}\n</COACH_NOTES>"
-        })
-        cl.user_session.set(NOTES_SENT, True)
-
-    # add rolling window of dialogue context
-    for turn in hist[-HISTORY_WINDOW*2:]:
-        messages.append({"role": turn["role"], "content": turn["text"]})
-
-    # current user message
-    messages.append({"role": "user", "content": user_text})
-
-    # ask GPT
-    reply = client.chat.completions.create(
-        model=DEPLOYMENT,
-        messages=messages,
-        temperature=0.7
-    ).choices[0].message.content
-    await cl.Message(reply).send()
+    # router and the speculative plain reply run side by side; the draft
+    # goes on screen as soon as the router says "none"
+    turn = await run_turn(
+        draft,
+        route   = (lambda: pick_intervention(user_text, tags)) if mode == "normal" else None,
+        with_iv = start_iv,
+        on_hit  = lambda: draft_stream.attach(reply_msg),
+    )
+    reply  = turn.reply
+    iv_row = turn.iv or iv_row
+    stream = streams["iv"] if turn.iv else draft_stream
+    await reply_msg.send()
 
     # log assistant turn
-    hist.append({
-        "role": "assistant",
-        "text": reply,
-        "tags": {
-            "wrap_up":  int(any(k in reply.lower() for k in ("✅", "great work", "completes the exercise"))),
-            "question": int(reply.strip().endswith("?")),
-            "repeated": int(is_repeat_question(reply, hist))
-        }
-    })
-    cl.user_session.set("hist", hist[-50:])
-
-    # async save to Mem0
-    await mem0_add_turn(user_text, reply)
-
-    # intervention bookkeeping
-    if cl.user_session.get("mode") == "intervention":
-        cl.user_session.set("iv_turns", cl.user_session.get("iv_turns") + 1)
+    state.add(Turn.tagged(
+        "assistant", reply,
+        wrap_up  = stream.scan.any(WRAP_UP_KEYS),
+        question = reply.strip().endswith("?"),
+        repeated = is_repeat_question(reply, hist),
+    ), keep)
+    hist = state.turns
+
+    # queue the turn for Mem0 (flushed in the background)
+    mem0_add_turn(user_text, reply)
+
+    # intervention bookkeeping; the state is saved once it is final, so the
+    # iv_turns increment reaches a shared (sqlite) session store
+    closed = False
+    if state.mode == "intervention":
+        state.iv_turns += 1
         indicator = (iv_row.get("completion_indicator", "") or "").lower()
-        done_by_indicator = indicator and indicator in reply.lower()
+        done_by_indicator = indicator and stream.scan.any([indicator])
 
         done_by_referee = False
         if not done_by_indicator:
-            scorecard = json.dumps({
+            scorecard = {
                 "iv": iv_row["name"],
-                "turns": cl.user_session.get("iv_turns"),
-                "assistant": {"wrap_up": hist[-1]["tags"]["wrap_up"]},
-                "user": {"accepts": hist[-2]["tags"]["accept"],
-                         "bails":   hist[-2]["tags"]["bail"]}
-            }, ensure_ascii=False)
-            done_by_referee = should_close_intervention(scorecard)
+                "turns": state.iv_turns,
+                "assistant": {"wrap_up": hist[-1].tag("wrap_up")},
+                "user": {"accepts": hist[-2].tag("accept"),
+                         "bails":   hist[-2].tag("bail")}
+            }
+            decision = await decide_close(iv_row, scorecard)
+            done_by_referee = decision.close
+            logging.info(f"[REFEREE] {decision.via}: "
+                         f"{'close' if decision.close else 'continue'} ({decision.reason})")
 
+        if done_by_indicator:
+            telemetry.REFEREE_CLOSES.inc(intervention=iv_row["name"], via="indicator")
         if done_by_indicator or done_by_referee:
-            cl.user_session.set("mode", "normal")
-            cl.user_session.set("current_iv", None)
-            cl.user_session.set("iv_turns", 0)
-            cl.user_session.set(NOTES_SENT, False)
-            log_mode()
-            await cl.Message(
-                "✅ Great work—that completes the exercise. Anything else feel helpful?"
-            ).send()
+            state.end_iv()
+            closed = True
+
+    with telemetry.span("session.save"):
+        await SESSIONS.save(state)
+    if closed:
+        log_mode(state)
+        await cl.Message(
+            "✅ Great work—that completes the exercise. Anything else feel helpful?"
+        ).send()
@@ -0,0 +1,179 @@
+# lexicon.py ────────────────────────────────────────────────────────────
+# Lexical turn tagger.  Every phrase the coach reacts to — accept / bail /
+# wrap-up words, an emotion lexicon, greetings and acknowledgements, and
+# the "Phrases it listens for" of every catalog row — goes into one
+# Aho–Corasick automaton, so a message is tagged in a single pass however
+# many phrases there are.  Matches must sit on word boundaries ("stop" is
+# not found in "nonstop").
+#
+# `Tags.signal` gates the router: a message made only of greetings and
+# acknowledgements ("hi", "ok thanks", "sounds good") with no trigger
+# phrase and no emotion never reaches the semantic or LLM router.
+#
+#   python lexicon.py "ok thanks"  "I'm anxious about money"
+import re, sys
+from collections import deque
+from typing import List, Dict, Tuple, Optional, Iterable, Iterator, NamedTuple
+
+ACCEPT  = ("thanks", "thank you", "got it", "makes sense")
+BAIL    = ("stop", "skip", "quit")
+WRAP_UP = ("✅", "great work", "completes the exercise")
+
+# greetings / acknowledgements / small talk: alone, they carry no routing signal
+FILLER = (
+    "hi", "hello", "hey", "hiya", "yo", "hi there", "hey there", "hello there",
+    "how are you", "how's it going", "good morning", "good afternoon",
+    "good evening", "morning", "ok", "okay", "k", "kk", "sure", "yes", "yeah",
+    "yep", "yup", "no", "nope", "nah", "cool", "nice", "great", "awesome",
+    "perfect", "fine", "alright", "all right", "right", "sounds good", "i see",
+    "will do", "thx", "ty", "cheers", "bye", "goodbye", "see you", "talk later",
+    "later", "lol", "haha", "hmm", "oh", "ah", "wow", "please", "sorry",
+    "you too", "me too", "that's it",
+)
+
+EMOTIONS: Dict[str, Tuple[str, ...]] = {
+    "anxious":     ("anxious", "anxiety", "worried", "worry", "nervous", "panic",
+                    "panicking", "stressed", "stress", "on edge", "scared", "afraid",
+                    "dread", "freaking out"),
+    "ashamed":     ("ashamed", "shame", "embarrassed", "humiliated", "like a failure",
+                    "worthless", "unworthy"),
+    "guilty":      ("guilty", "guilt", "regret", "buyer's remorse"),
+    "sad":         ("sad", "down", "depressed", "hopeless", "miserable", "lonely"),
+    "angry":       ("angry", "mad", "furious", "frustrated", "resentful", "annoyed"),
+    "overwhelmed": ("overwhelmed", "too much", "drowning", "can't cope", "burned out"),
+    "envious":     ("jealous", "envious", "envy", "left behind", "behind everyone"),
+    "hopeful":     ("hopeful", "excited", "proud", "motivated", "relieved"),
+}
+
+# ─────────────── catalog text helpers ─────────────────────────────────
+_LISTENS_FOR = re.compile(
+    r"(?:Phrases it listens for|[Kk]eywords[\w ]*|Looks for keywords)\s*:\s*(.+?)\.(?:\s|$)"
+)
+_QUOTED = re.compile(r"(?:“|â€œ)(.+?)(?:”|â€\x9d)")      # not â€™ (apostrophe)
+
+def listens_for(description: str) -> List[str]:
+    """Trigger phrases a row advertises: its keyword list plus quoted examples."""
+    out: List[str] = []
+    m = _LISTENS_FOR.search(description)
+    if m:
+        out += [p.strip() for p in m.group(1).split(",") if p.strip()]
+    out += [q.strip(" ,.") for q in _QUOTED.findall(description)]
+    return [p for p in out if p]
+
+def normalise(text: str) -> str:
+    """Lower-case and fold the curly / mis-decoded apostrophes in the CSV."""
+    return (text.lower().replace("â€™", "'").replace("’", "'")
+            .replace("â€œ", '"').replace("â€\x9d", '"').replace("“", '"').replace("”", '"'))
+
+# ─────────────── automaton ────────────────────────────────────────────
+class Automaton:
+    """Aho–Corasick over normalised phrases; labels are arbitrary tuples."""
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out:  List[List[Tuple[int, tuple]]] = [[]]    # (phrase length, label)
+
+    def add(self, phrase: str, label: tuple) -> None:
+        phrase = normalise(phrase).strip()
+        if not phrase:
+            return
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = self._goto[node][ch] = len(self._goto)
+                self._goto.append({}); self._fail.append(0); self._out.append([])
+            node = nxt
+        if (len(phrase), label) not in self._out[node]:
+            self._out[node].append((len(phrase), label))
+
+    def build(self) -> "Automaton":
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                if node:
+                    f = self._fail[node]
+                    while f and ch not in self._goto[f]:
+                        f = self._fail[f]
+                    self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        return self
+
+    def scan(self, text: str) -> Iterator[Tuple[int, int, tuple]]:
+        """(start, end, label) for every whole-word match in normalised `text`."""
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for n, label in out[node]:
+                s, e = i - n + 1, i + 1
+                if _boundary(text, s, e):
+                    yield s, e, label
+
+def _boundary(text: str, s: int, e: int) -> bool:
+    left  = s == 0 or not text[s].isalnum() or not text[s - 1].isalnum()
+    right = e == len(text) or not text[e - 1].isalnum() or not text[e].isalnum()
+    return left and right
+
+# ─────────────── tagger ───────────────────────────────────────────────
+class Tags(NamedTuple):
+    accept:   bool
+    bail:     bool
+    wrap_up:  bool
+    emotion:  Optional[str]         # first emotion word in the message
+    triggers: Tuple[str, ...]       # intervention names, first hit first
+    signal:   bool                  # False → only greetings / acknowledgements
+
+
+class Lexicon:
+    def __init__(self, rows: Iterable[Dict] = ()):
+        self.ac = Automaton()
+        for kind, words in (("accept", ACCEPT), ("bail", BAIL),
+                            ("wrap_up", WRAP_UP), ("filler", FILLER)):
+            for w in words:
+                self.ac.add(w, (kind, None))
+        for emotion, words in EMOTIONS.items():
+            for w in words:
+                self.ac.add(w, ("emotion", emotion))
+        self.rows = list(rows)
+        for r in self.rows:
+            for p in listens_for(r["description"]):
+                self.ac.add(p, ("trigger", r["name"]))
+        self.ac.build()
+
+    def tag(self, text: str) -> Tags:
+        text = normalise(text)
+        kinds, triggers = set(), {}
+        emotion: Optional[str] = None
+        covered = bytearray(len(text))          # chars inside a filler-ish match
+        for s, e, (kind, value) in self.ac.scan(text):
+            kinds.add(kind)
+            if kind == "emotion" and emotion is None:
+                emotion = value
+            elif kind == "trigger":
+                triggers.setdefault(value, None)
+            elif kind in ("filler", "accept", "bail"):
+                covered[s:e] = b"\x01" * (e - s)
+        bare = all(covered[i] or not ch.isalnum() for i, ch in enumerate(text))
+        return Tags(
+            accept   = "accept" in kinds,
+            bail     = "bail" in kinds,
+            wrap_up  = "wrap_up" in kinds,
+            emotion  = emotion,
+            triggers = tuple(triggers),
+            signal   = bool(triggers) or emotion is not None or not bare,
+        )
+
+
+if __name__ == "__main__":
+    import csv, os
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, "interventions-test.csv"), newline="", encoding="utf-8-sig") as f:
+        lex = Lexicon(csv.DictReader(f))
+    for msg in sys.argv[1:] or ["hi", "ok thanks", "I'm anxious about money",
+                                "Amazon at midnight again", "I can't stop spending"]:
+        print(f"{msg!r:<36} {lex.tag(msg)}")
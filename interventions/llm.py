@@ -0,0 +1,328 @@
+# llm.py ────────────────────────────────────────────────────────────────
+# One async Azure OpenAI client per worker process, shared by every
+# session.  All completions go through `chat()` so the connection pool,
+# per-call timeouts, admission control (dispatch.py) and retries live in
+# exactly one place.
+#
+# Every call names its priority ("reply", "router", "referee", "embed").
+# 429s and transient 5xx / connection errors are retried here: the wait is
+# the server's retry-after (retry-after-ms / retry-after) plus full-jitter
+# exponential backoff.  One timeout covers the whole call: each attempt is
+# sent with only the time left before that deadline.
+#
+# The priority also picks the model tier (tiers.py): router and referee go
+# to the fast deployment, replies to the main one.  A tier with a secondary
+# deployment falls back to it when the primary fails, and chat() may hedge
+# a slow primary with a duplicate request to it.
+import os, time, random, asyncio, logging
+from contextlib import aclosing
+from typing import List, Dict, Optional, AsyncIterator, Callable, Awaitable, TypeVar
+
+import httpx
+import openai
+from openai import AsyncAzureOpenAI
+from dotenv import load_dotenv
+
+import telemetry
+import tiers
+from dispatch import DISPATCH, LLM_CONCURRENCY
+from prompting import count_tokens
+
+load_dotenv()
+
+# ─────────────── limits ───────────────────────────────────────────────
+LLM_TIMEOUT      = float(os.getenv("LLM_TIMEOUT", "30"))     # seconds, main reply
+LLM_POOL_SIZE    = int(os.getenv("LLM_POOL_SIZE", str(LLM_CONCURRENCY)))  # sockets
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+LLM_BACKOFF      = float(os.getenv("LLM_BACKOFF", "0.5"))    # first backoff step (s)
+LLM_BACKOFF_MAX  = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+LLM_EST_COMPLETION = int(os.getenv("LLM_EST_COMPLETION", "256"))  # TPM estimate w/o max_tokens
+
+# ─────────────── shared client ────────────────────────────────────────
+_http = httpx.AsyncClient(
+    limits  = httpx.Limits(max_connections=LLM_POOL_SIZE,
+                           max_keepalive_connections=LLM_POOL_SIZE),
+    timeout = httpx.Timeout(LLM_TIMEOUT, connect=5.0),
+)
+
+client = AsyncAzureOpenAI(
+    api_key        = os.getenv("OPENAI_API_KEY"),
+    api_version    = os.getenv("OPENAI_API_VERSION"),
+    azure_endpoint = os.getenv("OPENAI_API_BASE"),
+    http_client    = _http,
+    max_retries    = int(os.getenv("LLM_MAX_RETRIES", "0")),  # retries happen in _call
+)
+DEPLOYMENT = tiers.DEPLOYMENT
+EMBED_DEPLOYMENT = os.getenv("AZURE_EMBEDDING_DEPLOYMENT")
+
+# ─────────────── retries ──────────────────────────────────────────────
+RETRYABLE = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+# worth another deployment once retries are spent; a 400 would fail there too
+FALLBACK_ON = (openai.APIError, asyncio.TimeoutError)
+
+def _falls_back(e: Exception) -> bool:
+    return isinstance(e, FALLBACK_ON) and not isinstance(e, openai.BadRequestError)
+
+def retry_after(e: Exception) -> Optional[float]:
+    """Server-requested wait in seconds, if the error carries one."""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:                  # HTTP-date form: fall back to backoff
+        pass
+    return None
+
+def backoff(attempt: int, server: Optional[float]) -> float:
+    step = min(LLM_BACKOFF_MAX, LLM_BACKOFF * 2 ** attempt)
+    return (server or 0.0) + random.uniform(0, step)
+
+def _estimate(messages: List[Dict], max_tokens: Optional[int]) -> int:
+    prompt = sum(count_tokens(str(m.get("content", ""))) + 4 for m in messages)
+    return prompt + (max_tokens or LLM_EST_COMPLETION)
+
+def _left(deadline: float) -> float:
+    """Seconds until `deadline`, the timeout of the next attempt; raises
+    TimeoutError once it has passed."""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise asyncio.TimeoutError("LLM deadline reached before the request was sent")
+    return left
+
+def _retry_in(e: Exception, attempt: int, priority: str, deadline: float,
+              deployment: Optional[str] = None) -> float:
+    """Seconds to wait before the next attempt; re-raises `e` when out of
+    attempts or when the wait would run past the caller's deadline."""
+    server = retry_after(e)
+    delay = backoff(attempt, server)
+    if isinstance(e, openai.RateLimitError):
+        DISPATCH.throttled(priority, server if server is not None else delay, deployment)
+    if attempt + 1 >= LLM_MAX_ATTEMPTS or time.monotonic() + delay >= deadline:
+        raise e
+    telemetry.annotate(retries=1)
+    logging.warning(f"[LLM] {priority} {type(e).__name__}, retry {attempt + 1} in {delay:.1f}s")
+    return delay
+
+T = TypeVar("T")
+
+async def _call(priority: str, tokens: int, timeout: float,
+                request: Callable[[object], Awaitable[T]],
+                deployment: Optional[str] = None) -> T:
+    """Run `request(lease)` in a slot admitted for `deployment`, retrying
+    transient failures."""
+    deadline = time.monotonic() + timeout
+    for attempt in range(LLM_MAX_ATTEMPTS):
+        left = deadline - time.monotonic()
+        try:
+            async with DISPATCH.slot(priority, tokens, timeout=max(left, 0.001),
+                                     deployment=deployment) as lease:
+                return await request(lease)
+        except RETRYABLE as e:
+            delay = _retry_in(e, attempt, priority, deadline, deployment)
+        await asyncio.sleep(delay)
+    raise RuntimeError("unreachable")
+
+# ─────────────── tiers: hedging and fallback ──────────────────────────
+async def _tiered(priority: str, tokens: int, prompt: int, timeout: float,
+                  request_on: Callable[[Optional[str]], Callable[[object], Awaitable[T]]]) -> T:
+    """_call on the priority's tier: `request_on(deployment)` builds the request.
+    A primary slower than its p95 is raced against the secondary (within the
+    tier's hedge budget); a primary that fails gets one go on the secondary.
+    `prompt` is the prompt-token estimate charged to a copy cancelled mid-flight."""
+    tier = tiers.tier_for(priority)
+    deadline = time.monotonic() + timeout
+    won = False                         # once a copy answered, the others "lost"
+
+    async def attempt(model: Optional[str]) -> T:
+        t = time.perf_counter()
+        sent = False
+        inner = request_on(model)
+
+        async def request(lease):
+            nonlocal sent
+            sent = True
+            return await inner(lease)
+
+        try:
+            resp = await _call(priority, tokens, max(deadline - time.monotonic(), 0.001),
+                               request, model)
+        except asyncio.CancelledError:
+            tier.record(model, time.perf_counter() - t, "lost" if won else "cancelled",
+                        prompt if sent else 0)
+            raise
+        except Exception:
+            tier.record(model, 0, "error")
+            raise
+        u = getattr(resp, "usage", None)
+        tier.record(model, time.perf_counter() - t, "ok",
+                    u.prompt_tokens if u else 0, u.completion_tokens if u else 0)
+        return resp
+
+    if not tier.secondary:
+        return await attempt(tier.primary)
+
+    tasks = {asyncio.create_task(attempt(tier.primary)): "primary"}
+    hedged = second = False
+    try:
+        after = tier.hedge_after()
+        if after is not None:
+            done, _ = await asyncio.wait(tasks, timeout=min(after, timeout))
+            if not done and tier.may_hedge():
+                hedged = second = True
+                tasks[asyncio.create_task(attempt(tier.secondary))] = "secondary"
+                telemetry.annotate(hedged=1)
+        error: Optional[BaseException] = None
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                which = tasks.pop(task)
+                if task.exception() is None:
+                    won = True
+                    if hedged:
+                        tier.hedged(which)
+                    return task.result()
+                error = error or task.exception()
+            if not tasks and not second and _falls_back(error) \
+                    and time.monotonic() < deadline:
+                second = True
+                tier.fell_back()
+                telemetry.annotate(fallback=1)
+                logging.warning(f"[LLM] {priority} {type(error).__name__} on {tier.primary}, "
+                                f"falling back to {tier.secondary}")
+                tasks[asyncio.create_task(attempt(tier.secondary))] = "secondary"
+        raise error
+    finally:
+        if tier.hedge:
+            tier.raced(hedged)
+        for task in tasks:
+            task.cancel()
+
+# ─────────────── calls ────────────────────────────────────────────────
+async def chat(messages: List[Dict], *,
+               temperature: float = 0.7,
+               max_tokens: Optional[int] = None,
+               timeout: Optional[float] = None,
+               priority: str = "reply") -> str:
+    """Run one chat completion on the priority's tier and return the text."""
+    kw = {"max_tokens": max_tokens} if max_tokens else {}
+    timeout = timeout or LLM_TIMEOUT
+    deadline = time.monotonic() + timeout   # retries and fallback share it
+
+    def request_on(model):
+        async def request(lease):
+            resp = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                timeout=_left(deadline),
+                **kw
+            )
+            if resp.usage:
+                DISPATCH.settle(lease, resp.usage.total_tokens)
+            return resp
+        return request
+
+    tokens = _estimate(messages, max_tokens)
+    resp = await _tiered(priority, tokens, tokens - (max_tokens or LLM_EST_COMPLETION),
+                         timeout, request_on)
+    if resp.usage:
+        telemetry.usage(resp.usage.prompt_tokens, resp.usage.completion_tokens)
+    return resp.choices[0].message.content or ""
+
+async def chat_stream(messages: List[Dict], *,
+                      temperature: float = 0.7,
+                      max_tokens: Optional[int] = None,
+                      timeout: Optional[float] = None,
+                      priority: str = "reply") -> AsyncIterator[str]:
+    """Same as chat() but yields content deltas as they arrive.  Only the
+    request itself is retried (and falls back to the tier's secondary);
+    once tokens flow, errors reach the caller."""
+    timeout = timeout or LLM_TIMEOUT
+    tokens = _estimate(messages, max_tokens)
+    prompt = tokens - (max_tokens or LLM_EST_COMPLETION)
+    deadline = time.monotonic() + timeout
+    tier = tiers.tier_for(priority)
+    models = [tier.primary] + ([tier.secondary] if tier.secondary else [])
+    for i, model in enumerate(models):
+        t = time.perf_counter()
+        parts: List[str] = []
+        try:
+            async with aclosing(_stream(model, messages, temperature, max_tokens,
+                                        priority, tokens, deadline, parts)) as deltas:
+                async for part in deltas:
+                    yield part
+        except (GeneratorExit, asyncio.CancelledError):
+            if parts:                   # abandoned mid-stream: its tokens were billed
+                tier.record(model, time.perf_counter() - t, "cancelled",
+                            prompt, count_tokens("".join(parts)))
+            raise
+        except Exception as e:
+            tier.record(model, 0, "error")
+            if parts or i + 1 == len(models) or not _falls_back(e) \
+                    or time.monotonic() >= deadline:
+                raise
+            tier.fell_back()
+            telemetry.annotate(fallback=1)
+            logging.warning(f"[LLM] {priority} stream {type(e).__name__} on {model}, "
+                            f"falling back to {models[i + 1]}")
+            continue
+        tier.record(model, time.perf_counter() - t, "ok", prompt, count_tokens("".join(parts)))
+        return
+
+async def _stream(model: Optional[str], messages: List[Dict], temperature: float,
+                  max_tokens: Optional[int], priority: str, tokens: int,
+                  deadline: float, parts: List[str]) -> AsyncIterator[str]:
+    """One deployment's stream with retries; deltas are also appended to `parts`.
+    Each attempt gets the time left before `deadline`."""
+    kw = {"max_tokens": max_tokens} if max_tokens else {}
+    for attempt in range(LLM_MAX_ATTEMPTS):
+        async with DISPATCH.slot(priority, tokens, deployment=model,
+                                 timeout=max(deadline - time.monotonic(), 0.001)) as lease:
+            try:
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    timeout=_left(deadline),
+                    stream=True,
+                    **kw
+                )
+            except RETRYABLE as e:
+                delay = _retry_in(e, attempt, priority, deadline, model)
+            else:
+                try:
+                    async for chunk in stream:
+                        # Azure opens with a choice-less content-filter chunk
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            parts.append(chunk.choices[0].delta.content)
+                            yield parts[-1]
+                finally:                # abandoned draft: free the socket and the slot now
+                    await stream.close()
+                DISPATCH.settle(lease, tokens - (max_tokens or LLM_EST_COMPLETION)
+                                + count_tokens("".join(parts)))
+                return
+        await asyncio.sleep(delay)
+
+async def embed(texts: List[str], model: Optional[str] = None,
+                timeout: Optional[float] = None) -> List[List[float]]:
+    """Embed a batch of texts with the embeddings deployment."""
+    timeout = timeout or LLM_TIMEOUT
+    deadline = time.monotonic() + timeout
+
+    model = model or EMBED_DEPLOYMENT
+
+    async def request(_lease):
+        return await client.embeddings.create(
+            model=model,
+            input=texts,
+            timeout=_left(deadline),
+        )
+
+    resp = await _call("embed", sum(count_tokens(t) for t in texts), timeout, request, model)
+    return [d.embedding for d in resp.data]
+
+async def aclose() -> None:
+    await _http.aclose()
+    logging.info("[LLM] connection pool closed")
@@ -0,0 +1,225 @@
+# llm_cache.py ──────────────────────────────────────────────────────────
+# Content-addressed cache for deterministic (temperature 0) completions:
+# the router and the referee.  The key is a hash of
+#
+#     model · sha256(system prompt) · scope · remaining messages · max_tokens
+#
+# so editing _ROUTER_SYS / _REFEREE_SYS, or the catalog (its digest is part
+# of the router scope), simply produces new keys; invalidate(scope) also
+# drops the old generation eagerly.  Two tiers:
+#
+#   • in-process LRU (LLM_CACHE_SIZE entries)
+#   • optional SQLite file (LLM_CACHE_DB), WAL mode, shared by every worker
+#     process on the host; rows older than LLM_CACHE_TTL are ignored/purged
+#
+# Identical concurrent misses share one remote call (singleflight.py).
+# Only answers that pass the caller's `valid` check (default: non-empty) are
+# kept, so a truncated or garbled reply is not replayed for a week.
+# LLM_CACHE=0 turns the cache off (every call goes to the model).
+import os, json, time, sqlite3, asyncio, hashlib, logging, threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Callable, Awaitable
+
+import llm
+import tiers
+import telemetry
+from singleflight import SingleFlight
+
+LLM_CACHE      = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "10000"))
+LLM_CACHE_DB   = os.getenv("LLM_CACHE_DB", "")                      # "" = memory only
+LLM_CACHE_TTL  = float(os.getenv("LLM_CACHE_TTL", "604800"))        # 7 days
+
+LOOKUPS = telemetry.REGISTRY.counter("coach_llm_cache_lookups_total",
+                                     "Cached LLM call lookups", ("scope", "result"))
+
+def prompt_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+def make_key(model: str, messages: List[Dict], scope: str, max_tokens: Optional[int]) -> str:
+    system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+    rest = [(m["role"], m["content"]) for m in messages[1 if system else 0:]]
+    blob = json.dumps([model, prompt_hash(system), scope, rest, max_tokens],
+                      ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _non_empty(value: str) -> bool:
+    return bool(value and value.strip())
+
+
+class _Disk:
+    """SQLite tier; thread-local connections, called via asyncio.to_thread."""
+    def __init__(self, path: str, ttl: float):
+        self.path, self.ttl = path, ttl
+        self._local = threading.local()
+        self._conn().execute("CREATE TABLE IF NOT EXISTS llm_cache ("
+                             "key TEXT PRIMARY KEY, scope TEXT NOT NULL, "
+                             "value TEXT NOT NULL, created REAL NOT NULL)")
+        self.purge()
+
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    def get(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM llm_cache WHERE key=? AND created>=?",
+                                   (key, time.time() - self.ttl)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, scope: str, value: str) -> None:
+        self._conn().execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)",
+                             (key, scope, value, time.time()))
+
+    def drop(self, family: str, keep: str = "") -> int:
+        return self._conn().execute(
+            "DELETE FROM llm_cache WHERE (scope=? OR scope LIKE ?) AND scope!=?",
+            (family, family + ":%", keep)).rowcount
+
+    def purge(self) -> int:
+        return self._conn().execute("DELETE FROM llm_cache WHERE created<?",
+                                    (time.time() - self.ttl,)).rowcount
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = LLM_CACHE_SIZE, db: str = LLM_CACHE_DB,
+                 ttl: float = LLM_CACHE_TTL, enabled: bool = LLM_CACHE):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()    # key → (scope, value)
+        self._flights: SingleFlight[str] = SingleFlight()
+        self._drops: set = set()                                 # disk invalidations running
+        self._disk = _Disk(db, ttl) if (db and enabled) else None
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0,
+                         "coalesced": 0, "evictions": 0, "invalidated": 0, "disk_errors": 0,
+                         "rejected": 0}
+
+    async def get(self, key: str, scope: str, call: Callable[[], Awaitable[str]],
+                  valid: Optional[Callable[[str], bool]] = None) -> str:
+        """Return the cached value for `key`, or run `call()` once and keep
+        the answer if `valid(answer)` holds."""
+        if not self.enabled:
+            return await call()
+        valid = valid or _non_empty
+        family = scope.split(":", 1)[0]
+
+        def cached() -> Optional[str]:
+            hit = self._lru.get(key)
+            if hit is None:
+                return None
+            self._lru.move_to_end(key)
+            self.counters["memory_hits"] += 1
+            LOOKUPS.inc(scope=family, result="memory")
+            return hit[1]
+
+        def coalesced() -> None:
+            self.counters["coalesced"] += 1
+            LOOKUPS.inc(scope=family, result="coalesced")
+
+        async def miss() -> str:
+            value = await self._disk_get(key)
+            if value is not None and valid(value):
+                self.counters["disk_hits"] += 1
+                LOOKUPS.inc(scope=family, result="disk")
+            else:
+                self.counters["misses"] += 1
+                LOOKUPS.inc(scope=family, result="miss")
+                value = await call()
+                if not valid(value):
+                    self.counters["rejected"] += 1
+                    logging.warning(f"[LLM-CACHE] not caching {family} answer {value[:60]!r}")
+                    return value
+                await self._disk_put(key, scope, value)
+            self._store(key, scope, value)
+            return value
+
+        return await self._flights.run(key, cached, miss, coalesced)
+
+    def _store(self, key: str, scope: str, value: str) -> None:
+        self._lru[key] = (scope, value)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    # the disk tier is an optimisation: never fail a call because of it
+    async def _disk_get(self, key: str) -> Optional[str]:
+        if not self._disk:
+            return None
+        try:
+            return await asyncio.to_thread(self._disk.get, key)
+        except sqlite3.Error as e:
+            self.counters["disk_errors"] += 1
+            logging.warning(f"[LLM-CACHE] disk read failed: {e!r}")
+            return None
+
+    async def _disk_put(self, key: str, scope: str, value: str) -> None:
+        if not self._disk:
+            return
+        try:
+            await asyncio.to_thread(self._disk.put, key, scope, value)
+        except sqlite3.Error as e:
+            self.counters["disk_errors"] += 1
+            logging.warning(f"[LLM-CACHE] disk write failed: {e!r}")
+
+    def invalidate(self, family: str, keep: str = "") -> None:
+        """Drop entries of a scope family ("router" …) except scope `keep`.
+        The SQLite rows are deleted in a worker thread when a loop runs."""
+        stale = [k for k, (s, _) in self._lru.items()
+                 if (s == family or s.startswith(family + ":")) and s != keep]
+        for k in stale:
+            del self._lru[k]
+        self._invalidated(family, len(stale))
+        if not self._disk:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:            # scripts: drop the rows right here
+            self._invalidated(family, self._drop_disk(family, keep), "disk ")
+            return
+        task = loop.create_task(self._adrop_disk(family, keep))
+        self._drops.add(task)
+        task.add_done_callback(self._drops.discard)
+
+    async def _adrop_disk(self, family: str, keep: str) -> None:
+        self._invalidated(family, await asyncio.to_thread(self._drop_disk, family, keep), "disk ")
+
+    def _drop_disk(self, family: str, keep: str) -> int:
+        try:
+            return self._disk.drop(family, keep)
+        except sqlite3.Error as e:
+            self.counters["disk_errors"] += 1
+            logging.warning(f"[LLM-CACHE] disk invalidate failed: {e!r}")
+            return 0
+
+    def _invalidated(self, family: str, n: int, where: str = "") -> None:
+        self.counters["invalidated"] += n
+        logging.info(f"[LLM-CACHE] invalidated {n} {where}{family} entries")
+
+    def stats(self) -> Dict:
+        c = self.counters
+        hits = c["memory_hits"] + c["disk_hits"] + c["coalesced"]
+        lookups = hits + c["misses"]
+        return {**c, "entries": len(self._lru), "disk": bool(self._disk),
+                "hit_ratio": hits / lookups if lookups else 0.0}
+
+
+CACHE = ResponseCache()
+telemetry.REGISTRY.gauge("coach_llm_cache_hit_ratio", "Router / referee cache hit ratio",
+                         lambda: CACHE.stats()["hit_ratio"])
+
+async def cached_chat(messages: List[Dict], *, scope: str,
+                      max_tokens: Optional[int] = None,
+                      timeout: Optional[float] = None,
+                      priority: str = "router",
+                      valid: Optional[Callable[[str], bool]] = None) -> str:
+    """llm.chat at temperature 0 behind CACHE; only `valid` answers are kept."""
+    key = make_key(tiers.tier_for(priority).primary or "", messages, scope, max_tokens)
+    return await CACHE.get(key, scope, lambda: llm.chat(
+        messages, temperature=0, max_tokens=max_tokens, timeout=timeout, priority=priority),
+        valid)
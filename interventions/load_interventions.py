@@ -1,49 +1,135 @@
 # load_interventions.py  ────────────────────────────────────────────────
-import os, json, re, textwrap
-from typing import Optional, Dict, List
+import os, json, re, asyncio, textwrap, logging
+from typing import Optional, Dict, List, Callable
 
-import pandas as pd
-from openai import AzureOpenAI
 from dotenv import load_dotenv
 
+import telemetry
+from llm_cache import CACHE, cached_chat
+from semantic_router import SemanticRouter
+from lexicon import Lexicon, Tags
+from referee import Rule, Decision, DEFAULT_RULES, parse_rules, evaluate
+from catalog import InterventionCatalog
+
 load_dotenv()
 
-CSV_PATH = "interventions-test.csv"
-df = pd.read_csv(CSV_PATH).fillna("")
-INTERVENTIONS: List[Dict] = df.to_dict("records")
+ROUTER_TIMEOUT  = float(os.getenv("ROUTER_TIMEOUT", "8"))    # seconds
+REFEREE_TIMEOUT = float(os.getenv("REFEREE_TIMEOUT", "8"))
+LEXICAL_GATE    = os.getenv("LEXICAL_GATE", "1") != "0"     # skip routing small talk
+
+CSV_PATH = os.getenv("INTERVENTIONS_CSV", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "interventions-test.csv"))
+
+# indexed, prompt bodies read on first use, reloaded when the file changes;
+# INTERVENTIONS / _BULLETS / ROUTER / LEXICON / CLOSE_RULES are rebuilt by _on_reload
+CATALOG = InterventionCatalog(CSV_PATH)
+INTERVENTIONS: List[Dict] = CATALOG.rows()
+
+def get_intervention(name: Optional[str]) -> Optional[Dict]:
+    return CATALOG.get(name)
 
 # ╭──────────────────────────────────────────────────────────────────╮
 # │  1)  ROUTER  → chooses which intervention to start              │
 # ╰──────────────────────────────────────────────────────────────────╯
-_client = AzureOpenAI(
-    api_key        = os.getenv("OPENAI_API_KEY"),
-    api_version    = os.getenv("OPENAI_API_VERSION"),
-    azure_endpoint = os.getenv("OPENAI_API_BASE"),
-)
-DEPLOY = os.getenv("AZURE_DEPLOYMENT_NAME")
-
 _ROUTER_SYS = (
     "You are a routing assistant.  Pick the single most relevant "
     "Intervention name for the USER_TEXT or output 'none'. "
     "Respond ONLY with {\"choice\":\"<Name|none>\"}"
 )
-_BULLETS = "\n".join(
-    f"- {row['name']}: {row['description'][:150]}…" for row in INTERVENTIONS
-)
+def _bullets(rows: List[Dict]) -> str:
+    return "\n".join(f"- {row['name']}: {row['description'][:150]}…" for row in rows)
+
+_BULLETS = _bullets(INTERVENTIONS)
+
+# local embedding router; the LLM only sees ambiguous messages.  Its index
+# is built at app startup (warm_router) and again right after each reload.
+ROUTER = SemanticRouter(INTERVENTIONS)
+
+async def warm_router() -> None:
+    """Embed the catalog now, not on the first routed message."""
+    try:
+        await ROUTER.build()
+    except Exception as e:              # embeddings down: route() retries lazily
+        logging.warning(f"[ROUTER] index build failed: {e!r}")
+
+_BUILDS: set = set()                    # background builds (strong refs)
+
+def _build_soon() -> None:
+    try:
+        task = asyncio.get_running_loop().create_task(warm_router())
+    except RuntimeError:                # no loop (scripts): first route() builds it
+        return
+    _BUILDS.add(task)
+    task.add_done_callback(_BUILDS.discard)
+
+# one-pass lexical tagger: turn tags + the catalog's trigger phrases
+LEXICON = Lexicon(INTERVENTIONS)
 
-def pick_intervention(user_text: str) -> Optional[Dict]:
-    prompt = f"USER_TEXT:\n{user_text}\n\nINTERVENTIONS:\n{_BULLETS}"
-    resp = _client.chat.completions.create(
-        model=DEPLOY,
-        messages=[{"role": "system", "content": _ROUTER_SYS},
-                  {"role": "user",   "content": prompt}],
-        temperature=0, max_tokens=20
-    ).choices[0].message.content
+def tag_text(text: str) -> Tags:
+    return LEXICON.tag(text)
+
+async def pick_intervention(user_text: str, tags: Optional[Tags] = None) -> Optional[Dict]:
+    await CATALOG.arefresh()
+    tags = tags or LEXICON.tag(user_text)
+    with telemetry.span("router") as sp:
+        if LEXICAL_GATE and not tags.signal:
+            sp["via"], row = "lexical", None    # greeting / acknowledgement only
+        else:
+            row = await _route(user_text, sp, tags)
+    name = row["name"] if row else "none"
+    telemetry.ROUTER_PICKS.inc(intervention=name, via=sp["via"])
+    telemetry.event("router_pick", intervention=name, via=sp["via"])
+    return row
+
+async def _route(user_text: str, sp: Dict, tags: Tags) -> Optional[Dict]:
+    try:
+        with telemetry.span("router.semantic"):
+            route = await ROUTER.route(user_text)
+    except Exception as e:              # embeddings down → plain LLM router
+        logging.warning(f"[ROUTER] semantic router failed: {e!r}")
+        sp["via"] = "llm_fallback"
+        return await llm_pick_intervention(user_text)
+    sp["score"] = round(route.score, 3)
+    if not route.ambiguous:
+        logging.info(f"[ROUTER] {ROUTER.embedder.name} {route.score:.2f} → "
+                     f"{route.row['name'] if route.row else 'none'}")
+        sp["via"] = ROUTER.embedder.name
+        return route.row
+    # rows whose trigger phrases occur in the message join the shortlist first
+    hinted = [r for r in map(CATALOG.get, tags.triggers) if r is not None]
+    cands = hinted + [r for r in route.candidates if r not in hinted]
+    logging.info(f"[ROUTER] ambiguous {route.score:.2f} → LLM over "
+                 f"{[r['name'] for r in cands]}")
+    sp["via"] = "llm"
+    return await llm_pick_intervention(user_text, cands)
+
+async def llm_pick_intervention(user_text: str,
+                                rows: Optional[List[Dict]] = None) -> Optional[Dict]:
+    """LLM router over `rows` (default: the whole catalog)."""
+    rows = rows or INTERVENTIONS
+    bullets = _BULLETS if rows is INTERVENTIONS else _bullets(rows)
+    prompt = f"USER_TEXT:\n{user_text}\n\nINTERVENTIONS:\n{bullets}"
+    try:
+        with telemetry.span("router.llm", candidates=len(rows)):
+            resp = await cached_chat(
+                [{"role": "system", "content": _ROUTER_SYS},
+                 {"role": "user",   "content": prompt}],
+                scope=f"router:{CATALOG.digest}", max_tokens=20, timeout=ROUTER_TIMEOUT,
+                priority="router", valid=lambda r: _choice(r) is not None
+            )
+    except Exception as e:              # a slow router must not block the reply
+        logging.warning(f"[ROUTER] skipped: {e!r}")
+        return None
+    choice = _choice(resp) or "none"
+    return next((r for r in rows if r["name"] == choice), None)
+
+def _choice(resp: str) -> Optional[str]:
+    """The router's {"choice": …}, or None if the answer does not parse."""
     try:
         choice = json.loads(re.search(r"\{.*}", resp).group(0))["choice"]
     except Exception:
-        choice = "none"
-    return next((r for r in INTERVENTIONS if r["name"] == choice), None)
+        return None
+    return choice if isinstance(choice, str) else None
 
 
 # ╭──────────────────────────────────────────────────────────────────╮
@@ -61,13 +147,85 @@ _REFEREE_SYS = textwrap.dedent("""
     Respond ONLY with {"decision":"close"}  or  {"decision":"continue"}.
 """).strip()
 
-def should_close_intervention(scorecard_json: str) -> bool:
-    resp = _client.chat.completions.create(
-        model=DEPLOY,
-        messages=[
-            {"role": "system", "content": _REFEREE_SYS},
-            {"role": "user",   "content": scorecard_json}
-        ],
-        temperature=0, max_tokens=10
-    ).choices[0].message.content
+_FUZZY_SYS = textwrap.dedent("""
+    You are Conversation-Referee-GPT.
+    You receive a SCORECARD (JSON) that summarises the current intervention.
+
+    End the intervention if ANY of these is true:
+    {rules}
+
+    Respond ONLY with {{"decision":"close"}}  or  {{"decision":"continue"}}.
+""").strip()
+
+_VERDICT = re.compile(r'"(close|continue)"')        # a well-formed referee answer
+
+async def should_close_intervention(scorecard_json: str,
+                                    fuzzy: Optional[List[Rule]] = None) -> bool:
+    """LLM referee: the full _REFEREE_SYS rules, or only the given fuzzy rules."""
+    system = _REFEREE_SYS if not fuzzy else _FUZZY_SYS.format(
+        rules="\n".join(f"  • {r.text}" for r in fuzzy))
+    try:
+        with telemetry.span("referee.llm"):
+            resp = await cached_chat(
+                [{"role": "system", "content": system},
+                 {"role": "user",   "content": scorecard_json}],
+                scope="referee", max_tokens=10, timeout=REFEREE_TIMEOUT,
+                priority="referee", valid=lambda r: _VERDICT.search(r.lower()) is not None
+            )
+    except Exception as e:              # keep the exercise going on failure
+        logging.warning(f"[REFEREE] skipped: {e!r}")
+        return False
     return '"close"' in resp.lower()
+
+
+# ─── local rule engine (referee.py); the LLM only sees fuzzy rules ───
+def _close_rules(row: Dict) -> List[Rule]:
+    spec = (row.get("close_rules") or "").strip()
+    try:
+        if not spec and str(row.get("max_turns") or "").strip():
+            spec = DEFAULT_RULES.replace("turns>9", f"turns>{int(float(row['max_turns']))}")
+        return parse_rules(spec or DEFAULT_RULES)
+    except ValueError as e:
+        logging.error(f"[REFEREE] {row['name']}: {e}; using default rules")
+        return parse_rules(DEFAULT_RULES)
+
+CLOSE_RULES: Dict[str, List[Rule]] = {r["name"]: _close_rules(r) for r in INTERVENTIONS}
+
+async def decide_close(iv_row: Dict, scorecard: Dict) -> Decision:
+    with telemetry.span("referee", intervention=iv_row["name"]) as sp:
+        decision = await _decide(iv_row, scorecard)
+        sp.update(close=decision.close, via=decision.via)
+    if decision.close:
+        telemetry.REFEREE_CLOSES.inc(intervention=iv_row["name"], via=decision.via)
+    telemetry.event("referee", intervention=iv_row["name"], close=decision.close,
+                    via=decision.via, rule=decision.rule)
+    return decision
+
+async def _decide(iv_row: Dict, scorecard: Dict) -> Decision:
+    rules = CLOSE_RULES.get(iv_row["name"]) or _close_rules(iv_row)
+    decision, fuzzy = evaluate(rules, scorecard)
+    if decision:
+        return decision
+    if not fuzzy:
+        return Decision(False, "no close rule matched")
+    closed = await should_close_intervention(json.dumps(scorecard, ensure_ascii=False), fuzzy)
+    names = ", ".join(r.name for r in fuzzy)
+    return Decision(closed, f"LLM referee on fuzzy rules: {names}",
+                    names if closed else None, "llm")
+
+
+# ─── hot reload: build the derived tables before the catalog swaps (a
+# failure keeps the old snapshot), then rebind them in one go ────────
+def _on_reload(rows: List[Dict], digest: str) -> Callable[[], None]:
+    router, lexicon = SemanticRouter(rows, ROUTER.embedder), Lexicon(rows)
+    bullets, rules = _bullets(rows), {r["name"]: _close_rules(r) for r in rows}
+
+    def install() -> None:
+        global INTERVENTIONS, _BULLETS, ROUTER, LEXICON, CLOSE_RULES
+        INTERVENTIONS, _BULLETS, ROUTER, LEXICON, CLOSE_RULES = (
+            rows, bullets, router, lexicon, rules)
+        CACHE.invalidate("router", keep=f"router:{digest}")
+        _build_soon()
+    return install
+
+CATALOG.on_reload(_on_reload)
@@ -0,0 +1,87 @@
+# loadtest.py ───────────────────────────────────────────────────────────
+# Concurrency load test for the async turn pipeline against stub_openai.
+# Each simulated session runs N turns of the worst-case on_msg chain
+# (router → main reply → referee) and we report p50 / p99 turn latency as
+# the number of concurrent sessions grows.  A ticker task measures how late
+# the event loop wakes up, which is what a blocking call would blow up.
+#
+#   python loadtest.py --sessions 1,10,50,100,200,400 --turns 5 --latency 0.5
+import os, sys, time, asyncio, argparse, statistics
+from typing import List
+
+def pct(xs: List[float], p: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))]
+
+async def _loop_lag(stop: asyncio.Event, out: List[float], tick: float = 0.05):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(tick)
+        out.append(time.perf_counter() - t - tick)
+
+async def _session(sid: int, turns: int, lat: List[float]):
+    import llm
+    from load_interventions import pick_intervention, should_close_intervention
+    hist = []
+    for i in range(turns):
+        text = f"session {sid} turn {i}: I'm anxious about money"
+        t0 = time.perf_counter()
+        await pick_intervention(text)
+        msgs = [{"role": "system", "content": "You are a therapeutic money coach."},
+                *hist[-10:], {"role": "user", "content": text}]
+        reply = await llm.chat(msgs, temperature=0.7)
+        await should_close_intervention(
+            f'{{"iv":"stub","turns":{i + 1},"assistant":{{"wrap_up":0}},'
+            f'"user":{{"accepts":0,"bails":0}}}}'
+        )
+        lat.append(time.perf_counter() - t0)
+        hist += [{"role": "user", "content": text},
+                 {"role": "assistant", "content": reply}]
+
+async def run_level(n: int, turns: int):
+    lat, lag, stop = [], [], asyncio.Event()
+    ticker = asyncio.create_task(_loop_lag(stop, lag))
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_session(s, turns, lat) for s in range(n)))
+    wall = time.perf_counter() - t0
+    stop.set(); await ticker
+    return {
+        "sessions": n, "turns": len(lat), "wall_s": wall,
+        "turns_per_s": len(lat) / wall,
+        "p50": statistics.median(lat), "p99": pct(lat, 99),
+        "loop_lag_max": max(lag or [0.0]),
+    }
+
+async def main(a):
+    server = None
+    if not a.base_url:
+        from stub_openai import StubOpenAI
+        server = await StubOpenAI(a.latency, a.jitter).serve(port=a.port)
+        a.base_url = f"http://127.0.0.1:{a.port}"
+    # llm.py reads these at import time, so set them before importing it
+    os.environ.update({
+        "OPENAI_API_BASE": a.base_url, "OPENAI_API_KEY": "stub",
+        "OPENAI_API_VERSION": "2024-06-01", "AZURE_DEPLOYMENT_NAME": "stub",
+        "LLM_MAX_RETRIES": "0",
+    })
+    import llm, load_interventions       # noqa: F401  (warm import before timing)
+
+    print(f"{'sessions':>8} {'turns':>6} {'turns/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'lag ms':>7}")
+    for n in (int(x) for x in a.sessions.split(",")):
+        r = await run_level(n, a.turns)
+        print(f"{r['sessions']:>8} {r['turns']:>6} {r['turns_per_s']:>8.1f} "
+              f"{r['p50'] * 1000:>8.0f} {r['p99'] * 1000:>8.0f} {r['loop_lag_max'] * 1000:>7.1f}")
+    await llm.aclose()
+    if server:
+        server.close()
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", default="1,10,50,100,200,400")
+    ap.add_argument("--turns", type=int, default=5)
+    ap.add_argument("--latency", type=float, default=0.5, help="stub mean latency (s)")
+    ap.add_argument("--jitter", type=float, default=0.2)
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--base-url", default="", help="use an already running stub")
+    asyncio.run(main(ap.parse_args()))
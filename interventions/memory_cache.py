@@ -0,0 +1,122 @@
+# memory_cache.py ───────────────────────────────────────────────────────
+# Per-user cache in front of mem0 search.  Query results are kept in one
+# LRU (MEMCACHE_SIZE entries, MEMCACHE_TTL seconds) keyed by user, normalised
+# query, k and topic.  Nothing outlives the TTL: a chat start asks with
+# fresh=True, so every new session reads the user's current intake profile
+# (and refreshes the cached copy) instead of one pinned for the process.  The
+# write path calls invalidate(user_id, metadata) once a batch is stored and
+# only what that write can change is dropped: unfiltered searches and
+# searches filtered on the written topic.  A coach_session turn therefore
+# leaves the intake profile (topic intake_summary) cached.  Identical
+# concurrent misses share one remote call (singleflight.py).
+import os, re, time, logging
+from collections import OrderedDict
+from typing import List, Dict, Optional, Callable, Awaitable, Tuple
+
+from singleflight import SingleFlight
+
+MEMCACHE_SIZE = int(os.getenv("MEMCACHE_SIZE", "4096"))
+MEMCACHE_TTL  = float(os.getenv("MEMCACHE_TTL", "300"))       # seconds
+
+Key = Tuple[str, str, int, Optional[str]]   # (user_id, query, k, topic)
+ANY = "*"                                   # scope of unfiltered searches
+
+def normalise(q: str) -> str:
+    return re.sub(r"\s+", " ", q.lower()).strip(" .,!?;:'\"")
+
+class MemoryCache:
+    def __init__(self, max_entries: int = MEMCACHE_SIZE, ttl: float = MEMCACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lru: "OrderedDict[Key, Tuple[float, List[str]]]" = OrderedDict()
+        self._by_user: Dict[str, set] = {}       # user_id → cached keys
+        self._flights: SingleFlight[List[str]] = SingleFlight()
+        self._gen: Dict[Tuple[str, str], int] = {}  # (user, topic | ANY) → writes seen
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0,
+                         "invalidations": 0, "evictions": 0, "expired": 0}
+
+    async def get(self, user_id: str, query: str, k: int, topic: Optional[str],
+                  fetch: Callable[[], Awaitable[List[str]]],
+                  fresh: bool = False) -> List[str]:
+        """The cached result, else `fetch()`.  `fresh` skips the cached copy
+        (a concurrent identical fetch is still shared) and replaces it."""
+        key = (user_id, normalise(query), k, topic)
+
+        def cached() -> Optional[List[str]]:
+            hit = None if fresh else self._lru.get(key)
+            if hit is None:
+                return None
+            expires, value = hit
+            if expires > time.monotonic():
+                self._lru.move_to_end(key)
+                self.counters["hits"] += 1
+                return value
+            self._drop(key)
+            self.counters["expired"] += 1
+            return None
+
+        async def miss() -> List[str]:
+            self.counters["misses"] += 1
+            gen = self._gen_of(user_id, topic)
+            try:
+                value = await fetch()
+            finally:
+                self._log()
+            if self._gen_of(user_id, topic) == gen:     # no relevant write meanwhile
+                self._store(key, value, time.monotonic() + self.ttl)
+            return value
+
+        return list(await self._flights.run(key, cached, miss, self._coalesced))
+
+    def _coalesced(self) -> None:
+        self.counters["coalesced"] += 1         # someone is already fetching it
+
+    def _gen_of(self, user_id: str, topic: Optional[str]) -> int:
+        return self._gen.get((user_id, ANY if topic is None else topic), 0)
+
+    def peek(self, user_id: str, query: str, k: int,
+             topic: Optional[str]) -> Optional[List[str]]:
+        """The cached result if one is live, without fetching or counting."""
+        hit = self._lru.get((user_id, normalise(query), k, topic))
+        if hit is None or hit[0] <= time.monotonic():
+            return None
+        return list(hit[1])
+
+    def _store(self, key: Key, value: List[str], expires: float) -> None:
+        self._lru[key] = (expires, list(value))
+        self._lru.move_to_end(key)
+        self._by_user.setdefault(key[0], set()).add(key)
+        while len(self._lru) > self.max_entries:
+            self._drop(next(iter(self._lru)))
+            self.counters["evictions"] += 1
+
+    def _drop(self, key: Key) -> None:
+        self._lru.pop(key, None)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def invalidate(self, user_id: str, metadata: Optional[Dict] = None) -> None:
+        """Call after storing memories with `metadata`: drops the user's
+        unfiltered searches and those filtered on the written topic."""
+        topic = (metadata or {}).get("topic")
+        for scope in {ANY, topic}:
+            self._gen[(user_id, scope)] = self._gen.get((user_id, scope), 0) + 1
+        for key in [k for k in self._by_user.get(user_id, ()) if k[3] is None or k[3] == topic]:
+            self._drop(key)
+        self.counters["invalidations"] += 1
+
+    def stats(self) -> Dict:
+        c = self.counters
+        lookups = c["hits"] + c["misses"] + c["coalesced"]
+        return {**c, "entries": len(self._lru),
+                "hit_ratio": (c["hits"] + c["coalesced"]) / lookups if lookups else 0.0,
+                "saved_round_trips": c["hits"] + c["coalesced"]}
+
+    def _log(self, every: int = 200) -> None:
+        if (self.counters["misses"] + self.counters["hits"]) % every == 0:
+            s = self.stats()
+            logging.info(f"[MEM-CACHE] hit_ratio={s['hit_ratio']:.1%} "
+                         f"saved={s['saved_round_trips']} entries={s['entries']}")
@@ -0,0 +1,185 @@
+# memory_queue.py ───────────────────────────────────────────────────────
+# Write-behind queue for mem0 turn persistence.  Handlers call put() and
+# return at once; a background worker groups pending turns per user into one
+# batched `mem0.add`, flushing when a user has MEM0_BATCH_SIZE turns waiting
+# or the oldest turn is MEM0_FLUSH_SECS old.  Transient failures (timeouts,
+# connection errors, 429, 5xx) are retried with jittered exponential
+# backoff; other errors drop the batch at once.  drain() empties the queue
+# on shutdown (the apps call it from @cl.on_app_shutdown).  Each user's
+# flushes run in their own task, one at a time, so mem0 sees turns in
+# order and a user whose adds keep failing never holds up anyone else.
+import os, time, json, random, asyncio, logging, statistics, weakref
+from collections import defaultdict, deque
+from typing import List, Dict, Callable, Optional, Tuple
+
+import httpx
+
+import telemetry
+
+MEM0_BATCH_SIZE  = int(os.getenv("MEM0_BATCH_SIZE", "8"))      # turns per add
+MEM0_FLUSH_SECS  = float(os.getenv("MEM0_FLUSH_SECS", "2.0"))  # max staleness
+MEM0_MAX_RETRIES = int(os.getenv("MEM0_MAX_RETRIES", "5"))
+
+Key = Tuple[str, str]                   # (user_id, metadata as JSON)
+
+BATCH_TURNS   = telemetry.REGISTRY.histogram(
+    "coach_mem0_batch_turns", "Turns per mem0.add batch", (),
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+FLUSH_SECONDS = telemetry.REGISTRY.histogram(
+    "coach_mem0_flush_seconds", "mem0.add time per batch, retries included", ("outcome",))
+
+def _status(e: BaseException) -> Optional[int]:
+    """HTTP status behind an error from the mem0 client, if there is one."""
+    for x in (e, e.__cause__):
+        code = (getattr(getattr(x, "response", None), "status_code", None)
+                or getattr(x, "status_code", None)
+                or (getattr(x, "debug_info", None) or {}).get("status_code"))
+        if code:
+            return int(code)
+    return None
+
+def transient(e: BaseException) -> bool:
+    """Worth retrying: timeouts, connection errors, 429 and 5xx."""
+    status = _status(e)
+    if status is not None:
+        return status == 429 or status >= 500
+    return (isinstance(e, (TimeoutError, ConnectionError, httpx.TransportError))
+            or type(e).__name__ in ("NetworkError", "RateLimitError"))
+
+class WriteBehindQueue:
+    def __init__(self, add: Callable[[str, List[Dict], Dict], None],
+                 batch_size: int = MEM0_BATCH_SIZE,
+                 flush_secs: float = MEM0_FLUSH_SECS,
+                 max_retries: int = MEM0_MAX_RETRIES,
+                 backoff: float = 0.5,
+                 on_flush: Optional[Callable[[str, Dict], None]] = None):
+        self.add         = add          # blocking add(user_id, messages, metadata)
+        self.batch_size  = batch_size
+        self.flush_secs  = flush_secs
+        self.max_retries = max_retries
+        self.backoff     = backoff
+        self.on_flush    = on_flush     # (user_id, metadata) after a stored batch
+        self._pending: Dict[Key, List[Tuple[float, List[Dict]]]] = defaultdict(list)
+        self._user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = \
+            weakref.WeakValueDictionary()       # gone once no flush holds it
+        self._wake   = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+        self._flushing: Dict[str, asyncio.Task] = {}    # user_id → its flush task
+        self._inflight = 0
+        self._closing  = False
+        self.counters  = {"enqueued": 0, "stored": 0, "batches": 0,
+                          "retries": 0, "dropped": 0}
+        self._batch_sizes: deque = deque(maxlen=256)
+        self._flush_ms:    deque = deque(maxlen=256)
+
+    # ─── producer side ────────────────────────────────────────────────
+    def put(self, user_id: str, messages: List[Dict], metadata: Dict) -> None:
+        key = (user_id, json.dumps(metadata, sort_keys=True))
+        self._pending[key].append((time.monotonic(), messages))
+        self.counters["enqueued"] += 1
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        if len(self._pending[key]) >= self.batch_size:
+            self._wake.set()
+
+    @property
+    def depth(self) -> int:
+        return sum(len(v) for v in self._pending.values())
+
+    # ─── worker ───────────────────────────────────────────────────────
+    def _due(self) -> List[Key]:
+        now = time.monotonic()
+        due = [k for k, items in self._pending.items() if items and (
+            self._closing or len(items) >= self.batch_size
+            or now - items[0][0] >= self.flush_secs)]
+        return sorted(due, key=lambda k: self._pending[k][0][0])   # oldest turn first
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_secs / 2)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            for user_id in dict.fromkeys(k[0] for k in self._due()):
+                if user_id not in self._flushing:       # one task per user at a time
+                    task = asyncio.create_task(self._flush_user(user_id))
+                    self._flushing[user_id] = task
+                    task.add_done_callback(lambda _, u=user_id: self._flushing.pop(u, None))
+            if self._closing and not self.depth and not self._inflight:
+                if self._flushing:
+                    await asyncio.gather(*self._flushing.values(), return_exceptions=True)
+                    continue
+                return
+
+    async def _flush_user(self, user_id: str) -> None:
+        """Flush this user's due batches, oldest first, until none is due."""
+        while due := [k for k in self._due() if k[0] == user_id]:
+            for key in due:
+                await self._flush(key)
+
+    async def _flush(self, key: Key) -> None:
+        user_id = key[0]
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        async with lock:                # FIFO: batches leave in the order they were due
+            await self._flush_locked(key)
+
+    async def _flush_locked(self, key: Key) -> None:
+        user_id, meta = key
+        items = self._pending.pop(key, [])
+        while items:
+            batch, items = items[:self.batch_size], items[self.batch_size:]
+            messages = [m for _, ms in batch for m in ms]
+            self._inflight += len(batch)
+            t = time.perf_counter()
+            ok = await self._send(user_id, messages, json.loads(meta))
+            self._inflight -= len(batch)
+            dt = time.perf_counter() - t
+            self._flush_ms.append(dt * 1000)
+            self._batch_sizes.append(len(batch))
+            FLUSH_SECONDS.observe(dt, outcome="stored" if ok else "dropped")
+            BATCH_TURNS.observe(len(batch))
+            self.counters["batches"] += 1
+            self.counters["stored" if ok else "dropped"] += len(batch)
+            if ok and self.on_flush:
+                self.on_flush(user_id, json.loads(meta))
+
+    async def _send(self, user_id: str, messages: List[Dict], meta: Dict) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with telemetry.span("mem0.add", turns=len(messages) // 2):
+                    await asyncio.to_thread(self.add, user_id, messages, meta)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries or not transient(e):
+                    logging.error(f"[MEM0-Q] dropping {len(messages) // 2} turns "
+                                  f"for {user_id}: {e!r}")
+                    return False
+                self.counters["retries"] += 1
+                delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                logging.warning(f"[MEM0-Q] add failed ({e!r}); retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        return False
+
+    # ─── shutdown / metrics ───────────────────────────────────────────
+    async def drain(self, timeout: float = 30.0) -> None:
+        """Flush everything still pending and stop the worker."""
+        self._closing = True
+        self._wake.set()
+        if self._worker and not self._worker.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self._worker), timeout)
+            except asyncio.TimeoutError:
+                logging.error(f"[MEM0-Q] drain timed out with {self.depth} turns pending")
+        logging.info(f"[MEM0-Q] drained {self.stats()}")
+
+    def stats(self) -> Dict:
+        sizes, lat = list(self._batch_sizes), list(self._flush_ms)
+        return {
+            "depth": self.depth, "inflight": self._inflight, **self.counters,
+            "batch_size_avg": statistics.fmean(sizes) if sizes else 0.0,
+            "flush_ms_p50":   statistics.median(lat) if lat else 0.0,
+            "flush_ms_max":   max(lat) if lat else 0.0,
+        }
@@ -0,0 +1,261 @@
+# memory_store.py ───────────────────────────────────────────────────────
+# Where long-term memories live.  Both apps talk to a MemoryStore:
+#
+#   search(query, user_id=…, top_k=3, topic=None) → [memory text]
+#   add(messages, user_id=…, metadata={…})
+#
+# Both calls block; apps go through asearch() (and the write-behind queue
+# runs add() in a thread).  Backends, picked with MEMORY_BACKEND:
+#
+#   • mem0  – the hosted mem0 MemoryClient (default)
+#   • local – one embedding index per user under MEMORY_DIR: a float32
+#             matrix read through np.memmap (vectors.f32) plus a JSON-lines
+#             metadata sidecar (meta.jsonl).  Search is one matrix-vector
+#             product with a topic mask; no network, so it also serves
+#             tests and benchmarks offline.  Writes are serialised per user
+#             (and across worker processes with flock); searches never wait
+#             for them.
+#
+#   python memory_store.py          # local search latency at 1k / 10k memories
+import os, re, json, time, asyncio, logging, threading
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Callable, Tuple
+
+import numpy as np
+
+try:
+    import fcntl                        # POSIX: serialise appends across processes
+except ImportError:                     # pragma: no cover
+    fcntl = None
+
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "mem0")            # mem0 | local
+MEMORY_DIR     = os.getenv("MEMORY_DIR", "memories")
+MEMORY_DIM     = int(os.getenv("MEMORY_DIM", "256"))              # local hash embeddings
+MEMORY_MAX_CHARS = int(os.getenv("MEMORY_MAX_CHARS", "500"))      # per stored memory
+
+class MemoryStore:
+    name = "base"
+
+    def search(self, query: str, *, user_id: str, top_k: int = 3,
+               topic: Optional[str] = None) -> List[str]:
+        raise NotImplementedError
+
+    def add(self, messages: List[Dict], *, user_id: str,
+            metadata: Optional[Dict] = None) -> None:
+        raise NotImplementedError
+
+    async def asearch(self, query: str, *, user_id: str, top_k: int = 3,
+                      topic: Optional[str] = None) -> List[str]:
+        return await asyncio.to_thread(self.search, query, user_id=user_id,
+                                       top_k=top_k, topic=topic)
+
+# ─────────────── hosted mem0 ──────────────────────────────────────────
+class Mem0Store(MemoryStore):
+    name = "mem0"
+
+    def __init__(self, client=None):
+        if client is None:
+            import mem0                     # looked up at call time (replay swaps it)
+            client = mem0.MemoryClient(api_key=os.getenv("MEM0_API_KEY"))
+        self.client = client
+
+    def search(self, query, *, user_id, top_k=3, topic=None):
+        p = {"top_k": top_k, "user_id": user_id}
+        if topic:
+            p["metadata_filters"] = {"topic": topic}
+        return [h["memory"] for h in self.client.search(query, **p)]
+
+    def add(self, messages, *, user_id, metadata=None):
+        self.client.add(messages=messages, user_id=user_id, metadata=metadata or {})
+
+# ─────────────── local vector index ───────────────────────────────────
+def _safe(user_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", user_id)[:128] or "_"
+
+def _size(path: str) -> int:
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+@contextmanager
+def _flock(path: str):
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+View = Tuple[np.ndarray, np.ndarray, List[str]]     # matrix, topic codes, texts
+
+class _UserIndex:
+    """One user's memories: vectors on disk (memmap), texts + topics in RAM.
+
+    Searches read `view`, which append() replaces with one assignment, so
+    they take no lock.  An append writes the vector rows, then the metadata
+    lines; loading keeps only rows present in both files and cuts off the
+    tail of an append that died half way."""
+    def __init__(self, path: str, dim: int):
+        self.path, self.dim = path, dim
+        os.makedirs(path, exist_ok=True)
+        self.vec_path  = os.path.join(path, "vectors.f32")
+        self.meta_path = os.path.join(path, "meta.jsonl")
+        self.lock_path = os.path.join(path, ".lock")
+        self.row_bytes = 4 * dim
+        self.lock = threading.Lock()                # one writer per user
+        self._topic_ids: Dict[Optional[str], int] = {}    # topic → small int
+        with self.lock, _flock(self.lock_path):
+            self._load()
+
+    def _load(self) -> None:
+        texts, topics, ends = [], [], []
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "rb") as f:
+                pos = 0
+                for raw in f:
+                    pos += len(raw)
+                    if not raw.endswith(b"\n"):
+                        break                   # torn last line
+                    if not raw.strip():
+                        continue
+                    try:
+                        m = json.loads(raw)
+                    except ValueError:
+                        break
+                    texts.append(m["memory"])
+                    topics.append(m.get("metadata", {}).get("topic"))
+                    ends.append(pos)
+        n = min(len(texts), _size(self.vec_path) // self.row_bytes)
+        self._meta_bytes = ends[n - 1] if n else 0
+        for path, size in ((self.vec_path, n * self.row_bytes),
+                           (self.meta_path, self._meta_bytes)):
+            if _size(path) > size:
+                logging.warning(f"[MEMORY] {path}: dropping a partial append")
+                os.truncate(path, size)
+        self.texts = texts[:n]
+        self.view: View = (self._map(n), self._codes(topics[:n]), self.texts)
+
+    def _map(self, n: int) -> np.ndarray:
+        if not n:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(self.vec_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def _codes(self, topics: List[Optional[str]]) -> np.ndarray:
+        ids = self._topic_ids
+        return np.fromiter((ids.setdefault(t, len(ids)) for t in topics),
+                           dtype=np.int32, count=len(topics))
+
+    def append(self, vecs: np.ndarray, rows: List[Dict]) -> None:
+        blob = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+        with self.lock, _flock(self.lock_path):
+            n = len(self.texts)
+            if (_size(self.vec_path) != n * self.row_bytes
+                    or _size(self.meta_path) != self._meta_bytes):
+                self._load()                    # another worker wrote, or a torn append
+            with open(self.vec_path, "ab") as f:
+                f.write(np.ascontiguousarray(vecs, dtype=np.float32).tobytes())
+            with open(self.meta_path, "ab") as f:
+                f.write(blob)
+            self._meta_bytes += len(blob)
+            self.texts += [r["memory"] for r in rows]
+            codes = self._codes([r["metadata"].get("topic") for r in rows])
+            self.view = (self._map(len(self.texts)),
+                         np.concatenate([self.view[1], codes]), self.texts)
+
+    def search(self, q: np.ndarray, top_k: int, topic: Optional[str]) -> List[str]:
+        M, codes, texts = self.view
+        if not len(M):
+            return []
+        scores = M @ q
+        if topic is not None:
+            code = self._topic_ids.get(topic, -1)
+            scores = np.where(codes == code, scores, -np.inf)
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [texts[i] for i in top if np.isfinite(scores[i])]
+
+
+class LocalStore(MemoryStore):
+    name = "local"
+
+    def __init__(self, root: str = MEMORY_DIR,
+                 embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 dim: int = MEMORY_DIM):
+        if embed is None:
+            from semantic_router import HashEmbedder
+            embed = HashEmbedder(dim).embed_now
+        self.root, self.embed, self.dim = root, embed, dim
+        self._users: Dict[str, _UserIndex] = {}
+        self._lock = threading.Lock()       # guards _users; writes lock per user
+
+    def _index(self, user_id: str) -> _UserIndex:
+        idx = self._users.get(user_id)
+        if idx is None:
+            with self._lock:
+                idx = self._users.get(user_id)
+                if idx is None:
+                    idx = self._users[user_id] = _UserIndex(
+                        os.path.join(self.root, _safe(user_id)), self.dim)
+        return idx
+
+    def search(self, query, *, user_id, top_k=3, topic=None):
+        return self._index(user_id).search(self.embed([query])[0], top_k, topic)
+
+    def add(self, messages, *, user_id, metadata=None):
+        meta = dict(metadata or {})
+        rows = [{"memory": m["content"][:MEMORY_MAX_CHARS], "metadata": meta, "created": time.time()}
+                for m in messages if m.get("role") == "user" and m.get("content")]
+        if not rows:
+            return
+        vecs = self.embed([r["memory"] for r in rows])
+        self._index(user_id).append(vecs, rows)
+
+    async def asearch(self, query, *, user_id, top_k=3, topic=None):
+        if user_id not in self._users:      # first use reads the files: not on the loop
+            return await super().asearch(query, user_id=user_id, top_k=top_k, topic=topic)
+        # lock-free and sub-millisecond: a thread hop would cost more than the search
+        return self.search(query, user_id=user_id, top_k=top_k, topic=topic)
+
+
+STORES = {"mem0": Mem0Store, "local": LocalStore}
+
+def make_store(kind: Optional[str] = None) -> MemoryStore:
+    kind = kind or MEMORY_BACKEND
+    store = STORES[kind]()
+    logging.info(f"[MEMORY] backend={store.name}")
+    return store
+
+
+if __name__ == "__main__":
+    import tempfile, statistics
+    with tempfile.TemporaryDirectory() as tmp:
+        store = LocalStore(tmp)
+        words = ("rent budget anxious family savings debt shopping guilt paycheck "
+                 "parents future retire impulse credit envy coffee goals").split()
+        rng = np.random.default_rng(7)
+        total = 0
+        for n in (1_000, 10_000):
+            while total < n:
+                batch = [{"role": "user", "content": " ".join(rng.choice(words, 12))}
+                         for _ in range(500)]
+                store.add(batch, user_id="bench", metadata={"topic": "coach_session"})
+                total += len(batch)
+            store = LocalStore(tmp)             # cold open: memmap from disk
+            lat = []
+            for _ in range(200):
+                t = time.perf_counter()
+                store.search("I get anxious about rent", user_id="bench", top_k=3)
+                lat.append((time.perf_counter() - t) * 1000)
+            after = []                          # the search that follows each add
+            for i in range(50):
+                store.add([{"role": "user", "content": " ".join(rng.choice(words, 12))}],
+                          user_id="bench", metadata={"topic": "coach_session"})
+                t = time.perf_counter()
+                store.search("I get anxious about rent", user_id="bench", top_k=3)
+                after.append((time.perf_counter() - t) * 1000)
+            total += 50
+            print(f"{n:>6} memories: search p50 {statistics.median(lat):.3f} ms, "
+                  f"max {max(lat):.3f} ms; after an add p50 "
+                  f"{statistics.median(after):.3f} ms, max {max(after):.3f} ms")
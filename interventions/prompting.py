@@ -0,0 +1,142 @@
+# prompting.py ──────────────────────────────────────────────────────────
+# Prompt assembly with a token budget.
+#
+#   [0] system  STATIC PREFIX   persona / style / guidelines, byte-identical
+#                               every turn so provider prompt caching hits
+#   [1] system  dynamic blocks  profile, memories, COACH_NOTES … (if any)
+#   [2…] history                rolling window, oldest first
+#   [-1] user                   current message
+#
+# Counts come from the local tokenizer (tiktoken, or ~4 chars/token when it
+# is not installed or its BPE file cannot be fetched).  The encoder loads on
+# first use, not at import; apps warm it off the event loop at startup
+# (load_encoder), and TIKTOKEN_CACHE_DIR keeps it offline.  When the total is over PROMPT_TOKEN_BUDGET the lowest
+# priority block loses units first (a memory bullet, the oldest history
+# turn …); the static prefix and the user message are never trimmed.
+import os, hashlib, logging
+from typing import List, Dict, Optional, NamedTuple, Tuple
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+PROMPT_ENCODING     = os.getenv("PROMPT_ENCODING", "o200k_base")
+HISTORY_PRIORITY    = 50
+_MSG_OVERHEAD       = 4             # role / separators per chat message
+
+_enc = None                         # None = not loaded yet, False = unavailable
+
+def load_encoder():
+    """The tiktoken encoder, loaded once (may download its BPE file)."""
+    global _enc
+    if _enc is None:
+        try:
+            import tiktoken
+            _enc = tiktoken.get_encoding(PROMPT_ENCODING)
+        except Exception as e:      # no tokenizer available: rough estimate
+            logging.warning(f"[PROMPT] tiktoken unavailable ({e!r}); ~4 chars/token")
+            _enc = False
+    return _enc
+
+def count_tokens(text: str) -> int:
+    enc = load_encoder()
+    return len(enc.encode(text, disallowed_special=())) if enc else (len(text) + 3) // 4
+
+def _truncate(text: str, n: int) -> str:
+    enc = load_encoder()
+    if not enc:
+        return text[:max(n, 0) * 4]
+    return enc.decode(enc.encode(text, disallowed_special=())[:max(n, 0)])
+
+
+class Section(NamedTuple):
+    name:     str
+    priority: int                   # higher survives longer
+    units:    List[str]             # trimmed one at a time
+    header:   str = ""
+    bullet:   str = ""              # prefix for each unit ("- ")
+    drop:     str = "tail"          # "tail" | "head" – which end goes first
+
+    def render(self) -> str:
+        body = "\n".join(f"{self.bullet}{u}" for u in self.units)
+        return f"{self.header}\n{body}" if self.header else body
+
+
+class PromptReport(NamedTuple):
+    tokens:      Dict[str, int]     # per section, plus "static", "user", "total"
+    budget:      int
+    trimmed:     Dict[str, int]     # units dropped per section
+    prefix_hash: str                # changes ⇒ provider cache misses
+
+
+class PromptBuilder:
+    def __init__(self, static_prefix: str, budget: int = PROMPT_TOKEN_BUDGET,
+                 history_priority: int = HISTORY_PRIORITY):
+        self.static   = static_prefix
+        self.budget   = budget
+        self.history_priority = history_priority
+        self._static_tokens: Optional[int] = None
+        self.prefix_hash   = hashlib.sha1(static_prefix.encode()).hexdigest()[:10]
+
+    @property
+    def static_tokens(self) -> int:
+        if self._static_tokens is None:
+            self._static_tokens = count_tokens(self.static) + _MSG_OVERHEAD
+        return self._static_tokens
+
+    def build(self, sections: List[Section], history: List[Dict], user: str,
+              budget: Optional[int] = None) -> Tuple[List[Dict], PromptReport]:
+        budget   = budget or self.budget
+        sections = [s._replace(units=list(s.units)) for s in sections if s.units]
+        history  = list(history)
+        trimmed: Dict[str, int] = {}
+        user_tokens = count_tokens(user) + _MSG_OVERHEAD
+
+        # counted once, then only the section / turn a trim pass touches
+        def sec_tokens(s: Section) -> int:
+            return count_tokens(s.render()) + 2
+        sec_cost  = [sec_tokens(s) for s in sections]
+        hist_cost = [count_tokens(t["content"]) + _MSG_OVERHEAD for t in history]
+        def total() -> int:
+            return (self.static_tokens + user_tokens + sum(hist_cost)
+                    + (sum(sec_cost) + _MSG_OVERHEAD if sections else 0))
+
+        over = total() - budget
+        while over > 0:
+            cands = [(s.priority, i) for i, s in enumerate(sections) if s.units]
+            if history:
+                cands.append((self.history_priority, -1))
+            if not cands:
+                break
+            _, i = min(cands)
+            if i == -1:
+                history.pop(0)
+                hist_cost.pop(0)
+                trimmed["history"] = trimmed.get("history", 0) + 1
+            else:
+                s = sections[i]
+                if len(s.units) > 1:
+                    s.units.pop(0 if s.drop == "head" else -1)
+                else:                    # last unit: cut it down, or drop it
+                    keep = count_tokens(s.units[0]) - over
+                    s.units[:] = [_truncate(s.units[0], keep)] if keep > 32 else []
+                trimmed[s.name] = trimmed.get(s.name, 0) + 1
+                if s.units:
+                    sec_cost[i] = sec_tokens(s)
+                else:
+                    del sections[i], sec_cost[i]
+            over = total() - budget
+
+        messages = [{"role": "system", "content": self.static}]
+        if sections:
+            messages.append({"role": "system",
+                             "content": "\n\n".join(s.render() for s in sections)})
+        messages += history
+        messages.append({"role": "user", "content": user})
+
+        tokens = {"static": self.static_tokens,
+                  **{s.name: c for s, c in zip(sections, sec_cost)},
+                  "history": sum(hist_cost), "user": user_tokens}
+        tokens["total"] = total()
+        report = PromptReport(tokens, budget, trimmed, self.prefix_hash)
+        logging.info("[PROMPT] " + " ".join(f"{k}={v}" for k, v in tokens.items())
+                     + f" budget={budget} prefix={self.prefix_hash}"
+                     + (f" trimmed={trimmed}" if trimmed else ""))
+        return messages, report
@@ -0,0 +1,85 @@
+# referee.py ────────────────────────────────────────────────────────────
+# Deterministic close rules for interventions.  A rule set is a short
+# declarative string that can live in the optional `close_rules` CSV column:
+#
+#     wrap_up: assistant.wrap_up>=1 & user.accepts>=1|user.bails>=1 ; failsafe: turns>9
+#
+#   • rules are separated by ";" and the first one that holds closes
+#   • "&" joins terms, "|" joins alternatives inside a term ("|" binds tighter)
+#   • each comparison is  <scorecard.path> <op> <number>,  op ∈ >= > <= < == !=
+#   • a rule named with a leading "~" is FUZZY: its body is plain English and
+#     only that rule is sent to the LLM referee
+#
+# With no column the defaults below mirror _REFEREE_SYS exactly.
+import re
+from typing import List, Dict, Optional, NamedTuple, Tuple
+
+DEFAULT_RULES = ("wrap_up: assistant.wrap_up>=1 & user.accepts>=1|user.bails>=1 ; "
+                 "failsafe: turns>9")
+
+_OPS = {
+    ">=": lambda a, b: a >= b, ">":  lambda a, b: a > b,
+    "<=": lambda a, b: a <= b, "<":  lambda a, b: a < b,
+    "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+}
+_CMP = re.compile(r"^\s*([A-Za-z_][\w.]*)\s*(>=|<=|==|!=|>|<)\s*(-?\d+(?:\.\d+)?)\s*$")
+
+Comparison = Tuple[str, str, float]                 # (path, op, value)
+
+class Rule(NamedTuple):
+    name:  str
+    terms: List[List[Comparison]]                   # AND of ORs; empty if fuzzy
+    fuzzy: bool = False
+    text:  str = ""                                 # original body
+
+class Decision(NamedTuple):
+    close:  bool
+    reason: str
+    rule:   Optional[str] = None
+    via:    str = "rules"                           # "rules" | "llm"
+
+
+def parse_rules(spec: str) -> List[Rule]:
+    """Parse a rule string; raises ValueError with the offending piece."""
+    rules: List[Rule] = []
+    for i, chunk in enumerate(c.strip() for c in (spec or "").split(";")):
+        if not chunk:
+            continue
+        name, _, body = chunk.partition(":") if ":" in chunk else (f"rule{i + 1}", "", chunk)
+        name, body = name.strip(), body.strip()
+        if name.startswith("~"):
+            rules.append(Rule(name[1:].strip(), [], True, body))
+            continue
+        terms = []
+        for term in body.split("&"):
+            alts = []
+            for alt in term.split("|"):
+                m = _CMP.match(alt)
+                if not m:
+                    raise ValueError(f"bad close rule {name!r}: {alt.strip()!r}")
+                alts.append((m.group(1), m.group(2), float(m.group(3))))
+            terms.append(alts)
+        rules.append(Rule(name, terms, False, body))
+    return rules
+
+def _lookup(scorecard: Dict, path: str) -> float:
+    cur = scorecard
+    for key in path.split("."):
+        cur = cur.get(key, 0) if isinstance(cur, dict) else 0
+    try:
+        return float(cur or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def holds(rule: Rule, scorecard: Dict) -> bool:
+    return all(any(_OPS[op](_lookup(scorecard, p), v) for p, op, v in alts)
+               for alts in rule.terms)
+
+def evaluate(rules: List[Rule], scorecard: Dict) -> Tuple[Optional[Decision], List[Rule]]:
+    """Apply the deterministic rules.  Returns (decision, fuzzy_rules):
+    a close decision if one fired, otherwise None plus the fuzzy rules the
+    caller may still hand to the LLM."""
+    for r in rules:
+        if not r.fuzzy and holds(r, scorecard):
+            return Decision(True, f"{r.name}: {r.text}", r.name), []
+    return None, [r for r in rules if r.fuzzy]
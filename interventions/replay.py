@@ -0,0 +1,387 @@
+# replay.py ─────────────────────────────────────────────────────────────
+# Offline replay benchmark for the real Chainlit handlers (interv.on_msg,
+# chatting.on_message) with no Azure or mem0 keys:
+#
+#   • Azure OpenAI → stub_openai (local HTTP, latency / token distributions,
+#                    scripted router / coach / referee answers)
+#   • mem0         → stub_mem0, swapped in for mem0.MemoryClient before the
+#                    app module builds its client at import time, or
+#                    --memory local: the local vector store in a temp dir
+#   • Chainlit     → the app's `cl` is replaced by a small simulated facade
+#                    (Message, context.session, user_session) per session
+#
+# Every intervention in the CSV gets a scripted conversation: trigger →
+# coach turns → "thanks, got it" close (the default `coach` workload).
+# `--workload smalltalk` opens each one with a greeting as well, to measure
+# the lexical router gate; it is its own labelled workload, and a baseline
+# is only compared with a run of the same workload.  N sessions replay them at once and
+# the report shows throughput, per-stage latency percentiles, LLM calls per
+# turn and prompt tokens per turn.  --save / --baseline turn it into a
+# regression gate (exit 1 when a tracked number gets worse than --tolerance).
+#
+#   python replay.py --app interv --sessions 50
+#   python replay.py --dist lognormal --reply-tokens 45 --tpot 0.02 --save base.json
+#   python replay.py --baseline base.json --tolerance 0.15
+#   python replay.py --workload smalltalk      # router calls skipped on greetings
+import os, sys, json, time, random, asyncio, argparse, importlib, logging, tempfile
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import List, Dict, Optional
+
+from loadtest import pct
+
+APPS = {"interv":   ("chat_start", "on_msg"),
+        "chatting": ("on_start",   "on_message")}
+
+COACH_TURNS = ["I'm not sure, maybe it started when I moved out on my own.",
+               "It mostly happens at the end of the month when rent is due.",
+               "I guess I feel like I should already have this figured out.",
+               "My parents never really talked about money at home."]
+CLOSE_TURN  = "Thanks, got it, that makes sense."
+OPENERS     = ["Hi!", "hey there", "Good morning!", "hello"]     # smalltalk workload
+WORKLOADS   = ("coach", "smalltalk")
+
+# ─────────────── per-turn / per-session state ─────────────────────────
+class TurnStats:
+    __slots__ = ("ms", "calls", "prompt_tokens", "t0")
+
+    def __init__(self):
+        self.ms: Dict[str, float] = {}
+        self.calls: Counter = Counter()             # llm calls by kind
+        self.prompt_tokens: Counter = Counter()     # by kind
+        self.t0 = time.perf_counter()
+
+_TURN:    ContextVar[Optional[TurnStats]] = ContextVar("replay_turn", default=None)
+_SESSION: ContextVar["SimSession"]        = ContextVar("replay_session")
+
+def _note(stage: str, ms: float) -> None:
+    turn = _TURN.get()
+    if turn is not None:
+        turn.ms[stage] = turn.ms.get(stage, 0.0) + ms
+
+# ─────────────── simulated Chainlit ───────────────────────────────────
+class SimSession:
+    def __init__(self, sid: str):
+        self.id, self.thread_id = sid, None
+        self.data: Dict = {}
+        self.sent: List[str] = []
+
+class SimMessage:
+    def __init__(self, content: str = "", **_):
+        self.content = content
+
+    async def stream_token(self, token: str) -> None:
+        turn = _TURN.get()
+        if turn is not None and "visible" not in turn.ms:
+            turn.ms["visible"] = (time.perf_counter() - turn.t0) * 1000
+        self.content += token
+
+    async def send(self) -> "SimMessage":
+        _SESSION.get().sent.append(self.content)
+        return self
+
+class _UserSession:
+    def get(self, key: str, default=None):
+        return _SESSION.get().data.get(key, default)
+
+    def set(self, key: str, value) -> None:
+        _SESSION.get().data[key] = value
+
+class _Context:
+    @property
+    def session(self) -> SimSession:
+        return _SESSION.get()
+
+def sim_chainlit() -> SimpleNamespace:
+    return SimpleNamespace(Message=SimMessage, user_session=_UserSession(),
+                           context=_Context())
+
+# ─────────────── wiring ───────────────────────────────────────────────
+def _kind(messages: List[Dict]) -> str:
+    system = messages[0].get("content", "") if messages else ""
+    if "routing assistant" in system:
+        return "router"
+    if "Referee" in system:
+        return "referee"
+    return "reply"
+
+def instrument(app) -> None:
+    """Wrap the seams every turn goes through; nothing in the app changes."""
+    import llm
+    from prompting import count_tokens
+    chat, chat_stream, run_turn = llm.chat, llm.chat_stream, app.run_turn
+
+    def _count(kind: str, messages: List[Dict]) -> None:
+        turn = _TURN.get()
+        if turn is not None:
+            turn.calls[kind] += 1
+            turn.prompt_tokens[kind] += sum(count_tokens(str(m.get("content", ""))) + 4
+                                            for m in messages)
+
+    async def counted_chat(messages, **kw):
+        kind, t = _kind(messages), time.perf_counter()
+        _count(kind, messages)
+        try:
+            return await chat(messages, **kw)
+        finally:
+            _note(f"llm.{kind}", (time.perf_counter() - t) * 1000)
+
+    async def counted_stream(messages, **kw):
+        kind, t, first = _kind(messages), time.perf_counter(), True
+        _count(kind, messages)
+        try:
+            async for tok in chat_stream(messages, **kw):
+                if first:
+                    _note(f"llm.{kind}.ttft", (time.perf_counter() - t) * 1000)
+                    first = False
+                yield tok
+        finally:
+            _note(f"llm.{kind}", (time.perf_counter() - t) * 1000)
+
+    async def timed_turn(*a, **kw):
+        result = await run_turn(*a, **kw)
+        for stage in ("router", "memory", "draft", "reply"):
+            if stage in result.timings:
+                _note(f"turn.{stage}", result.timings[stage])
+        turn = _TURN.get()
+        if turn is not None:
+            turn.calls["speculation_" + result.speculation] += 1
+        return result
+
+    llm.chat, llm.chat_stream, app.run_turn = counted_chat, counted_stream, timed_turn
+
+    if hasattr(app, "decide_close"):
+        decide_close = app.decide_close
+
+        async def timed_close(*a, **kw):
+            t = time.perf_counter()
+            try:
+                return await decide_close(*a, **kw)
+            finally:
+                _note("referee", (time.perf_counter() - t) * 1000)
+        app.decide_close = timed_close
+
+def load_app(name: str, mem0_stub):
+    import mem0
+    mem0.MemoryClient = lambda *a, **kw: mem0_stub     # built at import time
+    app = importlib.import_module(name)
+    app.cl = sim_chainlit()
+    instrument(app)
+    return app
+
+def scripts(rows: List[Dict], coach_turns: int, workload: str = "coach") -> List[List[str]]:
+    from lexicon import listens_for
+    out = []
+    for row in rows:
+        phrase = (listens_for(row["description"]) or [row["name"]])[0]
+        opener = [OPENERS[len(out) % len(OPENERS)]] if workload == "smalltalk" else []
+        out.append([*opener, f"Honestly, {phrase} keeps coming up for me lately.",
+                    *COACH_TURNS[:coach_turns], CLOSE_TURN])
+    return out
+
+# ─────────────── replay ───────────────────────────────────────────────
+async def _session(app, sid: int, script: List[str], start: float, think: float,
+                   out: List[TurnStats], sessions: List[SimSession]):
+    await asyncio.sleep(start)
+    sess = SimSession(f"replay-{sid}")
+    _SESSION.set(sess)
+    sessions.append(sess)
+    on_start, on_msg = (getattr(app, n) for n in APPS[app.__name__])
+    await on_start()
+    for text in script:
+        turn = TurnStats()
+        token = _TURN.set(turn)
+        try:
+            await on_msg(SimMessage(text))
+        finally:
+            turn.ms["turn"] = (time.perf_counter() - turn.t0) * 1000
+            _TURN.reset(token)
+        out.append(turn)
+        if think:
+            await asyncio.sleep(random.uniform(0.5, 1.5) * think)
+
+def report(turns: List[TurnStats], sessions: List[SimSession], wall: float,
+           workload: str, mem0_stub, queue_stats: Optional[Dict],
+           llm_cache_stats: Optional[Dict] = None,
+           router_stats: Optional[Dict] = None,
+           dispatch_stats: Optional[Dict] = None,
+           tier_stats: Optional[Dict] = None) -> Dict:
+    stages: Dict[str, List[float]] = defaultdict(list)
+    calls, tokens = Counter(), Counter()
+    for t in turns:
+        for k, v in t.ms.items():
+            stages[k].append(v)
+        calls.update(t.calls)
+        tokens.update(t.prompt_tokens)
+    n = len(turns) or 1
+    llm_calls = sum(v for k, v in calls.items() if not k.startswith("speculation_"))
+    sent = [m for s in sessions for m in s.sent]
+    return {
+        "workload": workload,
+        "sessions": len(sessions), "turns": len(turns), "wall_s": wall,
+        "turns_per_s": len(turns) / wall,
+        "stages": {k: {"n": len(v), "p50": pct(v, 50), "p95": pct(v, 95),
+                       "p99": pct(v, 99)} for k, v in sorted(stages.items())},
+        "llm_calls_per_turn": llm_calls / n,
+        "llm_calls_by_kind": {k: v / n for k, v in calls.items()
+                              if not k.startswith("speculation_")},
+        "speculation": {k[12:]: v for k, v in calls.items() if k.startswith("speculation_")},
+        "prompt_tokens_per_turn": sum(tokens.values()) / n,
+        "prompt_tokens_by_kind": {k: v / n for k, v in tokens.items()},
+        "interventions": {"started": sum(m.startswith("💡") for m in sent),
+                          "closed":  sum(m.startswith("✅") for m in sent)},
+        "mem0": {**mem0_stub.calls, **({"queue": queue_stats} if queue_stats else {})},
+        "llm_cache": llm_cache_stats,
+        "router": router_stats,
+        "dispatch": dispatch_stats,
+        "tiers": tier_stats,
+    }
+
+def router_stats() -> Dict:
+    """Router decisions by path; `skipped` never left the lexical gate."""
+    from telemetry import ROUTER_PICKS
+    total = ROUTER_PICKS.value()
+    gated = ROUTER_PICKS.value(via="lexical")
+    return {"decisions": int(total), "skipped": int(gated),
+            "llm": int(ROUTER_PICKS.value(via="llm") + ROUTER_PICKS.value(via="llm_fallback")),
+            "skip_ratio": gated / total if total else 0.0}
+
+def show(r: Dict) -> None:
+    print(f"\n[{r['workload']}] {r['sessions']} sessions, {r['turns']} turns in "
+          f"{r['wall_s']:.1f}s → {r['turns_per_s']:.1f} turns/s")
+    print(f"\n{'stage':<20} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for k, s in r["stages"].items():
+        print(f"{k:<20} {s['n']:>6} {s['p50']:>8.0f} {s['p95']:>8.0f} {s['p99']:>8.0f}")
+    by = ", ".join(f"{k} {v:.2f}" for k, v in sorted(r["llm_calls_by_kind"].items()))
+    print(f"\nLLM calls / turn     {r['llm_calls_per_turn']:.2f}  ({by})")
+    by = ", ".join(f"{k} {v:.0f}" for k, v in sorted(r["prompt_tokens_by_kind"].items()))
+    print(f"prompt tokens / turn {r['prompt_tokens_per_turn']:.0f}  ({by})")
+    if r["speculation"]:
+        print(f"speculation          {r['speculation']}")
+    print(f"interventions        {r['interventions']}")
+    print(f"mem0                 {r['mem0']}")
+    if r.get("router"):
+        print(f"router               {r['router']}")
+    if r.get("dispatch"):
+        print(f"llm dispatch         {r['dispatch']}")
+    if r.get("llm_cache"):
+        print(f"llm cache            {r['llm_cache']}")
+    for name, t in (r.get("tiers") or {}).items():
+        print(f"tier {name:<15} {t}")
+
+GATES = {                               # name → (getter, lower is better)
+    "turn_p95_ms":            lambda r: r["stages"]["turn"]["p95"],
+    "visible_p95_ms":         lambda r: r["stages"].get("visible", {}).get("p95", 0.0),
+    "llm_calls_per_turn":     lambda r: r["llm_calls_per_turn"],
+    "prompt_tokens_per_turn": lambda r: r["prompt_tokens_per_turn"],
+}
+
+def compare(r: Dict, base: Dict, tolerance: float) -> List[str]:
+    was = base.get("workload", "coach")
+    if was != r["workload"]:
+        return [f"workload: baseline is {was!r}, this run is {r['workload']!r}; not comparable"]
+    worse = []
+    for name, get in GATES.items():
+        now, was = get(r), get(base)
+        if was and now > was * (1 + tolerance):
+            worse.append(f"{name}: {was:.2f} → {now:.2f} (+{now / was - 1:.0%})")
+    tput, was = r["turns_per_s"], base["turns_per_s"]
+    if was and tput < was * (1 - tolerance):
+        worse.append(f"turns_per_s: {was:.2f} → {tput:.2f} ({tput / was - 1:.0%})")
+    return worse
+
+async def main(a) -> int:
+    from stub_openai import StubOpenAI
+    from stub_mem0 import StubMem0
+    random.seed(a.seed)
+    stub = StubOpenAI(a.latency, a.jitter, a.dist, a.reply_tokens, a.tokens_sd,
+                      a.tpot, scripted=True, rpm=a.stub_rpm)
+    server = await stub.serve(port=a.port)
+    # llm.py and the app read these at import time
+    os.environ.update({
+        "OPENAI_API_BASE": f"http://127.0.0.1:{a.port}", "OPENAI_API_KEY": "stub",
+        "OPENAI_API_VERSION": "2024-06-01", "AZURE_DEPLOYMENT_NAME": "stub",
+        "LLM_MAX_RETRIES": "0", "MEM0_API_KEY": "stub", "SESSION_BACKEND": "memory",
+    })
+    os.environ.setdefault("ROUTER_EMBEDDER", "hash")     # the stub has no embeddings
+    os.environ.setdefault("AZURE_FAST_DEPLOYMENT", "stub-fast")  # router / referee tier
+    os.environ["MEMORY_BACKEND"] = a.memory
+    if a.memory == "local":
+        os.environ["MEMORY_DIR"] = tempfile.mkdtemp(prefix="replay-mem-")
+    mem0_stub = StubMem0(latency=a.mem0_latency, jitter=a.jitter, dist=a.dist)
+    app = load_app(a.app, mem0_stub)
+    import llm
+    from load_interventions import INTERVENTIONS
+    intake = '{"goal": "stop stress spending"}'
+    for uid in ("rich-kid-demo", "new1"):
+        if a.memory == "local":
+            app.MEMORY.add([{"role": "user", "content": intake}],
+                           user_id=uid, metadata={"topic": "intake_summary"})
+        else:
+            mem0_stub.seed(uid, intake, "intake_summary")
+
+    convs = scripts(INTERVENTIONS, a.coach_turns, a.workload)
+    turns: List[TurnStats] = []
+    sessions: List[SimSession] = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(
+        _session(app, i, convs[i % len(convs)], random.uniform(0, a.ramp), a.think,
+                 turns, sessions)
+        for i in range(a.sessions)))
+    wall = time.perf_counter() - t0
+    queue = getattr(app, "MEM0_QUEUE", None)
+    if queue:
+        await queue.drain()
+    from llm_cache import CACHE
+    from dispatch import DISPATCH
+    import tiers
+    r = report(turns, sessions, wall, a.workload, mem0_stub, queue.stats() if queue else None,
+               CACHE.stats(), router_stats(), {**DISPATCH.stats(), "stub_429": stub.throttled},
+               tiers.stats())
+    await llm.aclose()
+    server.close()
+
+    show(r)
+    if a.save:
+        with open(a.save, "w") as f:
+            json.dump(r, f, indent=2, ensure_ascii=False)
+    if a.baseline:
+        with open(a.baseline) as f:
+            worse = compare(r, json.load(f), a.tolerance)
+        print("\nregressions vs baseline:" if worse else "\nno regressions vs baseline")
+        for w in worse:
+            print("  " + w)
+        return 1 if worse else 0
+    return 0
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here); os.chdir(here)                  # .chainlit config
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--app", choices=list(APPS), default="interv")
+    ap.add_argument("--sessions", type=int, default=50)
+    ap.add_argument("--workload", choices=WORKLOADS, default="coach",
+                    help="coach: the regression corpus; smalltalk: greeting first")
+    ap.add_argument("--coach-turns", type=int, default=2, help="turns between trigger and close")
+    ap.add_argument("--ramp", type=float, default=1.0, help="spread session starts over (s)")
+    ap.add_argument("--think", type=float, default=0.0, help="mean user think time (s)")
+    ap.add_argument("--latency", type=float, default=0.5, help="LLM mean latency (s)")
+    ap.add_argument("--jitter", type=float, default=0.2, help="± fraction, or lognormal sigma")
+    ap.add_argument("--dist", choices=["uniform", "lognormal"], default="uniform")
+    ap.add_argument("--reply-tokens", type=int, default=40, help="mean coach reply tokens")
+    ap.add_argument("--tokens-sd", type=float, default=10.0)
+    ap.add_argument("--tpot", type=float, default=0.01, help="seconds per streamed token")
+    ap.add_argument("--stub-rpm", type=int, default=0, help="stub answers 429 above this rate")
+    ap.add_argument("--memory", choices=["mem0", "local"], default="mem0",
+                    help="memory backend: stubbed remote mem0 or the local store")
+    ap.add_argument("--mem0-latency", type=float, default=0.25)
+    ap.add_argument("--port", type=int, default=8901)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--save", help="write the report as JSON")
+    ap.add_argument("--baseline", help="compare with a saved report")
+    ap.add_argument("--tolerance", type=float, default=0.15)
+    ap.add_argument("-v", action="store_true", help="app logs at INFO")
+    a = ap.parse_args()
+    logging.basicConfig(level=logging.INFO if a.v else logging.WARNING)
+    sys.exit(asyncio.run(main(a)))
@@ -0,0 +1,120 @@
+# semantic_router.py ────────────────────────────────────────────────────
+# Local intervention router.  Every catalog row is embedded once (name +
+# description, plus each phrase the row "listens for") into one NumPy
+# matrix; an incoming message costs a single embedding and one matrix
+# product.  Only scores that land between LOW and HIGH are ambiguous and
+# get handed back to the LLM router by load_interventions.pick_intervention.
+import os, re, zlib, asyncio, logging
+from typing import List, Dict, Optional, NamedTuple
+
+import numpy as np
+
+from lexicon import listens_for
+
+# ─────────────── embedding backends ───────────────────────────────────
+class HashEmbedder:
+    """Offline, deterministic bag of hashed words + bigrams.  No model, no
+    network; meant for tests, benchmarks and running without keys."""
+    name, high, low = "hash", 0.45, 0.20
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def _vec(self, text: str) -> np.ndarray:
+        words = re.findall(r"[a-z0-9']+", text.lower())
+        grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        v = np.zeros(self.dim, dtype=np.float32)
+        for g in grams:
+            h = zlib.crc32(g.encode())
+            v[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return v
+
+    def embed_now(self, texts: List[str]) -> np.ndarray:
+        """Synchronous embed(); cheap enough to call inline."""
+        return _normalise(np.stack([self._vec(t) for t in texts]))
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        return self.embed_now(texts)
+
+
+class AzureEmbedder:
+    """Azure OpenAI embeddings deployment (AZURE_EMBEDDING_DEPLOYMENT)."""
+    name, high, low = "azure", 0.50, 0.32
+
+    def __init__(self, deployment: Optional[str] = None, batch: int = 64):
+        self.deployment = deployment or os.getenv("AZURE_EMBEDDING_DEPLOYMENT")
+        self.batch = batch
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        import llm
+        chunks = [texts[i:i + self.batch] for i in range(0, len(texts), self.batch)]
+        out = await asyncio.gather(*(llm.embed(c, model=self.deployment) for c in chunks))
+        return _normalise(np.asarray([v for c in out for v in c], dtype=np.float32))
+
+
+EMBEDDERS = {"hash": HashEmbedder, "azure": AzureEmbedder}
+
+def make_embedder(kind: Optional[str] = None):
+    kind = kind or os.getenv("ROUTER_EMBEDDER") or (
+        "azure" if os.getenv("AZURE_EMBEDDING_DEPLOYMENT") else "hash")
+    return EMBEDDERS[kind]()
+
+def _normalise(m: np.ndarray) -> np.ndarray:
+    n = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.where(n == 0, 1.0, n)
+
+# ─────────────── router ───────────────────────────────────────────────
+class Route(NamedTuple):
+    row:        Optional[Dict]      # best row when confident, else None
+    score:      float               # best cosine
+    ambiguous:  bool                # LOW ≤ score < HIGH → ask the LLM
+    candidates: List[Dict]          # top rows, best first
+
+
+class SemanticRouter:
+    def __init__(self, rows: List[Dict], embedder=None,
+                 high: Optional[float] = None, low: Optional[float] = None,
+                 top_k: int = 3):
+        self.rows     = rows
+        self.embedder = embedder or make_embedder()
+        self.high     = high if high is not None else float(os.getenv("ROUTER_HIGH", self.embedder.high))
+        self.low      = low  if low  is not None else float(os.getenv("ROUTER_LOW",  self.embedder.low))
+        self.top_k    = top_k
+        self._M: Optional[np.ndarray] = None      # (n_texts, dim)
+        self._starts: Optional[np.ndarray] = None # first text index of each row
+        self._lock = asyncio.Lock()
+
+    async def build(self) -> None:
+        """Embed the catalog once.  Safe to call from many sessions."""
+        if self._M is not None:
+            return
+        async with self._lock:
+            if self._M is not None:
+                return
+            texts, starts = [], []
+            for r in self.rows:
+                starts.append(len(texts))
+                texts.append(f"{r['name']}. {r['description']}")
+                texts += listens_for(r["description"])
+            self._M = await self.embedder.embed(texts)
+            self._starts = np.asarray(starts, dtype=np.intp)
+            logging.info(f"[ROUTER] {self.embedder.name} index: "
+                         f"{len(self.rows)} rows, {len(texts)} vectors")
+
+    async def scores(self, text: str) -> np.ndarray:
+        """Best cosine per row (max over the row's description + phrases)."""
+        await self.build()
+        q = (await self.embedder.embed([text]))[0]
+        return np.maximum.reduceat(self._M @ q, self._starts)
+
+    async def route(self, text: str) -> Route:
+        s = await self.scores(text)
+        order = np.argsort(-s)[:self.top_k]
+        best = float(s[order[0]])
+        cands = [self.rows[i] for i in order]
+        return Route(
+            row        = cands[0] if best >= self.high else None,
+            score      = best,
+            ambiguous  = self.low <= best < self.high,
+            candidates = cands,
+        )
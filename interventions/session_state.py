@@ -0,0 +1,231 @@
+# session_state.py ──────────────────────────────────────────────────────
+# Compact per-session conversation state.
+#
+# • Turn           – __slots__ record; role / emotion strings are interned and
+#                    the boolean tags are packed into one int bit field
+# • SessionState   – mode, current intervention (by name, not the 2 KB row),
+#                    the recent turns and a rolling summary of older turns
+# • SessionStore   – pluggable backend: in-process dict ("memory") or a
+#                    local SQLite file ("sqlite") that survives restarts and
+#                    can be shared by several worker processes
+#
+# Turns that fall out of the re-sent window are folded into `summary` by a
+# summariser (extractive, local, no LLM call by default).
+#
+#   python session_state.py      # bytes per 50-turn session, old vs new
+import os, sys, json, time, sqlite3, asyncio, threading
+from typing import List, Dict, Optional, Callable
+
+SESSION_BACKEND   = os.getenv("SESSION_BACKEND", "memory")     # memory | sqlite
+SESSION_DB        = os.getenv("SESSION_DB", "sessions.db")
+SESSION_TTL       = float(os.getenv("SESSION_TTL", "1296000")) # 15 days, as config.toml
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "1200"))
+
+# ─────────────── turn record ──────────────────────────────────────────
+class Turn:
+    __slots__ = ("role", "text", "flags", "emotion")
+    FLAGS = {"accept": 1, "bail": 2, "wrap_up": 4, "question": 8, "repeated": 16}
+
+    def __init__(self, role: str, text: str, flags: int = 0,
+                 emotion: Optional[str] = None):
+        self.role    = sys.intern(role)
+        self.text    = text
+        self.flags   = flags
+        self.emotion = sys.intern(emotion) if emotion else None
+
+    @classmethod
+    def tagged(cls, role: str, text: str, emotion: Optional[str] = None,
+               **tags: int) -> "Turn":
+        flags = 0
+        for name, on in tags.items():
+            if on:
+                flags |= cls.FLAGS[name]
+        return cls(role, text, flags, emotion)
+
+    def tag(self, name: str) -> int:
+        return int(bool(self.flags & self.FLAGS[name]))
+
+    def to_row(self) -> list:
+        return [self.role[0], self.text, self.flags, self.emotion]
+
+    @classmethod
+    def from_row(cls, row: list) -> "Turn":
+        r, text, flags, emotion = row
+        return cls("user" if r == "u" else "assistant", text, flags, emotion)
+
+# ─────────────── summariser ───────────────────────────────────────────
+Summariser = Callable[[str, List[Turn]], str]
+
+def extractive_fold(summary: str, turns: List[Turn],
+                    max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    """Append one short line per folded turn; drop the oldest lines when
+    the summary outgrows max_chars."""
+    lines = summary.splitlines() if summary else []
+    for t in turns:
+        first = t.text.strip().split("\n", 1)[0]
+        first = first if len(first) <= 140 else first[:137] + "…"
+        mood  = f" [{t.emotion}]" if t.emotion else ""
+        lines.append(f"{'User' if t.role == 'user' else 'Coach'}{mood}: {first}")
+    while lines and sum(len(l) + 1 for l in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+# ─────────────── session ──────────────────────────────────────────────
+class SessionState:
+    __slots__ = ("sid", "mode", "iv_name", "iv_turns", "notes_sent",
+                 "static_profile", "turns", "summary", "updated")
+
+    def __init__(self, sid: str):
+        self.sid            = sid
+        self.mode           = "normal"
+        self.iv_name: Optional[str] = None
+        self.iv_turns       = 0
+        self.notes_sent     = False
+        self.static_profile = "{}"
+        self.turns: List[Turn] = []
+        self.summary        = ""
+        self.updated        = time.time()
+
+    def start_iv(self, name: str) -> None:
+        self.mode, self.iv_name, self.iv_turns, self.notes_sent = "intervention", name, 0, False
+
+    def end_iv(self) -> None:
+        self.mode, self.iv_name, self.iv_turns, self.notes_sent = "normal", None, 0, False
+
+    def add(self, turn: Turn, keep: int, fold: Summariser = extractive_fold) -> None:
+        """Append a turn and fold whatever falls outside the last `keep`
+        turns into the rolling summary."""
+        self.turns.append(turn)
+        if len(self.turns) > keep:
+            old, self.turns = self.turns[:-keep], self.turns[-keep:]
+            self.summary = fold(self.summary, old)
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(
+            [self.mode, self.iv_name, self.iv_turns, int(self.notes_sent),
+             self.static_profile, self.summary, [t.to_row() for t in self.turns]],
+            ensure_ascii=False, separators=(",", ":")).encode()
+
+    @classmethod
+    def from_bytes(cls, sid: str, data: bytes) -> "SessionState":
+        mode, iv, n, notes, profile, summary, rows = json.loads(data)
+        s = cls(sid)
+        s.mode, s.iv_name, s.iv_turns, s.notes_sent = mode, iv, n, bool(notes)
+        s.static_profile, s.summary = profile, summary
+        s.turns = [Turn.from_row(r) for r in rows]
+        return s
+
+    def nbytes(self) -> int:
+        """Approximate resident size: the objects this session owns (interned
+        role / emotion strings are shared and not counted)."""
+        n = sys.getsizeof(self) + sys.getsizeof(self.turns)
+        n += sum(sys.getsizeof(v) for v in (self.sid, self.iv_name,
+                                            self.static_profile, self.summary))
+        for t in self.turns:
+            n += sys.getsizeof(t) + sys.getsizeof(t.text) + sys.getsizeof(t.flags)
+        return n
+
+# ─────────────── backends ─────────────────────────────────────────────
+class MemoryBackend:
+    """Live objects in a dict; nothing is serialised."""
+    blocking = False
+
+    def __init__(self):
+        self._d: Dict[str, SessionState] = {}
+
+    def get(self, sid: str) -> Optional[SessionState]:
+        return self._d.get(sid)
+
+    def put(self, state: SessionState) -> None:
+        self._d[state.sid] = state
+
+    def purge(self, older_than: float) -> int:
+        old = [k for k, s in self._d.items() if s.updated < older_than]
+        for k in old:
+            del self._d[k]
+        return len(old)
+
+
+class SQLiteBackend:
+    """One row per session in a WAL-mode SQLite file; safe for several
+    worker processes on the same host."""
+    blocking = True
+
+    def __init__(self, path: str = SESSION_DB):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as c:
+            c.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                      "sid TEXT PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None:
+            c = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = c
+        return c
+
+    def get(self, sid: str) -> Optional[SessionState]:
+        row = self._conn().execute("SELECT data FROM sessions WHERE sid=?", (sid,)).fetchone()
+        return SessionState.from_bytes(sid, row[0]) if row else None
+
+    def put(self, state: SessionState) -> None:
+        self._conn().execute(
+            "INSERT INTO sessions (sid, data, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT(sid) DO UPDATE SET data=excluded.data, updated=excluded.updated",
+            (state.sid, state.to_bytes(), state.updated))
+
+    def purge(self, older_than: float) -> int:
+        return self._conn().execute("DELETE FROM sessions WHERE updated < ?",
+                                    (older_than,)).rowcount
+
+
+BACKENDS = {"memory": MemoryBackend, "sqlite": SQLiteBackend}
+
+class SessionStore:
+    def __init__(self, backend=None, purge_every: float = 3600):
+        self.backend = backend or BACKENDS[SESSION_BACKEND]()
+        self.purge_every = purge_every
+        self._last_purge = time.time()
+
+    async def _call(self, fn, *a):
+        return await asyncio.to_thread(fn, *a) if self.backend.blocking else fn(*a)
+
+    async def load(self, sid: str) -> SessionState:
+        return await self._call(self.backend.get, sid) or SessionState(sid)
+
+    async def save(self, state: SessionState) -> None:
+        state.updated = time.time()
+        await self._call(self.backend.put, state)
+        if state.updated - self._last_purge > self.purge_every:
+            self._last_purge = state.updated
+            await self.purge()
+
+    async def purge(self, ttl: float = SESSION_TTL) -> int:
+        return await self._call(self.backend.purge, time.time() - ttl)
+
+
+if __name__ == "__main__":
+    def deep(o) -> int:
+        if isinstance(o, dict):
+            return sys.getsizeof(o) + sum(deep(k) + deep(v) for k, v in o.items())
+        if isinstance(o, list):
+            return sys.getsizeof(o) + sum(deep(v) for v in o)
+        return sys.getsizeof(o)
+
+    text_u = "I keep buying things at midnight and then I feel awful about it"
+    text_a = "That midnight pattern sounds exhausting. What is usually going on for you right before you open the app?"
+    legacy, s = [], SessionState("demo")
+    for i in range(50):
+        legacy.append({"role": "user", "text": f"{text_u} {i}",
+                       "tags": {"accept": 0, "bail": 0, "emotion": None}})
+        legacy.append({"role": "assistant", "text": f"{text_a} {i}",
+                       "tags": {"wrap_up": 0, "question": 1, "repeated": 0}})
+        s.add(Turn.tagged("user", f"{text_u} {i}"), keep=10)
+        s.add(Turn.tagged("assistant", f"{text_a} {i}", question=1), keep=10)
+    legacy = legacy[-50:]
+    print(f"legacy hist[-50:] dict list : {deep(legacy):>7} bytes")
+    print(f"SessionState (10 + summary)  : {s.nbytes():>7} bytes")
+    print(f"serialised for the store     : {len(s.to_bytes()):>7} bytes")
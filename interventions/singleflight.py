@@ -0,0 +1,57 @@
+# singleflight.py ───────────────────────────────────────────────────────
+# Coalescing of identical concurrent misses, shared by the mem0 search cache
+# (memory_cache.py) and the router / referee cache (llm_cache.py).
+#
+# The first caller for a key (the leader) runs `fetch()`; callers arriving
+# while it runs wait for its result instead of making the same remote call.
+# A failure reaches every waiter.  If the leader is cancelled, the waiters
+# are not: they look in the cache again and one of them fetches itself.
+import asyncio
+from typing import Dict, Hashable, Optional, Callable, Awaitable, TypeVar, Generic
+
+T = TypeVar("T")
+
+class SingleFlight(Generic[T]):
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable,
+                  cached: Callable[[], Optional[T]],
+                  fetch: Callable[[], Awaitable[T]],
+                  on_wait: Optional[Callable[[], None]] = None) -> T:
+        """`cached()` (None on a miss) if it hits, else the result of the one
+        `fetch()` running for `key`.  `on_wait` is called each time this
+        caller joins someone else's fetch."""
+        while True:
+            hit = cached()
+            if hit is not None:
+                return hit
+            fut = self._inflight.get(key)
+            if fut is None:
+                break
+            if on_wait:
+                on_wait()
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                if not fut.cancelled() or asyncio.current_task().cancelling():
+                    raise                       # we were cancelled ourselves
+                # the leader was cancelled: look again / fetch ourselves
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            fut.cancel()                        # waiters retry, they are not cancelled
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()                     # mark retrieved for lone callers
+            raise
+        else:
+            fut.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is fut:
+                del self._inflight[key]
@@ -0,0 +1,95 @@
+# streaming.py ──────────────────────────────────────────────────────────
+# Streams a coach reply into a Chainlit message token by token.  The token
+# list is the only copy of the reply; keyword tags (wrap_up phrases, the
+# intervention's completion_indicator) are matched incrementally as tokens
+# arrive, so nothing re-scans the finished text.
+#
+# A ReplyStream can run "detached" (speculative draft) and be attached to a
+# message later: whatever was generated so far is flushed in one piece and
+# the rest streams live.
+import time, asyncio, logging
+from contextlib import aclosing
+from typing import List, Dict, Optional, Iterable
+
+import llm
+import telemetry
+from prompting import count_tokens
+
+class KeywordScanner:
+    """Incremental, case-insensitive substring matcher over a token stream."""
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = {k.lower() for k in keywords if k}
+        self.hits: set = set()
+        self._keep = max((len(k) for k in self.keywords), default=1) - 1
+        self._tail = ""
+
+    def feed(self, token: str) -> None:
+        if not self.keywords:
+            return
+        window = self._tail + token.lower()
+        for k in self.keywords - self.hits:
+            if k in window:
+                self.hits.add(k)
+        self._tail = window[-self._keep:] if self._keep else ""
+
+    def any(self, keywords: Iterable[str]) -> bool:
+        return any(k.lower() in self.hits for k in keywords if k)
+
+
+class ReplyStream:
+    def __init__(self, keywords: Iterable[str] = (), msg=None,
+                 t0: Optional[float] = None, stage: str = "reply"):
+        self.msg      = msg                       # cl.Message, or None while detached
+        self.stage    = stage                     # span name in the turn trace
+        self.keywords = list(keywords)
+        self.t0       = t0 or time.perf_counter() # turn start, for visible latency
+        self.parts: List[str] = []
+        self.scan     = KeywordScanner(self.keywords)
+        self.ttft_ms: Optional[float] = None      # request → first token
+        self.visible_ms: Optional[float] = None   # turn start → first token on screen
+        self.total_ms: Optional[float] = None
+        self._sent = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    async def attach(self, msg) -> None:
+        """Go live: flush what was drafted so far, stream the rest."""
+        if self.msg is None:
+            self.msg = msg
+        await self._pump()
+
+    async def _pump(self) -> None:
+        if self.msg is None:
+            return
+        async with self._lock:                    # keeps flush and live tokens in order
+            chunk = "".join(self.parts[self._sent:])
+            self._sent = len(self.parts)
+            if chunk:
+                if self.visible_ms is None:
+                    self.visible_ms = (time.perf_counter() - self.t0) * 1000
+                await self.msg.stream_token(chunk)
+
+    async def run(self, messages: List[Dict], **kw) -> str:
+        self.parts, self._sent, self.ttft_ms = [], 0, None
+        self.scan = KeywordScanner(self.keywords)
+        t = time.perf_counter()
+        # aclosing: a cancelled draft closes its HTTP stream and dispatch slot
+        # right away instead of whenever the generator is garbage-collected
+        with telemetry.span(self.stage) as sp:
+            async with aclosing(llm.chat_stream(messages, **kw)) as tokens:
+                async for tok in tokens:
+                    if self.ttft_ms is None:
+                        self.ttft_ms = sp["ttft_ms"] = round((time.perf_counter() - t) * 1000, 1)
+                    self.parts.append(tok)
+                    self.scan.feed(tok)
+                    await self._pump()
+            # streamed responses carry no usage block: count locally
+            telemetry.usage(sum(count_tokens(str(m.get("content", ""))) for m in messages),
+                            count_tokens(self.text))
+        self.total_ms = (time.perf_counter() - t) * 1000
+        logging.info(f"[STREAM] ttft={self.ttft_ms or 0:.0f}ms "
+                     f"visible={self.visible_ms or 0:.0f}ms total={self.total_ms:.0f}ms")
+        return self.text
@@ -0,0 +1,57 @@
+# stub_mem0.py ──────────────────────────────────────────────────────────
+# In-process stand-in for mem0.MemoryClient, used by the replay benchmark.
+# Same blocking search / add surface the apps call through asyncio.to_thread;
+# each call sleeps for a jittered (or lognormal) delay and memories are kept
+# per user in a list, newest first.  search() returns the newest `top_k`
+# memories matching the topic filter, so results change after a write the
+# way the real service's do.
+import math, time, random, threading
+from typing import List, Dict, Optional, Callable
+
+class StubMem0:
+    def __init__(self, api_key: Optional[str] = None, *,
+                 latency: float = 0.25, jitter: float = 0.2,
+                 dist: str = "uniform",
+                 on_call: Optional[Callable[[str, float], None]] = None):
+        self.latency = latency
+        self.jitter  = jitter
+        self.dist    = dist
+        self.on_call = on_call          # (op, seconds) after every call
+        self._mem: Dict[str, List[Dict]] = {}
+        self._lock = threading.Lock()
+        self.calls = {"search": 0, "add": 0}
+
+    def _sleep(self, op: str) -> None:
+        if self.dist == "lognormal":
+            s = random.lognormvariate(math.log(max(self.latency, 1e-6)) - self.jitter ** 2 / 2,
+                                      self.jitter)
+        else:
+            spread = self.latency * self.jitter
+            s = max(0.0, random.uniform(self.latency - spread, self.latency + spread))
+        time.sleep(s)
+        with self._lock:
+            self.calls[op] += 1
+        if self.on_call:
+            self.on_call(op, s)
+
+    def seed(self, user_id: str, memory: str, topic: Optional[str] = None) -> None:
+        with self._lock:
+            self._mem.setdefault(user_id, []).insert(
+                0, {"memory": memory, "metadata": {"topic": topic} if topic else {}})
+
+    def search(self, query: str, *, user_id: str, top_k: int = 3,
+               metadata_filters: Optional[Dict] = None, **_) -> List[Dict]:
+        self._sleep("search")
+        topic = (metadata_filters or {}).get("topic")
+        with self._lock:
+            rows = [m for m in self._mem.get(user_id, [])
+                    if topic is None or m["metadata"].get("topic") == topic]
+        return [dict(m, score=1.0) for m in rows[:top_k]]
+
+    def add(self, messages: List[Dict], *, user_id: str,
+            metadata: Optional[Dict] = None, **_) -> Dict:
+        self._sleep("add")
+        for m in messages:
+            if m.get("role") == "user":
+                self.seed(user_id, m["content"][:200], (metadata or {}).get("topic"))
+        return {"results": [{"event": "ADD"}]}
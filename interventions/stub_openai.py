@@ -0,0 +1,219 @@
+# stub_openai.py ────────────────────────────────────────────────────────
+# Tiny local stand-in for the Azure OpenAI chat-completions endpoint, used
+# by the load test.  Answers after a configurable (jittered) delay with a
+# canned router / referee / coach reply so no keys or network are needed.
+# `"stream": true` requests get SSE chunks: half the delay before the first
+# token, the other half spread over the rest (or, with --tpot, the whole
+# delay before the first token and `tpot` seconds per token after it).
+#
+# For replay benchmarks the delay can be drawn from a lognormal instead of
+# a uniform band, coach replies can be sized from a token distribution, and
+# `scripted` makes the canned answers follow the conversation: the router
+# picks the listed intervention whose description shares most words with
+# the user text, the coach wraps up once the user accepts, and the referee
+# closes on an accept / bail in the scorecard.
+#
+# `rpm` makes the stub behave like a throttled Azure deployment, which
+# enforces the per-minute quota over 10 s windows: requests beyond rpm / 6
+# in the last 10 s get a 429 with retry-after-ms.
+#
+#   python stub_openai.py --port 8900 --latency 0.8
+#   python stub_openai.py --dist lognormal --reply-tokens 45 --tpot 0.02 --scripted
+import re, time, asyncio, json, math, random, argparse, logging
+from collections import deque
+from typing import Dict, Tuple
+
+ROUTER_REPLY  = '{"choice":"none"}'
+REFEREE_REPLY = '{"decision":"continue"}'
+COACH_REPLY   = ("That sounds heavy to carry. What is one money moment this week "
+                 "that made the worry louder?")
+
+WRAP_UP_REPLY = "Great work, that completes the exercise. "
+_ACCEPTS      = ("thanks", "got it", "makes sense")
+_WORD         = re.compile(r"[a-z']{4,}")
+
+class StubOpenAI:
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2,
+                 dist: str = "uniform", reply_tokens: int = 0,
+                 tokens_sd: float = 0.0, tpot: float = 0.0,
+                 scripted: bool = False, rpm: int = 0):
+        self.latency  = latency     # mean seconds per completion (to first token)
+        self.jitter   = jitter      # ± fraction of latency, or lognormal sigma
+        self.dist     = dist        # "uniform" | "lognormal"
+        self.reply_tokens = reply_tokens    # mean coach reply length; 0 = canned
+        self.tokens_sd    = tokens_sd
+        self.tpot     = tpot        # seconds per streamed token after the first
+        self.scripted = scripted
+        self.rpm      = rpm         # 0 = never throttle
+        self.requests = 0
+        self.throttled = 0
+        self._window: deque = deque()
+
+    def _retry_after(self) -> float:
+        """0 when the request fits the rpm window, else seconds until it would."""
+        if not self.rpm:
+            return 0.0
+        now = time.monotonic()
+        while self._window and now - self._window[0] >= 10:
+            self._window.popleft()
+        if len(self._window) < max(1, self.rpm // 6):
+            self._window.append(now)
+            return 0.0
+        self.throttled += 1
+        return 10 - (now - self._window[0])
+
+    def _content(self, body: Dict) -> str:
+        msgs   = body.get("messages") or [{}]
+        system = msgs[0].get("content", "")
+        last   = str(msgs[-1].get("content", ""))
+        if "routing assistant" in system:
+            return self._route(last) if self.scripted else ROUTER_REPLY
+        if "Referee" in system:
+            if self.scripted and re.search(r'"(accepts|bails)":\s*[1-9]', last):
+                return '{"decision":"close"}'
+            return REFEREE_REPLY
+        reply = self._coach()
+        if self.scripted and any(w in last.lower() for w in _ACCEPTS):
+            reply = WRAP_UP_REPLY + reply
+        return reply
+
+    @staticmethod
+    def _route(prompt: str) -> str:
+        text, _, listing = prompt.partition("INTERVENTIONS:")
+        words = set(_WORD.findall(text.lower()))
+        best, choice = 1, "none"
+        for line in listing.splitlines():
+            name, _, desc = line[2:].partition(": ")
+            score = len(words & set(_WORD.findall(desc.lower())))
+            if score > best:
+                best, choice = score, name
+        return json.dumps({"choice": choice})
+
+    def _coach(self) -> str:
+        if not self.reply_tokens:
+            return COACH_REPLY
+        n = max(1, round(random.gauss(self.reply_tokens, self.tokens_sd)))
+        words = COACH_REPLY.rstrip("?").split(" ")
+        return " ".join(words[i % len(words)] for i in range(n)) + "?"
+
+    def _delay(self) -> float:
+        if self.dist == "lognormal":        # same mean, long right tail
+            sigma = self.jitter
+            return random.lognormvariate(math.log(max(self.latency, 1e-6)) - sigma ** 2 / 2, sigma)
+        spread = self.latency * self.jitter
+        return max(0.0, random.uniform(self.latency - spread, self.latency + spread))
+
+    async def complete(self, body: Dict) -> Dict:
+        self.requests += 1
+        await asyncio.sleep(self._delay())
+        text = self._content(body)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        return {
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body.get("model") or "stub",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": prompt_tokens,
+                      "completion_tokens": len(text) // 4,
+                      "total_tokens": prompt_tokens + len(text) // 4},
+        }
+
+    async def stream(self, body: Dict, writer) -> None:
+        self.requests += 1
+        delay = self._delay()
+        words = self._content(body).split(" ")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n")
+        first, gap = (delay, self.tpot) if self.tpot else (delay / 2, delay / 2 / len(words))
+        await asyncio.sleep(first)
+        for i, w in enumerate(words):
+            chunk = {"id": f"stub-{self.requests}", "object": "chat.completion.chunk",
+                     "created": 0, "model": body.get("model") or "stub",
+                     "choices": [{"index": 0, "finish_reason": None,
+                                  "delta": {"content": w if i == 0 else " " + w}}]}
+            self._chunk(writer, f"data: {json.dumps(chunk)}\n\n")
+            await writer.drain()
+            await asyncio.sleep(gap)
+        self._chunk(writer, "data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _chunk(writer, text: str) -> None:
+        data = text.encode()
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    # ─── minimal HTTP/1.1 keep-alive server ──────────────────────────
+    async def _read_request(self, reader) -> Tuple[str, Dict]:
+        head = await reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        path = lines[0].split(" ")[1]
+        headers = {k.strip().lower(): v.strip()
+                   for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+        n = int(headers.get("content-length", "0"))
+        body = json.loads(await reader.readexactly(n)) if n else {}
+        return path, body
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                path, body = await self._read_request(reader)
+                wait = self._retry_after() if "chat/completions" in path else 0.0
+                if wait:
+                    data = json.dumps({"error": {"code": "429", "message": "rate limited"}}).encode()
+                    writer.write(
+                        f"HTTP/1.1 429 Too Many Requests\r\nContent-Type: application/json\r\n"
+                        f"retry-after-ms: {int(wait * 1000)}\r\nretry-after: {math.ceil(wait)}\r\n"
+                        f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode()
+                        + data
+                    )
+                    await writer.drain()
+                    continue
+                if "chat/completions" in path and body.get("stream"):
+                    await self.stream(body, writer)
+                    continue
+                if "chat/completions" in path:
+                    status, payload = "200 OK", await self.complete(body)
+                else:
+                    status, payload = "404 Not Found", {"error": {"message": path}}
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8900):
+        server = await asyncio.start_server(self._handle, host, port, backlog=2048)
+        logging.info(f"[STUB] openai listening on http://{host}:{port}")
+        return server
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8900)
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--jitter", type=float, default=0.2)
+    ap.add_argument("--dist", choices=["uniform", "lognormal"], default="uniform")
+    ap.add_argument("--reply-tokens", type=int, default=0, help="mean coach reply length")
+    ap.add_argument("--tokens-sd", type=float, default=0.0)
+    ap.add_argument("--tpot", type=float, default=0.0, help="seconds per streamed token")
+    ap.add_argument("--scripted", action="store_true", help="answers follow the conversation")
+    ap.add_argument("--rpm", type=int, default=0, help="answer 429 above this many requests/min")
+    a = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def _main():
+        server = await StubOpenAI(a.latency, a.jitter, a.dist, a.reply_tokens,
+                                  a.tokens_sd, a.tpot, a.scripted, a.rpm).serve(a.host, a.port)
+        async with server:
+            await server.serve_forever()
+    asyncio.run(_main())
@@ -0,0 +1,260 @@
+# telemetry.py ──────────────────────────────────────────────────────────
+# Per-turn tracing and Prometheus metrics, no extra dependencies.
+#
+#   with telemetry.turn("interv"):            # one trace id per user turn
+#       with telemetry.span("router"):        # nested spans, ms + tokens
+#           ...
+#       telemetry.event("mode", mode="intervention", iv=name)
+#
+# Each finished turn logs one `[TRACE] {json}` line (trace id, spans with
+# parent ids, durations, token usage, events).  Every span also lands in the
+# `coach_stage_seconds{stage=…}` histogram, served in the Prometheus text
+# format at /metrics next to /healthz (see serve_metrics).
+import os, json, time, uuid, asyncio, logging, threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Tuple, Optional, Callable, Iterator
+
+TRACE_LOG = os.getenv("TRACE_LOG", "1") != "0"
+BUCKETS   = (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)    # seconds
+
+# ─────────────── metrics ──────────────────────────────────────────────
+def _esc(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._v: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, n: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        with self._lock:
+            self._v[key] = self._v.get(key, 0) + n
+
+    def value(self, **labels) -> float:
+        """Sum over the series whose labels match the given ones."""
+        want = [(i, str(v)) for i, l in enumerate(self.labels) if (v := labels.get(l)) is not None]
+        with self._lock:
+            return sum(v for k, v in self._v.items() if all(k[i] == x for i, x in want))
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = list(self._v.items())
+        for key, v in items:
+            yield f"{self.name}{_labels(self.labels, key)} {v:g}"
+
+
+class Histogram(Counter):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        with self._lock:
+            counts = self._v.get(key)
+            if counts is None:
+                counts = self._v[key] = [0] * (len(self.buckets) + 2)   # …, sum, count
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = [(k, list(c)) for k, c in self._v.items()]
+        for key, c in items:
+            for b, n in zip(self.buckets, c):
+                le = 'le="%g"' % b
+                yield f"{self.name}_bucket{_labels(self.labels, key, le)} {n}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.labels, key, le)} {c[-1]}"
+            yield f"{self.name}_sum{_labels(self.labels, key)} {c[-2]:.6f}"
+            yield f"{self.name}_count{_labels(self.labels, key)} {c[-1]}"
+
+
+class Gauge:
+    """Read at scrape time from a callback (queue depth, cache size …)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.name, self.help, self.fn = name, help, fn
+
+    def samples(self) -> Iterator[str]:
+        try:
+            yield f"{self.name} {float(self.fn()):g}"
+        except Exception as e:
+            logging.warning(f"[METRICS] gauge {self.name} failed: {e!r}")
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _add(self, m):
+        return self._metrics.setdefault(m.name, m)
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]) -> Gauge:
+        self._metrics[name] = Gauge(name, help, fn)     # latest callback wins
+        return self._metrics[name]
+
+    def render(self) -> str:
+        out: List[str] = []
+        for m in list(self._metrics.values()):
+            out += [f"# HELP {m.name} {m.help}", f"# TYPE {m.name} {m.kind}", *m.samples()]
+        return "\n".join(out) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS  = REGISTRY.histogram("coach_stage_seconds", "Duration of one traced stage",
+                                    ("stage",))
+TURN_SECONDS   = REGISTRY.histogram("coach_turn_seconds", "Duration of a whole user turn",
+                                    ("app",))
+STAGE_ERRORS   = REGISTRY.counter("coach_stage_errors_total", "Stages that raised",
+                                  ("stage", "error"))
+LLM_TOKENS     = REGISTRY.counter("coach_llm_tokens_total", "LLM tokens by stage",
+                                  ("stage", "kind"))
+ROUTER_PICKS   = REGISTRY.counter("coach_router_picks_total", "Router decisions",
+                                  ("intervention", "via"))
+REFEREE_CLOSES = REGISTRY.counter("coach_referee_closes_total", "Interventions closed",
+                                  ("intervention", "via"))
+MODE_CHANGES   = REGISTRY.counter("coach_mode_transitions_total", "Mode transitions",
+                                  ("mode",))
+
+# ─────────────── traces ───────────────────────────────────────────────
+class Trace:
+    __slots__ = ("trace_id", "app", "session", "t0", "spans", "events", "_ids")
+
+    def __init__(self, app: str, session: Optional[str] = None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.app = app
+        self.session = session
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.events: List[Dict] = []
+        self._ids = 0
+
+    def at_ms(self) -> float:
+        return round((time.perf_counter() - self.t0) * 1000, 1)
+
+_TRACE: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_SPAN:  ContextVar[Optional[Dict]]  = ContextVar("span", default=None)
+
+def trace_id() -> Optional[str]:
+    tr = _TRACE.get()
+    return tr.trace_id if tr else None
+
+def session_id() -> Optional[str]:
+    tr = _TRACE.get()
+    return tr.session if tr else None
+
+@contextmanager
+def turn(app: str, **attrs):
+    """Open a trace for one user turn; logs it and records the turn time."""
+    tr = Trace(app, attrs.get("session"))
+    tok = _TRACE.set(tr)
+    try:
+        yield tr
+    finally:
+        _TRACE.reset(tok)
+        dur = time.perf_counter() - tr.t0
+        TURN_SECONDS.observe(dur, app=app)
+        if TRACE_LOG:
+            logging.info("[TRACE] " + json.dumps(
+                {"trace": tr.trace_id, "app": app, "ms": round(dur * 1000, 1), **attrs,
+                 "spans": tr.spans, "events": tr.events},
+                ensure_ascii=False, separators=(",", ":"), default=str))
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a stage.  Works without an open trace (metrics only)."""
+    tr, parent = _TRACE.get(), _SPAN.get()
+    rec = {"name": name, **attrs}
+    if tr:
+        tr._ids += 1
+        rec.update(id=tr._ids, parent=(parent or {}).get("id"), at_ms=tr.at_ms())
+    tok = _SPAN.set(rec)
+    t = time.perf_counter()
+    try:
+        yield rec
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):   # e.g. a discarded draft
+            rec["cancelled"] = True
+        else:
+            rec["error"] = type(e).__name__
+            STAGE_ERRORS.inc(stage=name, error=rec["error"])
+        raise
+    finally:
+        _SPAN.reset(tok)
+        dur = time.perf_counter() - t
+        rec["ms"] = round(dur * 1000, 1)
+        STAGE_SECONDS.observe(dur, stage=name)
+        if tr:
+            tr.spans.append(rec)
+
+def usage(prompt_tokens: int, completion_tokens: int) -> None:
+    """Attach token usage to the innermost open span."""
+    rec = _SPAN.get()
+    stage = rec["name"] if rec else "untraced"
+    if rec is not None:
+        rec["prompt_tokens"] = rec.get("prompt_tokens", 0) + prompt_tokens
+        rec["completion_tokens"] = rec.get("completion_tokens", 0) + completion_tokens
+    LLM_TOKENS.inc(prompt_tokens, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, stage=stage, kind="completion")
+
+def annotate(**attrs) -> None:
+    """Add to the innermost open span (numbers accumulate, e.g. queue_ms)."""
+    rec = _SPAN.get()
+    if rec is None:
+        return
+    for k, v in attrs.items():
+        rec[k] = rec.get(k, 0) + v if isinstance(v, (int, float)) and k in rec else v
+
+def event(name: str, **attrs) -> None:
+    tr = _TRACE.get()
+    if tr:
+        tr.events.append({"name": name, "at_ms": tr.at_ms(), **attrs})
+
+# ─────────────── HTTP ─────────────────────────────────────────────────
+def serve_metrics(path: str = "/metrics") -> None:
+    """Add /metrics (and an explicit /healthz) in front of Chainlit's
+    catch-all route, which would otherwise answer them with the SPA."""
+    try:
+        from chainlit.server import app
+        from starlette.responses import PlainTextResponse
+        from starlette.routing import Route
+    except Exception:                   # not running under `chainlit run`
+        return
+    if any(getattr(r, "path", None) == path for r in app.router.routes):
+        return
+
+    async def metrics(_request):
+        return PlainTextResponse(REGISTRY.render(),
+                                 media_type="text/plain; version=0.0.4")
+
+    async def healthz(_request):
+        return PlainTextResponse("ok")
+
+    app.router.routes.insert(0, Route(path, metrics, methods=["GET"]))
+    app.router.routes.insert(0, Route("/healthz", healthz, methods=["GET"]))
@@ -0,0 +1,12 @@
+# Offline tests for the caches, the local memory store, the catalog and the
+# semantic router; run from interventions/ with `python -m pytest -q`.
+# Nothing here talks to Azure or mem0: llm.py only needs its settings to
+# build the (unused) client at import time, and routing uses the hash embedder.
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for k, v in {"OPENAI_API_KEY": "test", "OPENAI_API_VERSION": "2024-06-01",
+             "OPENAI_API_BASE": "http://127.0.0.1:9", "AZURE_DEPLOYMENT_NAME": "test",
+             "ROUTER_EMBEDDER": "hash", "TRACE_LOG": "0"}.items():
+    os.environ.setdefault(k, v)
@@ -0,0 +1,139 @@
+import asyncio
+
+from memory_cache import MemoryCache
+from llm_cache import ResponseCache
+from singleflight import SingleFlight
+
+
+class Fetch:
+    """A slow remote call that counts how often it ran."""
+    def __init__(self, value, delay=0.05):
+        self.value, self.delay, self.calls = value, delay, 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.value
+
+
+# ─────────────── single flight ────────────────────────────────────────
+def test_waiters_share_the_leaders_error():
+    async def main():
+        flights = SingleFlight()
+
+        async def boom():
+            await asyncio.sleep(0.02)
+            raise ValueError("down")
+
+        got = await asyncio.gather(*(flights.run("k", lambda: None, boom) for _ in range(3)),
+                                   return_exceptions=True)
+        assert all(isinstance(e, ValueError) for e in got)
+    asyncio.run(main())
+
+
+# ─────────────── mem0 search cache ────────────────────────────────────
+def test_memory_cache_coalesces_and_hits():
+    async def main():
+        cache, fetch = MemoryCache(), Fetch(["m1"])
+        got = await asyncio.gather(*(cache.get("u", "Rent?", 3, None, fetch) for _ in range(5)))
+        assert got == [["m1"]] * 5 and fetch.calls == 1
+        assert await cache.get("u", "  rent ", 3, None, fetch) == ["m1"]   # normalised
+        assert fetch.calls == 1
+        assert cache.counters["coalesced"] == 4 and cache.counters["hits"] == 1
+    asyncio.run(main())
+
+
+def test_memory_cache_leader_cancelled_follower_fetches():
+    async def main():
+        cache, fetch = MemoryCache(), Fetch(["m1"], delay=0.1)
+        leader = asyncio.create_task(cache.get("u", "q", 3, None, fetch))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get("u", "q", 3, None, fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == ["m1"]
+        assert leader.cancelled() and fetch.calls == 2
+    asyncio.run(main())
+
+
+def test_memory_cache_invalidation_is_scoped_by_topic():
+    async def main():
+        cache = MemoryCache()
+        profile, recent = Fetch(["profile"]), Fetch(["recent"])
+        await cache.get("u", "summary", 1, "intake_summary", profile)
+        await cache.get("u", "rent", 3, None, recent)
+        await cache.get("v", "rent", 3, None, recent)
+        cache.invalidate("u", {"phase": "coach_session"})
+        assert cache.peek("u", "summary", 1, "intake_summary") == ["profile"]
+        assert cache.peek("u", "rent", 3, None) is None
+        assert cache.peek("v", "rent", 3, None) == ["recent"]
+        cache.invalidate("u", {"topic": "intake_summary"})
+        assert cache.peek("u", "summary", 1, "intake_summary") is None
+    asyncio.run(main())
+
+
+def test_memory_cache_write_during_fetch_is_not_cached():
+    async def main():
+        cache, fetch = MemoryCache(), Fetch(["before the write"])
+        task = asyncio.create_task(cache.get("u", "q", 3, None, fetch))
+        await asyncio.sleep(0.01)
+        cache.invalidate("u", {})
+        assert await task == ["before the write"]
+        assert cache.peek("u", "q", 3, None) is None
+    asyncio.run(main())
+
+
+def test_memory_cache_fresh_and_ttl():
+    async def main():
+        cache, fetch = MemoryCache(ttl=0.05), Fetch(["p"], delay=0)
+        await cache.get("u", "summary", 1, "intake_summary", fetch)
+        await cache.get("u", "summary", 1, "intake_summary", fetch, fresh=True)
+        assert fetch.calls == 2
+        await asyncio.sleep(0.06)
+        assert cache.peek("u", "summary", 1, "intake_summary") is None
+        await cache.get("u", "summary", 1, "intake_summary", fetch)
+        assert fetch.calls == 3 and cache.counters["expired"] == 1
+    asyncio.run(main())
+
+
+# ─────────────── router / referee cache ───────────────────────────────
+def test_response_cache_coalesces_and_rejects_invalid():
+    async def main():
+        cache = ResponseCache(db="")
+        good, bad = Fetch('{"choice":"none"}'), Fetch("   ")
+        got = await asyncio.gather(*(cache.get("k", "router:a", good) for _ in range(4)))
+        assert set(got) == {'{"choice":"none"}'} and good.calls == 1
+        assert await cache.get("k2", "referee", bad) == "   "
+        assert await cache.get("k2", "referee", bad) == "   "
+        assert bad.calls == 2 and cache.counters["rejected"] == 2
+    asyncio.run(main())
+
+
+def test_response_cache_invalidate_keeps_current_scope(tmp_path):
+    db = str(tmp_path / "llm.db")
+
+    async def main():
+        cache = ResponseCache(db=db)
+        for key, scope in (("old", "router:v1"), ("new", "router:v2"), ("ref", "referee")):
+            await cache.get(key, scope, Fetch(key, delay=0))
+        cache.invalidate("router", keep="router:v2")
+        await asyncio.gather(*cache._drops)     # disk rows go in a worker thread
+        assert cache._disk.get("old") is None
+        assert cache._disk.get("new") == "new" and cache._disk.get("ref") == "ref"
+        assert cache.counters["invalidated"] == 2
+
+        other = ResponseCache(db=db)            # another worker, same file
+        again = Fetch("refetched", delay=0)
+        assert await other.get("new", "router:v2", again) == "new"
+        assert await other.get("old", "router:v1", again) == "refetched"
+        assert other.counters["disk_hits"] == 1 and again.calls == 1
+    asyncio.run(main())
+
+
+def test_response_cache_disabled_always_calls():
+    async def main():
+        cache, fetch = ResponseCache(db="", enabled=False), Fetch("x", delay=0)
+        await cache.get("k", "referee", fetch)
+        await cache.get("k", "referee", fetch)
+        assert fetch.calls == 2
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+import os, csv, asyncio
+
+import pytest
+
+from catalog import InterventionCatalog
+
+HEADER = ["name", "description", "prompt", "completion_indicator"]
+
+def _write(path, rows, replace=False):
+    """Write the CSV in place, or (replace=True) via rename like an editor."""
+    target = path + ".tmp" if replace else path
+    with open(target, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(HEADER)
+        for name, prompt in rows:
+            w.writerow([name, f"For users who feel {name.lower()}.", prompt, "done"])
+    if replace:
+        os.replace(target, path)
+
+def _rows(*names):
+    return [(n, f"{n} prompt, with a comma\nand a second line " + "x" * 200) for n in names]
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / "interventions.csv")
+    _write(path, _rows("Budget Shame", "Rent Panic"))
+    return path
+
+
+def test_rows_and_lazy_prompt(csv_path):
+    cat = InterventionCatalog(csv_path, check_every=3600)
+    assert [r["name"] for r in cat.rows()] == ["Budget Shame", "Rent Panic"]
+    row = cat.get("Rent Panic")
+    assert row["completion_indicator"] == "done"
+    assert row["prompt"].startswith("Rent Panic prompt, with a comma\nand a second line")
+    assert set(row) == set(HEADER) and cat.get("nope") is None
+
+
+def test_replaced_file_keeps_old_bodies_until_reload(csv_path):
+    cat = InterventionCatalog(csv_path, check_every=3600)
+    old = cat.get("Rent Panic")
+    _write(csv_path, [("Rent Panic", "new body"), ("Debt Fog", "fog body")], replace=True)
+    assert old["prompt"].startswith("Rent Panic prompt")    # still the old file
+    assert cat.refresh(force=True) and cat.version == 2
+    assert cat.get("Rent Panic")["prompt"] == "new body"
+    assert cat.get("Debt Fog")["prompt"] == "fog body"
+    assert cat.get("Budget Shame") is None
+    assert old["prompt"].startswith("Rent Panic prompt")
+
+
+def test_in_place_rewrite_reloads_or_raises(csv_path):
+    cat = InterventionCatalog(csv_path, check_every=3600)
+    moved, gone = cat.get("Rent Panic"), cat.get("Budget Shame")
+    _write(csv_path, [("Intro", "intro body"), ("Rent Panic", "rewritten")])
+    assert moved["prompt"] == "rewritten"                   # re-read from the new file
+    assert cat.version == 2
+    with pytest.raises(LookupError):
+        gone["prompt"]                                      # never an empty body
+
+
+def test_rejected_reload_keeps_the_old_snapshot(csv_path):
+    cat = InterventionCatalog(csv_path, check_every=3600)
+    installed = []
+
+    def prepare(rows, digest):
+        if any(r["name"] == "Broken" for r in rows):
+            raise ValueError("bad row")
+        return lambda: installed.append([r["name"] for r in rows])
+
+    cat.on_reload(prepare)
+    digest = cat.digest
+    _write(csv_path, _rows("Broken"), replace=True)
+    assert not cat.refresh(force=True)
+    assert cat.version == 1 and cat.digest == digest and not installed
+    assert cat.get("Budget Shame")["prompt"].startswith("Budget Shame prompt")
+
+    _write(csv_path, _rows("Debt Fog"), replace=True)
+    assert asyncio.run(cat.arefresh(force=True))
+    assert cat.version == 2 and cat.digest != digest
+    assert installed == [["Debt Fog"]]
+
+
+def test_missing_file_keeps_serving(csv_path):
+    cat = InterventionCatalog(csv_path, check_every=3600)
+    os.remove(csv_path)
+    assert not cat.refresh(force=True)
+    assert cat.get("Budget Shame")["prompt"].startswith("Budget Shame prompt")
@@ -0,0 +1,80 @@
+import os, json
+
+from memory_store import LocalStore, _safe
+
+DIM = 64
+
+def _turn(text):
+    return [{"role": "user", "content": text}, {"role": "assistant", "content": "ok"}]
+
+def _store(root):
+    return LocalStore(str(root), dim=DIM)
+
+def _files(root, user="u1"):
+    d = os.path.join(str(root), _safe(user))
+    return os.path.join(d, "vectors.f32"), os.path.join(d, "meta.jsonl")
+
+
+def test_add_and_search_with_topic(tmp_path):
+    s = _store(tmp_path)
+    s.add(_turn("rent stress at the end of the month"), user_id="u1")
+    s.add(_turn('{"goal": "stop stress spending"}'), user_id="u1",
+          metadata={"topic": "intake_summary"})
+    assert len(s.search("rent stress", user_id="u1", top_k=5)) == 2
+    assert s.search("rent stress", user_id="u1", topic="intake_summary") == \
+        ['{"goal": "stop stress spending"}']
+    assert s.search("rent stress", user_id="someone else") == []
+
+
+def test_torn_vector_append_is_cut_off(tmp_path):
+    _store(tmp_path).add(_turn("first memory"), user_id="u1")
+    vec, meta = _files(tmp_path)
+    with open(vec, "ab") as f:          # died half way through the next vector
+        f.write(b"\0" * (DIM * 4 // 2))
+
+    s = _store(tmp_path)
+    assert s.search("first", user_id="u1") == ["first memory"]
+    assert os.path.getsize(vec) == DIM * 4
+
+
+def test_vectors_without_metadata_are_dropped(tmp_path):
+    _store(tmp_path).add(_turn("first memory"), user_id="u1")
+    vec, meta = _files(tmp_path)
+    with open(vec, "ab") as f:          # vector row written, metadata never was
+        f.write(b"\0" * DIM * 4)
+    size = os.path.getsize(meta)
+
+    s = _store(tmp_path)
+    assert s.search("first", user_id="u1", top_k=5) == ["first memory"]
+    assert os.path.getsize(vec) == DIM * 4
+    assert os.path.getsize(meta) == size
+
+
+def test_torn_metadata_line_is_cut_off(tmp_path):
+    s = _store(tmp_path)
+    s.add(_turn("first memory"), user_id="u1")
+    s.add(_turn("second memory"), user_id="u1")
+    vec, meta = _files(tmp_path)
+    with open(meta, "rb") as f:
+        lines = f.readlines()
+    with open(meta, "wb") as f:         # second line lost its tail
+        f.write(lines[0] + lines[1][:10])
+
+    s = _store(tmp_path)
+    assert s.search("memory", user_id="u1", top_k=5) == ["first memory"]
+    assert os.path.getsize(vec) == DIM * 4
+    assert os.path.getsize(meta) == len(lines[0])
+    s.add(_turn("third memory"), user_id="u1")      # appends after the cut
+    with open(meta) as f:
+        assert [json.loads(l)["memory"] for l in f] == ["first memory", "third memory"]
+
+
+def test_append_picks_up_another_writer(tmp_path):
+    a, b = _store(tmp_path), _store(tmp_path)       # two worker processes
+    a.add(_turn("from a"), user_id="u1")
+    b.add(_turn("from b"), user_id="u1")
+    a.add(_turn("from a again"), user_id="u1")
+    assert sorted(a.search("from", user_id="u1", top_k=5)) == \
+        ["from a", "from a again", "from b"]
+    assert sorted(_store(tmp_path).search("from", user_id="u1", top_k=5)) == \
+        ["from a", "from a again", "from b"]
@@ -0,0 +1,29 @@
+from replay import scripts, compare, CLOSE_TURN, OPENERS
+
+ROWS = [{"name": "Rent Panic", "description": "Keywords: rent, landlord."},
+        {"name": "Debt Fog",   "description": "For users who say “I can't look at it.”"}]
+
+def _report(**kw):
+    r = {"workload": "coach", "turns_per_s": 10.0, "llm_calls_per_turn": 2.0,
+         "prompt_tokens_per_turn": 900.0, "stages": {"turn": {"p95": 1000.0}}}
+    r.update(kw)
+    return r
+
+
+def test_scripts_open_with_a_trigger_and_close():
+    coach, small = scripts(ROWS, 2), scripts(ROWS, 2, "smalltalk")
+    assert [len(s) for s in coach] == [4, 4]
+    assert "rent" in coach[0][0] and coach[0][-1] == CLOSE_TURN
+    assert small[0][0] in OPENERS and small[0][1:] == coach[0]
+
+
+def test_compare_flags_regressions_only_beyond_tolerance():
+    base = _report()
+    assert compare(_report(llm_calls_per_turn=2.2), base, 0.15) == []
+    worse = compare(_report(llm_calls_per_turn=3.0, turns_per_s=5.0), base, 0.15)
+    assert [w.split(":")[0] for w in worse] == ["llm_calls_per_turn", "turns_per_s"]
+
+
+def test_compare_refuses_a_different_workload():
+    worse = compare(_report(workload="smalltalk"), _report(), 0.15)
+    assert len(worse) == 1 and "not comparable" in worse[0]
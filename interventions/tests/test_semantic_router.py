@@ -0,0 +1,31 @@
+import os, asyncio
+
+import pytest
+
+from catalog import InterventionCatalog
+from lexicon import listens_for
+from semantic_router import SemanticRouter, HashEmbedder
+
+CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                   "interventions-test.csv")
+
+@pytest.fixture(scope="module")
+def rows():
+    return InterventionCatalog(CSV).rows()
+
+
+def test_trigger_phrases_rank_their_row_first(rows):
+    router = SemanticRouter(rows, HashEmbedder())
+
+    async def main():
+        for row in rows:
+            phrase = (listens_for(row["description"]) or [row["name"]])[0]
+            route = await router.route(f"Honestly, {phrase} keeps coming up for me lately.")
+            assert route.candidates[0] is row, row["name"]
+            assert route.row is row or route.ambiguous      # never dismissed as "none"
+    asyncio.run(main())
+
+
+def test_small_talk_routes_nowhere(rows):
+    route = asyncio.run(SemanticRouter(rows, HashEmbedder()).route("hi there"))
+    assert route.row is None and not route.ambiguous
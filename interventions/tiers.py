@@ -0,0 +1,165 @@
+# tiers.py ──────────────────────────────────────────────────────────────
+# Which Azure deployment serves which call.  Every call already names its
+# priority ("reply", "router", "referee"); that picks a tier:
+#
+#   • main – coaching replies: AZURE_DEPLOYMENT_NAME
+#   • fast – router and referee (a few dozen tokens each):
+#            AZURE_FAST_DEPLOYMENT, or the main deployment when unset
+#
+# LLM_TIER_<PRIORITY> moves a call type to another tier (LLM_TIER_REFEREE=main).
+# Each tier may name a secondary deployment (AZURE_DEPLOYMENT_SECONDARY,
+# AZURE_FAST_SECONDARY; the fast tier defaults to the main deployment):
+#
+#   • fallback – the primary failed after its retries → one go on the secondary
+#   • hedging  – tiers in LLM_HEDGE (default "fast") fire a duplicate request
+#                at the secondary once the primary is slower than its own
+#                recent p95, and take whichever answers first.  Until
+#                LLM_HEDGE_MIN_SAMPLES calls are seen, LLM_HEDGE_AFTER is used.
+#                A primary cancelled because the hedge won still counts, with
+#                its elapsed time as a lower bound, so slow calls keep the
+#                p95 up.  At most LLM_HEDGE_BUDGET of recent calls hedge.
+#                Only chat() hedges; streamed replies fall back but never race.
+#
+# Latency and cost are tracked per tier and deployment; the prompt tokens of
+# a request that was sent and then cancelled are charged too.  LLM_PRICES gives
+# $ per 1M prompt / completion tokens, e.g. "gpt-4o:2.5/10,gpt-4o-mini:0.15/0.6".
+import os, statistics
+from collections import deque
+from typing import Dict, Deque, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import telemetry
+
+load_dotenv()
+
+DEPLOYMENT      = os.getenv("AZURE_DEPLOYMENT_NAME")
+FAST_DEPLOYMENT = os.getenv("AZURE_FAST_DEPLOYMENT") or DEPLOYMENT
+
+LLM_HEDGE             = {t.strip() for t in os.getenv("LLM_HEDGE", "fast").split(",") if t.strip()}
+LLM_HEDGE_AFTER       = float(os.getenv("LLM_HEDGE_AFTER", "1.5"))    # s, before p95 is known
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_WINDOW      = int(os.getenv("LLM_HEDGE_WINDOW", "200"))     # latencies kept
+LLM_HEDGE_BUDGET      = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))   # share of calls
+
+DEFAULT_TIER = {"reply": "main", "router": "fast", "referee": "fast"}
+
+TIER_SECONDS = telemetry.REGISTRY.histogram(
+    "coach_llm_tier_seconds", "LLM request time per tier and deployment",
+    ("tier", "deployment"))
+TIER_COST    = telemetry.REGISTRY.counter(
+    "coach_llm_cost_usd_total", "Estimated LLM spend", ("tier", "deployment"))
+TIER_CALLS   = telemetry.REGISTRY.counter(
+    "coach_llm_tier_calls_total", "LLM requests per tier and deployment",
+    ("tier", "deployment", "outcome"))
+HEDGES       = telemetry.REGISTRY.counter(
+    "coach_llm_hedges_total", "Hedged requests, by which copy answered", ("tier", "winner"))
+FALLBACKS    = telemetry.REGISTRY.counter(
+    "coach_llm_fallbacks_total", "Calls retried on the secondary after an error", ("tier",))
+
+
+def _prices(spec: str) -> Dict[str, Tuple[float, float]]:
+    out = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, cost = item.partition(":")
+        p_in, _, p_out = cost.partition("/")
+        out[name.strip()] = (float(p_in or 0), float(p_out or p_in or 0))
+    return out
+
+PRICES = _prices(os.getenv("LLM_PRICES", ""))
+
+
+class Tier:
+    def __init__(self, name: str, primary: Optional[str],
+                 secondary: Optional[str] = None, hedge: bool = False):
+        self.name, self.primary = name, primary
+        self.secondary = secondary if secondary and secondary != primary else None
+        self.hedge = hedge and self.secondary is not None
+        self._lat: Dict[str, Deque[float]] = {}        # deployment → recent seconds
+        self._raced: Deque[bool] = deque(maxlen=LLM_HEDGE_WINDOW)  # recent calls: hedged?
+        self.counters = {"calls": 0, "errors": 0, "cancelled": 0, "hedged": 0,
+                         "hedge_wins": 0, "hedges_skipped": 0, "fallbacks": 0,
+                         "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+
+    def hedge_after(self) -> Optional[float]:
+        """Seconds to give the primary before racing the secondary (None = never)."""
+        if not self.hedge:
+            return None
+        lat = self._lat.get(self.primary or "")
+        if not lat or len(lat) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_AFTER
+        return _p95(lat)
+
+    def may_hedge(self) -> bool:
+        """True while hedging stays within LLM_HEDGE_BUDGET of recent calls."""
+        if sum(self._raced) < LLM_HEDGE_BUDGET * (len(self._raced) + 1):
+            return True
+        self.counters["hedges_skipped"] += 1
+        return False
+
+    def raced(self, hedged: bool) -> None:
+        """One call that could hedge is over; `hedged` says whether it did."""
+        self._raced.append(hedged)
+
+    def record(self, deployment: Optional[str], seconds: float, outcome: str = "ok",
+               prompt_tokens: int = 0, completion_tokens: int = 0) -> None:
+        """outcome: ok | error | lost (cancelled after the other copy answered;
+        `seconds` is a lower bound on its latency) | cancelled (by the caller).
+        Pass the tokens of any request that reached the deployment."""
+        dep = deployment or ""
+        TIER_CALLS.inc(tier=self.name, deployment=dep, outcome=outcome)
+        if outcome == "error":
+            self.counters["errors"] += 1
+        elif outcome in ("lost", "cancelled"):
+            self.counters["cancelled"] += 1
+        if outcome in ("ok", "lost"):
+            self._lat.setdefault(dep, deque(maxlen=LLM_HEDGE_WINDOW)).append(seconds)
+        if outcome == "ok":
+            self.counters["calls"] += 1
+            TIER_SECONDS.observe(seconds, tier=self.name, deployment=dep)
+        p_in, p_out = PRICES.get(dep, (0.0, 0.0))
+        cost = (prompt_tokens * p_in + completion_tokens * p_out) / 1e6
+        self.counters["prompt_tokens"] += prompt_tokens
+        self.counters["completion_tokens"] += completion_tokens
+        self.counters["cost_usd"] += cost
+        if cost:
+            TIER_COST.inc(cost, tier=self.name, deployment=dep)
+
+    def hedged(self, winner: str) -> None:
+        self.counters["hedged"] += 1
+        self.counters["hedge_wins"] += winner == "secondary"
+        HEDGES.inc(tier=self.name, winner=winner)
+
+    def fell_back(self) -> None:
+        self.counters["fallbacks"] += 1
+        FALLBACKS.inc(tier=self.name)
+
+    def stats(self) -> Dict:
+        lat = {dep: {"n": len(s), "p50_ms": round(statistics.median(s) * 1000, 1),
+                     "p95_ms": round(_p95(s) * 1000, 1)}
+               for dep, s in self._lat.items() if s}
+        return {"primary": self.primary, "secondary": self.secondary,
+                **self.counters, "cost_usd": round(self.counters["cost_usd"], 6),
+                "hedge_rate": round(sum(self._raced) / len(self._raced), 3) if self._raced else 0.0,
+                "latency": lat}
+
+def _p95(samples) -> float:
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(0.95 * len(s)))]
+
+
+TIERS: Dict[str, Tier] = {
+    "main": Tier("main", DEPLOYMENT, os.getenv("AZURE_DEPLOYMENT_SECONDARY"),
+                 hedge="main" in LLM_HEDGE),
+    "fast": Tier("fast", FAST_DEPLOYMENT,
+                 os.getenv("AZURE_FAST_SECONDARY", DEPLOYMENT or ""),
+                 hedge="fast" in LLM_HEDGE),
+}
+
+TIER_OF = {p: os.getenv(f"LLM_TIER_{p.upper()}", t) for p, t in DEFAULT_TIER.items()}
+
+def tier_for(priority: str) -> Tier:
+    return TIERS.get(TIER_OF.get(priority, "main"), TIERS["main"])
+
+def stats() -> Dict[str, Dict]:
+    return {name: t.stats() for name, t in TIERS.items()}
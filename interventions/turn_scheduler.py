@@ -0,0 +1,125 @@
+# turn_scheduler.py ─────────────────────────────────────────────────────
+# Runs the independent stages of one turn at the same time instead of as a
+# serial chain:
+#
+#   router ───────────────┐   picked an intervention → cancel draft,
+#   memory ──┐            ├─▶ reply again with COACH_NOTES (`with_iv`)
+#            └─ draft ────┘   picked nothing          → use the draft
+#
+# The draft is the speculative "no intervention" reply.  When the caller
+# has a `guess` for the memories that is likely to hold (a cached result,
+# the session's profile), the draft starts at once with the guess and is only
+# redone if the fresh search disagrees; without one it waits for memory.
+# If any stage fails, the others are cancelled before the error propagates.
+# `on_hit` fires as soon as the draft is known to be the final reply, so a
+# streaming caller can start showing it while it is still being generated.
+# Every turn logs per-stage timings and the wall-clock saved versus the
+# serial chain (router + memory + reply).
+import os, time, asyncio, logging
+from typing import List, Dict, Optional, Callable, Awaitable, NamedTuple, Any
+
+SPECULATE = os.getenv("SPECULATE", "1") != "0"
+
+class TurnResult(NamedTuple):
+    reply:       str
+    iv:          Optional[Dict]         # intervention picked this turn
+    memories:    List[str]
+    speculation: str                    # "hit" | "miss" | "off"
+    timings:     Dict[str, float]       # ms per stage + wall / serial / saved
+
+
+class _Clock:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.ms: Dict[str, float] = {}
+
+    async def timed(self, stage: str, aw: Awaitable[Any]) -> Any:
+        t = time.perf_counter()
+        try:
+            return await aw
+        finally:
+            self.ms[stage] = (time.perf_counter() - t) * 1000
+
+    def task(self, stage: str, fn: Optional[Callable[[], Awaitable[Any]]]):
+        return asyncio.create_task(self.timed(stage, fn())) if fn else None
+
+    def wall(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000
+
+async def _cancel(task: Optional[asyncio.Task]) -> None:
+    if task and not task.done():
+        task.cancel()
+    if task:
+        try:
+            await task
+        except BaseException:           # cancelled, or a draft we no longer need
+            pass
+
+async def run_turn(
+    draft:    Callable[[List[str]], Awaitable[str]],
+    *,
+    route:    Optional[Callable[[], Awaitable[Optional[Dict]]]] = None,
+    memories: Optional[Callable[[], Awaitable[List[str]]]] = None,
+    guess:    Optional[List[str]] = None,
+    with_iv:  Optional[Callable[[Dict, List[str]], Awaitable[str]]] = None,
+    on_hit:   Optional[Callable[[], Awaitable[None]]] = None,
+    speculate: Optional[bool] = None,
+) -> TurnResult:
+    speculate = SPECULATE if speculate is None else speculate
+    clock = _Clock()
+
+    async def _hit() -> None:
+        if on_hit:
+            await on_hit()
+
+    if not speculate:                   # the old serial chain, for comparison
+        iv   = await clock.timed("router", route()) if route else None
+        mems = await clock.timed("memory", memories()) if memories else []
+        if iv is None:
+            await _hit()
+        reply = await clock.timed("reply", with_iv(iv, mems) if iv else draft(mems))
+        return _done(clock, reply, iv, mems, "off")
+
+    mem_task   = clock.task("memory", memories)
+    route_task = clock.task("router", route)
+    spec: Optional[asyncio.Task] = None
+
+    async def _mems() -> List[str]:
+        return await mem_task if mem_task else []
+
+    async def _draft():
+        mems = guess if (guess is not None and mem_task) else await _mems()
+        return mems, await clock.timed("draft", draft(mems))
+
+    try:
+        spec = asyncio.create_task(_draft())
+        mems = await _mems()
+        if guess is not None and mem_task and list(guess) != list(mems):
+            await _cancel(spec)         # guessed memories were stale
+            spec = None
+        iv = await route_task if route_task else None
+
+        if iv is not None:
+            await _cancel(spec)
+            reply = await clock.timed("reply", with_iv(iv, mems))
+            return _done(clock, reply, iv, mems, "miss")
+        await _hit()
+        if spec is None:
+            reply = await clock.timed("reply", draft(mems))
+            return _done(clock, reply, None, mems, "miss")
+        _, reply = await spec
+        clock.ms["reply"] = clock.ms["draft"]
+        return _done(clock, reply, None, mems, "hit")
+    finally:                            # a failed stage must not leave the others running
+        for task in (spec, mem_task, route_task):
+            await _cancel(task)
+
+def _done(clock: _Clock, reply: str, iv: Optional[Dict],
+          mems: List[str], speculation: str) -> TurnResult:
+    ms = dict(clock.ms)
+    ms["wall"]   = clock.wall()
+    ms["serial"] = ms.get("router", 0) + ms.get("memory", 0) + ms.get("reply", 0)
+    ms["saved"]  = ms["serial"] - ms["wall"]
+    logging.info("[TURN] " + " ".join(f"{k}={v:.0f}ms" for k, v in ms.items())
+                 + f" speculation={speculation}")
+    return TurnResult(reply, iv, mems, speculation, ms)